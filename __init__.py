@@ -1,6 +1,7 @@
 from .packages.__init__ import (
     Points,
     Squares,
+    Rig,
     Point,
     Square,
     SubSpace,
@@ -9,5 +10,12 @@ from .packages.__init__ import (
     Plane,
 )
 from .packages import multiprocessing_utils
-from .packages import rendering
 from .packages import utils
+
+
+def __getattr__(name: str):
+    if name == "rendering":
+        from .packages import rendering
+
+        return rendering
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,171 @@
+"""
+Checks tracing.trace in beam mode against dense supersampled tracing of every pixel footprint.
+
+Each pixel is covered by a --supersample x --supersample grid of rays through the centres of its sub-pixels, each
+sampled every --step along its chord through the subject bound, and every cell one of its samples lands in is taken
+as seen by that pixel. Rays on the footprint's edges are left out, since the cells they graze are ties decided by
+rounding. Beam mode must find every one of those (cell, camera, pixel) pairs: a missed pair fails.
+
+Beam mode is conservative, testing cell boxes against the side planes of each footprint only, so it also finds pairs
+the supersampling doesn't. They are reported with both timings, and more than --max-extra of them per supersampled
+pair fails, so a beam mode that keeps every candidate can't pass.
+
+Run from the repository root:
+    python benchmarks/beam.py [--divisions 12] [--width 16] [--height 12] [--supersample 8] [--max-extra 0.5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from packages.collections import Points, Rig
+from packages.objects import SubSpace, SUBJECT_MARGIN
+from packages.tracing import clip_rays, ray_samples, trace
+
+DEF_MAX_EXTRA = 0.5
+SUBJECT_RADIUS = 1
+RAY_LENGTH = 3.5
+
+
+def pair_ids(rows: np.ndarray, cells: int, pixels: int) -> np.ndarray:
+    """
+    Encodes (cell, camera, pixel) rows as distinct integers.
+    """
+
+    rows = np.asarray(rows, dtype=np.int64)
+    return np.unique((rows[:, 1] * cells + rows[:, 0]) * pixels + rows[:, 2])
+
+
+def supersampled(
+    rig: Rig,
+    subspace: SubSpace,
+    pixel_width: int,
+    pixel_height: int,
+    supersample: int,
+    step: float,
+) -> np.ndarray:
+    """
+    Returns the (cell, camera, pixel) rows seen by a supersample x supersample grid of sub-pixel rays over every pixel.
+    """
+
+    offsets = (np.arange(supersample) + 0.5) / supersample - 0.5
+    offsets = np.stack(np.meshgrid(offsets, offsets, indexing="ij"), -1).reshape(-1, 2)
+    pixels = np.stack(
+        np.meshgrid(np.arange(pixel_width), np.arange(pixel_height), indexing="ij"), -1
+    ).reshape(-1, 2)
+    positions = (pixels[:, None, :] + offsets).reshape(-1, 2)
+    owners = np.repeat(pixels[:, 0] * pixel_height + pixels[:, 1], len(offsets))
+    bound = SUBJECT_RADIUS * SUBJECT_MARGIN
+    low, high = subspace.bounds
+
+    rows = []
+    for camera in range(len(rig)):
+        origin = rig.sources[camera]
+        directions = rig.pixel_directions(
+            pixel_width, pixel_height, positions, [camera], np.float64
+        )[0]
+        enter, exit_ = clip_rays(origin, directions, low, high, bound, RAY_LENGTH)
+        hit = enter <= exit_
+        samples, ray = ray_samples(
+            origin, directions[hit], enter[hit], exit_[hit], RAY_LENGTH, None, step
+        )
+        cells = subspace.locate(samples)
+        distances = np.linalg.norm(samples - origin, axis=-1)
+        keep = (
+            (cells >= 0)
+            & (np.linalg.norm(samples, axis=-1) < bound)
+            & (distances <= RAY_LENGTH)
+        )
+        found = np.unique(
+            cells[keep] * (pixel_width * pixel_height) + owners[hit][ray][keep]
+        )
+        rows.append(
+            np.column_stack(
+                (
+                    found // (pixel_width * pixel_height),
+                    np.full(len(found), camera),
+                    found % (pixel_width * pixel_height),
+                )
+            )
+        )
+    return np.concatenate(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--divisions", type=int, default=12)
+    parser.add_argument("--width", type=int, default=16)
+    parser.add_argument("--height", type=int, default=12)
+    parser.add_argument("--supersample", type=int, default=8)
+    parser.add_argument("--step", type=float, default=0.002)
+    parser.add_argument("--max-extra", type=float, default=DEF_MAX_EXTRA)
+    args = parser.parse_args()
+
+    rig = Rig.from_cameras(
+        Points.get_points_at_inclinations(3, 8, [30, 60]), 50, 36, 24, 1000
+    )
+    cells, pixels = args.divisions**3, args.width * args.height
+
+    start = time.perf_counter()
+    beam = trace(
+        rig,
+        SubSpace(args.divisions),
+        args.width,
+        args.height,
+        RAY_LENGTH,
+        SUBJECT_RADIUS,
+        beam=True,
+    ).assignments
+    beam_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = supersampled(
+        rig,
+        SubSpace(args.divisions),
+        args.width,
+        args.height,
+        args.supersample,
+        args.step,
+    )
+    reference_seconds = time.perf_counter() - start
+
+    found, expected = pair_ids(beam, cells, pixels), pair_ids(reference, cells, pixels)
+    missed = np.setdiff1d(expected, found)
+    results = {
+        "beam_seconds": beam_seconds,
+        "supersampled_seconds": reference_seconds,
+        "beam_pairs": len(found),
+        "supersampled_pairs": len(expected),
+        "missed_pairs": len(missed),
+        "extra_pairs": len(np.setdiff1d(found, expected)),
+    }
+    failures = []
+    if results["extra_pairs"] > args.max_extra * len(expected):
+        failures.append(
+            f"{results['extra_pairs']} extra pairs for {len(expected)} supersampled ones"
+        )
+    if len(found) != len(beam):
+        failures.append(f"{len(beam) - len(found)} duplicate beam rows")
+    if len(missed):
+        cell, camera, pixel = (
+            missed[0] // pixels % cells,
+            missed[0] // pixels // cells,
+            missed[0] % pixels,
+        )
+        failures.append(
+            f"{len(missed)} supersampled pairs missed, e.g. cell {cell} camera {camera} "
+            f"pixel {pixel}"
+        )
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Per-element cost of the coordinate utilities, scalar calls in a Python loop against one array-native call.
+
+Every case converts the same N random points both ways, checks that the results agree and reports the cost per
+element and the speedup. The array versions failing to agree with the scalar ones, or being less than --min-speedup
+times faster, fails.
+
+Run from the repository root:
+    python benchmarks/coordinates.py [--size 100000] [--min-speedup 10]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from packages.utils import (
+    distance,
+    norms,
+    pol_to_cart,
+    pol_to_cart_arr,
+    cart_to_pol,
+    cart_to_pol_arr,
+)
+
+DEF_SIZE = 100_000
+DEF_MIN_SPEEDUP = 10
+DEF_REPEAT = 3
+
+
+def best_of(run, repeat: int = DEF_REPEAT):
+    seconds, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds), result
+
+
+def cases(size: int, seed: int = 0) -> dict:
+    """
+    Returns:
+    dict: (scalar run, array run) pairs by utility name, both returning (N, ...) arrays.
+    """
+
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-1, 1, (size, 3))
+    polar = np.column_stack(
+        (
+            rng.uniform(0, 3, size),
+            rng.uniform(0, 180, size),
+            rng.uniform(-180, 180, size),
+        )
+    )
+    out = np.empty((size, 3))
+    return {
+        "distance / norms": (
+            lambda: np.array([distance(*point) for point in points]),
+            lambda: norms(points, out=out[:, 0]),
+        ),
+        "pol_to_cart / pol_to_cart_arr": (
+            lambda: np.array([pol_to_cart(*row) for row in polar]),
+            lambda: pol_to_cart_arr(*polar.T, out=out),
+        ),
+        "cart_to_pol / cart_to_pol_arr": (
+            lambda: np.array([cart_to_pol(*point) for point in points]),
+            lambda: cart_to_pol_arr(points, out=out),
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=DEF_SIZE)
+    parser.add_argument("--min-speedup", type=float, default=DEF_MIN_SPEEDUP)
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    for name, (scalar, array) in cases(args.size).items():
+        scalar_seconds, expected = best_of(scalar, 1)
+        array_seconds, result = best_of(array)
+        results[name] = {
+            "scalar_ns_per_element": scalar_seconds / args.size * 1e9,
+            "array_ns_per_element": array_seconds / args.size * 1e9,
+            "speedup": scalar_seconds / array_seconds,
+        }
+        if not np.allclose(expected, result, equal_nan=True):
+            failures.append(f"{name} results differ")
+        elif results[name]["speedup"] < args.min_speedup:
+            failures.append(f"{name} is only {results[name]['speedup']:.1f}x faster")
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
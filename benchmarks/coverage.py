@@ -0,0 +1,96 @@
+"""
+Times statistics.coverage on synthetic assignments of growing size and checks it against a per cell loop.
+
+Every case draws random [cell, camera, pixel] rows over a SubSpace grid and a random rig, so the timing covers the
+worst case of many distinct (cell, camera) pairs. The smallest case is also computed cell by cell with NumPy and any
+difference fails, as does a case slower than --budget seconds per ten million contributions.
+
+Run from the repository root:
+    python benchmarks/coverage.py [--quick] [--budget 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from packages.objects import SubSpace
+from packages.statistics import coverage
+from packages.utils import norms
+
+DEF_BUDGET = 5  # seconds per ten million contributions
+CAMERAS = 500
+CASES = [(100_000, 16), (3_000_000, 32), (30_000_000, 64)]
+QUICK_CASES = CASES[:2]
+
+
+def synthetic(size: int, divisions: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    subspace = SubSpace(divisions)
+    assignments = np.column_stack(
+        (
+            rng.integers(0, len(subspace.centres), size),
+            rng.integers(0, CAMERAS, size),
+            rng.integers(0, 2**20, size),
+        )
+    ).astype(np.int32)
+    return assignments, subspace.centres, rng.normal(size=(CAMERAS, 3)) * 3
+
+
+def check(assignments, centres, sources, result) -> list:
+    """
+    Recomputes every figure cell by cell and lists the cells that differ.
+    """
+
+    differing = []
+    for cell in range(len(centres)):
+        rows = assignments[assignments[:, 0] == cell]
+        cameras = np.unique(rows[:, 1])
+        distances = norms(sources[cameras] - centres[cell])
+        expected = [len(rows), len(cameras)]
+        found = [result.rays[cell], result.cameras[cell]]
+        if len(cameras):
+            mean = ((sources[cameras] - centres[cell]) / distances[:, None]).mean(0)
+            expected += [
+                np.degrees(np.arccos(min(norms(mean), 1))),
+                distances.min(),
+                distances.max(),
+            ]
+            found += [result.spread[cell], result.nearest[cell], result.farthest[cell]]
+        if not np.allclose(expected, found):
+            differing.append(cell)
+    return differing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="skip the largest case")
+    parser.add_argument("--budget", type=float, default=DEF_BUDGET)
+    args = parser.parse_args()
+
+    results, failures = [], []
+    for index, (size, divisions) in enumerate(QUICK_CASES if args.quick else CASES):
+        data = synthetic(size, divisions)
+        start = time.perf_counter()
+        result = coverage(*data)
+        seconds = time.perf_counter() - start
+        results.append(
+            {"contributions": size, "cells": len(data[1]), "seconds": seconds}
+        )
+        if index == 0 and check(*data, result):
+            failures.append(f"{size} contributions: figures differ from the loop")
+        if seconds / size * 1e7 > args.budget:
+            failures.append(f"{size} contributions took {seconds:.2f} s")
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
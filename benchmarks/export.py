@@ -0,0 +1,219 @@
+"""
+Writes one scene with export.write_ply and export.write_glb, reads both files back and checks them against the scene.
+
+The scene holds the cameras, their pictures, the rays of every pixel streamed from export.rig_rays, a sample cloud
+as an array and the cells of a traced SubSpace. Both files are parsed with nothing but struct and numpy: a header or
+chunk layout that doesn't add up, a count, or a coordinate off by more than float32 rounding fails. A larger cloud is
+then streamed from a MemmapArray in --chunk-size chunks, and a peak traced memory above a few chunks fails.
+
+Run from the repository root:
+    python benchmarks/export.py [--width 32] [--height 24] [--large 2000000] [--chunk-size 100000]
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from packages.collections import Points, Squares, Rig
+from packages.export import GLB_BIN, GLB_JSON, GLB_MAGIC, rig_rays, write_glb, write_ply
+from packages.objects import SubSpace
+from packages.storage import MemmapArray
+from packages.tracing import trace
+
+RAY_LENGTH = 3.5
+SAMPLES = 5000
+# the peak traced memory allowed: a few chunks of float64 points and a fixed allowance for headers and buffers
+MEMORY_CHUNKS = 4
+MEMORY_OVERHEAD = 2**20
+GLB_MESH_MODES = {0: "points", 1: "lines", 4: "triangles"}
+
+
+def read_ply(path: str) -> np.ndarray:
+    """
+    Parses a binary little endian PLY point cloud of float x, y, z and uchar colours.
+
+    Returns:
+    np.ndarray: The (N, 3) float32 vertices.
+    """
+
+    with open(path, "rb") as file:
+        content = file.read()
+    header, _, body = content.partition(b"end_header\n")
+    lines = header.decode().splitlines()
+    if lines[:2] != ["ply", "format binary_little_endian 1.0"]:
+        raise ValueError(f"unexpected PLY header {lines[:2]}")
+    count = int(lines[2].split()[-1])
+    properties = [line.split()[1:] for line in lines[3:]]
+    if properties != [
+        ["float", "x"],
+        ["float", "y"],
+        ["float", "z"],
+        ["uchar", "red"],
+        ["uchar", "green"],
+        ["uchar", "blue"],
+    ]:
+        raise ValueError(f"unexpected PLY properties {properties}")
+    vertex = np.dtype([("xyz", "<f4", 3), ("rgb", "u1", 3)])
+    if len(body) != count * vertex.itemsize:
+        raise ValueError(f"{len(body)} PLY bytes for {count} vertices")
+    return np.frombuffer(body, dtype=vertex)["xyz"]
+
+
+def read_glb(path: str) -> dict:
+    """
+    Parses a binary glTF file of meshes with one primitive each.
+
+    Returns:
+    dict: The (N, 3) float32 positions of every mesh by primitive kind, checked against the accessor bounds.
+    """
+
+    with open(path, "rb") as file:
+        content = file.read()
+    magic, version, total = struct.unpack_from("<III", content)
+    if (magic, version, total) != (GLB_MAGIC, 2, len(content)):
+        raise ValueError(f"bad GLB header {magic:#x} {version} {total}/{len(content)}")
+    length, kind = struct.unpack_from("<II", content, 12)
+    if kind != GLB_JSON or length % 4:
+        raise ValueError("the JSON chunk isn't first or isn't 4 byte aligned")
+    document = json.loads(content[20 : 20 + length])
+    binary = b""
+    if 20 + length < len(content):
+        binary_length, kind = struct.unpack_from("<II", content, 20 + length)
+        if kind != GLB_BIN or 28 + length + binary_length != len(content):
+            raise ValueError("the binary chunk doesn't fill the file")
+        binary = content[28 + length :]
+
+    meshes = {}
+    for mesh in document["meshes"]:
+        (primitive,) = mesh["primitives"]
+        accessor = document["accessors"][primitive["attributes"]["POSITION"]]
+        view = document["bufferViews"][accessor["bufferView"]]
+        end = view["byteOffset"] + view["byteLength"]
+        if end > len(binary) or view["byteLength"] != accessor["count"] * 12:
+            raise ValueError(f"buffer view {view} doesn't fit")
+        positions = np.frombuffer(
+            binary[view["byteOffset"] : end], dtype="<f4"
+        ).reshape(-1, 3)
+        if not np.allclose(accessor["min"], positions.min(axis=0)) or not np.allclose(
+            accessor["max"], positions.max(axis=0)
+        ):
+            raise ValueError("accessor bounds differ from the positions")
+        meshes[GLB_MESH_MODES[primitive["mode"]]] = positions
+    return meshes
+
+
+def compare(name: str, found: np.ndarray, expected: np.ndarray) -> list:
+    expected = np.asarray(expected, dtype=np.float64).reshape(-1, 3)
+    if len(found) != len(expected):
+        return [f"{name}: {len(found)} rows written, {len(expected)} expected"]
+    if not np.allclose(found, expected, rtol=1e-6, atol=1e-6):
+        return [f"{name}: coordinates differ"]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=32)
+    parser.add_argument("--height", type=int, default=24)
+    parser.add_argument("--large", type=int, default=2_000_000)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    cameras = Points.get_points_at_inclinations(3, 4, [30, 60])
+    pictures = Squares.generate_pictures(cameras, 50, 36, 24, 1000)
+    rig = Rig.from_squares(pictures)
+    samples = np.random.default_rng(0).uniform(-1, 1, (SAMPLES, 3))
+    subspace = trace(
+        rig, SubSpace(12), args.width, args.height, RAY_LENGTH, 1, density=100
+    )
+
+    def scene():
+        return (
+            cameras.elements,
+            pictures,
+            rig_rays(rig, args.width, args.height, RAY_LENGTH, args.chunk_size // 7),
+            samples,
+            subspace,
+        )
+
+    seen = np.flatnonzero(np.bincount(subspace.assignments[:, 0]))
+    points = np.concatenate(
+        [[camera.array for camera in cameras.elements], samples, subspace.centres[seen]]
+    )
+    rays = np.concatenate(list(rig_rays(rig, args.width, args.height, RAY_LENGTH)))
+    corners = np.array(
+        [
+            [square.a.array, square.b.array, square.c.array, square.d.array]
+            for square in pictures
+        ]
+    )
+    triangles = corners[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3, 3)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        ply = os.path.join(directory, "scene.ply")
+        glb = os.path.join(directory, "scene.glb")
+        written = write_ply(ply, *scene(), chunk_size=args.chunk_size)
+        write_glb(glb, *scene(), chunk_size=args.chunk_size)
+        if written != len(points):
+            failures.append(f"write_ply reports {written} of {len(points)} points")
+        failures += compare("PLY points", read_ply(ply), points)
+        meshes = read_glb(glb)
+        failures += compare(
+            "GLB points", meshes.get("points", np.empty((0, 3))), points
+        )
+        failures += compare("GLB lines", meshes.get("lines", np.empty((0, 3))), rays)
+        failures += compare(
+            "GLB triangles", meshes.get("triangles", np.empty((0, 3))), triangles
+        )
+        results = {
+            "points": len(points),
+            "rays": len(rays),
+            "triangles": len(triangles),
+            "ply_bytes": os.path.getsize(ply),
+            "glb_bytes": os.path.getsize(glb),
+        }
+
+        cloud = MemmapArray(os.path.join(directory, "cloud"), (3,), np.float64)
+        rng = np.random.default_rng(1)
+        for start in range(0, args.large, args.chunk_size):
+            cloud.append(
+                rng.uniform(-1, 1, (min(args.chunk_size, args.large - start), 3))
+            )
+        cloud.flush()
+        limit = MEMORY_CHUNKS * args.chunk_size * 3 * 8 + MEMORY_OVERHEAD
+        for name, write in (("ply", write_ply), ("glb", write_glb)):
+            path = os.path.join(directory, f"large.{name}")
+            tracemalloc.start()
+            write(path, cloud, chunk_size=args.chunk_size)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[f"large_{name}_peak_bytes"] = peak
+            if peak > limit:
+                failures.append(f"large {name}: peak {peak} bytes over {limit}")
+        failures += compare(
+            "large PLY", read_ply(os.path.join(directory, "large.ply")), cloud.array
+        )
+        failures += compare(
+            "large GLB",
+            read_glb(os.path.join(directory, "large.glb"))["points"],
+            cloud.array,
+        )
+        cloud.close()
+
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
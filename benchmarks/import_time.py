@@ -0,0 +1,126 @@
+"""
+Guards the import time of the packages module.
+
+Importing packages, importing one of its submodules, listing its names or looking up a name it doesn't have must
+not pull in plotly or scipy, which are only loaded on first use of the rendering functions or the KDTree, and
+importing packages must stay within a time budget. A star import must still bring in every public name of the
+rendering module, which must all be listed in its __all__. Every measurement runs in a fresh interpreter.
+
+Run from the repository root:
+    python benchmarks/import_time.py [--runs 7] [--budget 0.5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("plotly", "scipy")
+DEF_RUNS = 7
+DEF_BUDGET = 0.5  # seconds
+
+# The statements every probe times, the first being the plain import the budget applies to.
+STATEMENTS = (
+    "import packages",
+    "from packages import tracing",
+    "import packages; hasattr(packages, 'nonexistent')",
+    "import packages; dir(packages)",
+)
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+# Lists the public names rendering defines that its __all__ or a star import of packages miss.
+API_PROBE = """
+import json
+from packages import *
+import packages.rendering as rendering
+import packages.rendering_constants as constants
+defined = {
+    name
+    for name, value in vars(rendering).items()
+    if getattr(value, "__module__", None) == rendering.__name__
+} | {name for name in vars(constants) if name.isupper()} - {"RENDERING_ALL"}
+print(json.dumps({
+    "unlisted": sorted(defined - set(rendering.__all__)),
+    "not_exported": sorted(set(rendering.__all__) - set(globals())),
+}))
+"""
+
+
+def measure(runs: int = DEF_RUNS, statement: str = STATEMENTS[0]) -> dict:
+    """
+    Runs an import statement in `runs` fresh interpreters.
+
+    Returns:
+    dict: The median and minimum time in seconds and the heavy modules that were imported.
+    """
+
+    probe = PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+    results = [
+        json.loads(
+            subprocess.run(
+                [sys.executable, "-c", probe],
+                cwd=ROOT,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        )
+        for _ in range(runs)
+    ]
+    seconds = [result["seconds"] for result in results]
+    return {
+        "median": statistics.median(seconds),
+        "min": min(seconds),
+        "heavy": sorted({name for result in results for name in result["heavy"]}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=DEF_RUNS)
+    parser.add_argument("--budget", type=float, default=DEF_BUDGET)
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    probes = {statement: measure(1, statement) for statement in STATEMENTS[1:]}
+    api = json.loads(
+        subprocess.run(
+            [sys.executable, "-c", API_PROBE],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    )
+    print(json.dumps(dict(result, probes=probes, api=api), indent=2))
+    failures = []
+    if api["unlisted"]:
+        failures.append(f"rendering.__all__ misses {', '.join(api['unlisted'])}")
+    if api["not_exported"]:
+        failures.append(
+            f"from packages import * misses {', '.join(api['not_exported'])}"
+        )
+    for statement, probed in [(STATEMENTS[0], result), *probes.items()]:
+        if probed["heavy"]:
+            failures.append(f"{statement!r} loaded {', '.join(probed['heavy'])}")
+    if result["median"] > args.budget:
+        failures.append(
+            f"median import time {result['median']:.3f}s exceeds {args.budget:.3f}s"
+        )
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Compares occlusion.trace_occluded with tracing.trace on a voxelised subject sphere of growing radius.
+
+For every radius the time, samples kept and assignment size of both are reported. An empty occupancy grid must give
+exactly the rows of tracing.trace. The first hits of the depth buffer must match a fine sampling of --checked pixel
+rays. A solid subject that doesn't shrink the assignment fails.
+
+Run from the repository root:
+    python benchmarks/occlusion.py [--divisions 24] [--checked 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from packages.collections import Points, Rig
+from packages.instrumentation import Instrumentation
+from packages.objects import SubSpace
+from packages.occlusion import depth_buffer, trace_occluded, voxelise_sphere
+from packages.tracing import trace
+from packages.utils import pixel_grid
+
+RADII = [0, 0.25, 0.4, 0.5]
+PIXELS = (160, 120)
+DENSITY = 100
+RAY_LENGTH = 3.5
+FINE_STEP = 1e-4
+
+
+def timed(run) -> tuple:
+    with Instrumentation() as instrumentation:
+        start = time.perf_counter()
+        subspace = run()
+        seconds = time.perf_counter() - start
+    counters = instrumentation.report()["counters"]
+    return subspace, {
+        "seconds": seconds,
+        "samples_kept": counters.get("samples_kept", 0),
+        "assignments": len(subspace.assignments),
+    }
+
+
+def sampled_hits(rig, subspace, occupancy, camera, pixels) -> np.ndarray:
+    """
+    Finds the first occupied cell of pixel rays by locating points FINE_STEP apart along them.
+    """
+
+    directions = rig.pixel_directions(*PIXELS, pixel_grid(*PIXELS), [camera])[0]
+    distances = np.arange(0, RAY_LENGTH, FINE_STEP)
+    hits = []
+    for pixel in pixels:
+        cells = subspace.locate(
+            rig.sources[camera] + distances[:, None] * directions[pixel]
+        )
+        occupied = (cells >= 0) & occupancy[np.maximum(cells, 0)]
+        hits.append(cells[np.argmax(occupied)] if occupied.any() else -1)
+    return np.array(hits)
+
+
+def sorted_rows(rows: np.ndarray) -> np.ndarray:
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--divisions", type=int, default=24)
+    parser.add_argument("--checked", type=int, default=200)
+    args = parser.parse_args()
+
+    rig = Rig.from_cameras(
+        Points.get_points_at_inclinations(3, 8, [30, 60]), 50, 36, 24, 1000
+    )
+    grid = SubSpace(args.divisions)
+    reference, results = timed(
+        lambda: trace(rig, SubSpace(args.divisions), *PIXELS, RAY_LENGTH, 1, DENSITY)
+    )
+    results = {"trace": results}
+
+    failures = []
+    for radius in RADII:
+        occupancy = (
+            voxelise_sphere(grid, radius)
+            if radius
+            else np.zeros(len(grid.centres), dtype=bool)
+        )
+        subspace, result = timed(
+            lambda: trace_occluded(
+                rig,
+                SubSpace(args.divisions),
+                occupancy,
+                *PIXELS,
+                RAY_LENGTH,
+                1,
+                DENSITY,
+            )
+        )
+        results[f"occluded r={radius}"] = result
+        if not radius:
+            if not np.array_equal(
+                sorted_rows(subspace.assignments), sorted_rows(reference.assignments)
+            ):
+                failures.append("an empty occupancy grid changes the assignment")
+            continue
+        if result["assignments"] >= results["trace"]["assignments"]:
+            failures.append(f"a solid sphere of radius {radius} hides no cell")
+        pixels = np.random.default_rng(0).choice(
+            PIXELS[0] * PIXELS[1], args.checked, replace=False
+        )
+        buffer = depth_buffer(rig, grid, occupancy, 0, *PIXELS, RAY_LENGTH)
+        if not np.array_equal(
+            buffer.cells[pixels], sampled_hits(rig, grid, occupancy, 0, pixels)
+        ):
+            failures.append(f"radius {radius}: first hits differ from fine sampling")
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
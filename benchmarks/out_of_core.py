@@ -0,0 +1,116 @@
+"""
+Checks that main.out_of_core fills a SubSpace with the same points as the in-memory assignment stage of main.py.
+
+Both paths run on one small rig: the in-memory one builds rays with Square.to_rays, samples them with Line.to_mesh
+and assigns the samples to every centre with assign_center, the scratch one streams everything through memmaps in a
+temporary directory and reads its assignment rows back. Every cell must end up with the same sample coordinates, up
+to --precision decimals, and the scratch directory must be gone afterwards.
+
+Run from the repository root:
+    python benchmarks/out_of_core.py [--divisions 4] [--width 12] [--height 8] [--density 40]
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from main import assign_center, out_of_core
+from packages import KDTree
+from packages.collections import Points, Squares
+from packages.objects import SubSpace
+from packages.storage import Scratch
+
+SUBJECT_RADIUS = 1
+CAMERA_RADIUS = 3
+DEF_PRECISION = 9
+
+
+def cell_points(subspace: SubSpace, decimals: int) -> dict:
+    """
+    Returns the rounded coordinates of the points assigned to every non-empty cell, with their multiplicity.
+    """
+
+    return {
+        key: Counter(tuple(np.round(point.array, decimals)) for point in points)
+        for key, points in subspace.subspace_assignments.items()
+        if points
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--divisions", type=int, default=4)
+    parser.add_argument("--width", type=int, default=12)
+    parser.add_argument("--height", type=int, default=8)
+    parser.add_argument("--density", type=int, default=40)
+    parser.add_argument("--precision", type=int, default=DEF_PRECISION)
+    args = parser.parse_args()
+
+    cameras = Points.get_points_at_inclinations(CAMERA_RADIUS, 3, [20, 60])
+    pictures = Squares.generate_pictures(cameras, 50, 36, 24, 1000)
+    subspace_radius = SUBJECT_RADIUS / args.divisions
+
+    rays = [
+        ray
+        for picture in pictures
+        for ray in picture.to_rays(args.width, args.height, CAMERA_RADIUS + 0.5)
+    ]
+    point_cloud = [
+        point for ray in rays for point in ray.to_mesh(args.density, SUBJECT_RADIUS)
+    ]
+    in_memory = SubSpace(args.divisions)
+    tree = KDTree([point.array.tolist() for point in point_cloud])
+    for centre in in_memory.points:
+        centre, close_points = assign_center(tree, point_cloud, centre, subspace_radius)
+        for point in close_points:
+            in_memory.subspace_assignments[str(centre)].add(point)
+
+    with Scratch(keep=False) as scratch:
+        scratch_subspace = SubSpace(args.divisions)
+        out_of_core(
+            scratch,
+            pictures,
+            scratch_subspace,
+            args.width,
+            args.height,
+            CAMERA_RADIUS + 0.5,
+            args.density,
+            SUBJECT_RADIUS,
+            subspace_radius,
+            np.float64,
+        )
+
+    expected = cell_points(in_memory, args.precision)
+    found = cell_points(scratch_subspace, args.precision)
+    results = {
+        "samples": len(point_cloud),
+        "in_memory_cells": len(expected),
+        "scratch_cells": len(found),
+        "in_memory_points": sum(map(len, in_memory.subspace_assignments.values())),
+        "scratch_points": sum(map(len, scratch_subspace.subspace_assignments.values())),
+    }
+    failures = [
+        f"cell {key}: {sum(found.get(key, {}).values())} scratch points, "
+        f"{sum(expected.get(key, {}).values())} in memory"
+        for key in sorted(set(expected) | set(found))
+        if expected.get(key) != found.get(key)
+    ]
+    if os.path.exists(scratch.directory):
+        failures.append(f"scratch directory {scratch.directory} left behind")
+    if not expected:
+        failures.append("no points assigned, the check compares nothing")
+
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Checks that every camera sampler places cameras Squares.generate_pictures can take pictures from.
+
+Every sampler is run over a range of counts, odd and even, and its pictures built with Squares.picture_corners. A
+NaN picture corner, a camera on a pole or the equator, or a camera off the sphere fails.
+
+Run from the repository root:
+    python benchmarks/placements.py [--max-count 201]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from packages.collections import Points, Squares
+from packages.utils import norms
+
+DEF_MAX_COUNT = 201
+RADIUS = 3
+MIN_HEIGHT = 1e-9  # the least |z| / r of a camera off the equator
+CAP_INCLINATIONS = [180, 120, 90]
+GEODESIC_FREQUENCIES = range(1, 7)
+
+
+def samplers(max_count: int) -> dict:
+    """
+    Returns:
+    dict: Lists of (label, Points) by sampler name.
+    """
+
+    return {
+        "fibonacci": [
+            (f"{count} cap {cap}", Points.fibonacci(count, RADIUS, cap))
+            for cap in CAP_INCLINATIONS
+            for count in range(1, max_count + 1)
+        ],
+        "geodesic": [
+            (f"frequency {frequency}", Points.geodesic(frequency, RADIUS))
+            for frequency in GEODESIC_FREQUENCIES
+        ],
+        "get_points_at_inclinations": [
+            (
+                f"{count} per ring",
+                Points.get_points_at_inclinations(RADIUS, count, [20, 60, 120]),
+            )
+            for count in range(1, 17)
+        ],
+    }
+
+
+def problems(points: Points) -> list:
+    cameras = points.array
+    heights = np.abs(cameras[:, 2]) / RADIUS
+    corners = Squares.picture_corners(cameras, 50, 36, 24, 1000)
+    found = []
+    if np.isnan(corners).any():
+        found.append("NaN picture corners")
+    if (heights < MIN_HEIGHT).any():
+        found.append("a camera on the equator")
+    if (heights > 1 - MIN_HEIGHT).any():
+        found.append("a camera on a pole")
+    if not np.allclose(norms(cameras), RADIUS):
+        found.append("a camera off the sphere")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-count", type=int, default=DEF_MAX_COUNT)
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    for name, cases in samplers(args.max_count).items():
+        results[name] = {"cases": len(cases), "cameras": 0}
+        for label, points in cases:
+            results[name]["cameras"] += len(points)
+            failures.extend(
+                f"{name} {label}: {problem}" for problem in problems(points)
+            )
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
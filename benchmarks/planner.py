@@ -0,0 +1,175 @@
+"""
+Checks the predictions of planner.plan against small real runs, and a Calibration against a measured run.
+
+For every case the cameras and rays main.py would build are counted, the Line.to_mesh samples of every ray are
+kept like the legacy pipeline does, and tracing.trace runs under Instrumentation for its samples and assignment
+rows. Camera and ray counts must match exactly, sample counts within --tolerance and row counts within --cell-tolerance. Cameras on the
+equator or a pole have no defined picture orientation, so the cases keep clear of them. The trace stage is then
+calibrated with Calibration.from_benchmarks from timed runs of the calibration cases, and the time it predicts for a
+held out case must be within --time-factor of the measured time.
+
+Run from the repository root:
+    python benchmarks/planner.py [--tolerance 0.05] [--cell-tolerance 0.15] [--time-factor 3]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from packages.collections import Points, Squares, Rig
+from packages.instrumentation import Instrumentation
+from packages.objects import SubSpace
+from packages.planner import Calibration, RunParameters, plan
+from packages.tracing import trace
+from stages import DEFAULTS, measure, stage_tiled_assignment
+
+DEF_TOLERANCE = 0.05
+DEF_TIME_FACTOR = 3
+# the cells a ray crosses depend on its angle to the axis aligned grid, which the planner's statistic averages out
+DEF_CELL_TOLERANCE = 0.15
+CASES = [
+    RunParameters(3, 4, [30, 60], 12, 8, 40, 6),
+    RunParameters(2.5, 6, [20, 70], 16, 12, 60, 8),
+    RunParameters(3, 3, [30, 75, 120], 10, 10, 30, 5),
+]
+# benchmarks/stages.py cases for the trace stage, the last one held out of the calibration
+TIMED_PIXELS = [(24, 16), (48, 32), (96, 64)]
+
+
+def measured_counts(params: RunParameters) -> dict:
+    """
+    Runs the stages of a case and counts the items the planner predicts.
+    """
+
+    cameras = Points.get_points_at_inclinations(
+        params.camera_radius, params.cams_along_inclination, params.inclinations
+    )
+    pictures = Squares.generate_pictures(
+        cameras,
+        params.focal_length,
+        params.sensor_width,
+        params.sensor_height,
+        params.unit,
+    )
+    rays = [
+        ray
+        for picture in pictures
+        for ray in picture.to_rays(
+            params.pixel_width, params.pixel_height, params.ray_length
+        )
+    ]
+    kept = sum(
+        len(ray.to_mesh(params.points_density_for_line, params.subject_radius))
+        for ray in rays
+    )
+    with Instrumentation() as instrumentation:
+        subspace = trace(
+            Rig.from_squares(pictures),
+            SubSpace(params.subspace_count, params.subspace_length),
+            params.pixel_width,
+            params.pixel_height,
+            params.ray_length,
+            params.subject_radius,
+            params.points_density_for_line,
+        )
+    counters = instrumentation.report()["counters"]
+    return {
+        "cameras": len(cameras),
+        "rays": len(rays),
+        "kdtree": kept,
+        "trace": counters.get("samples_kept", 0) + counters.get("samples_discarded", 0),
+        "assignments": len(subspace.assignments),
+    }
+
+
+def timed_case(pixels: tuple) -> dict:
+    """
+    Times the trace stage of benchmarks/stages.py on one pixel grid, in the form of its results.
+    """
+
+    params = dict(DEFAULTS, pixels=pixels)
+    run, _, _ = stage_tiled_assignment(params)
+    result = measure(run)
+    result.update(stage="subspace assignment (tracing.trace)", params=params)
+    return result
+
+
+def run_parameters(params: dict) -> RunParameters:
+    return RunParameters(
+        params["camera_radius"],
+        params["cams_along_inclination"],
+        params["inclinations"],
+        *params["pixels"],
+        params["density"],
+        params["subspace_count"],
+        subject_radius=params["subject_radius"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tolerance", type=float, default=DEF_TOLERANCE)
+    parser.add_argument("--cell-tolerance", type=float, default=DEF_CELL_TOLERANCE)
+    parser.add_argument("--time-factor", type=float, default=DEF_TIME_FACTOR)
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    for params in CASES:
+        name = (
+            f"{params.cameras} cameras {params.pixel_width}x{params.pixel_height} "
+            f"density {params.points_density_for_line} grid {params.subspace_count}"
+        )
+        predicted = plan(params)
+        expected = {stage.name: stage.items for stage in predicted.stages}
+        expected["assignments"] = round(params.rays * predicted.statistics.cells)
+        found = measured_counts(params)
+        results[name] = {
+            key: {"predicted": expected[key], "measured": found[key]} for key in found
+        }
+        for key in ("cameras", "rays"):
+            if expected[key] != found[key]:
+                failures.append(
+                    f"{name}: {found[key]} {key}, {expected[key]} predicted"
+                )
+        for key, tolerance in (
+            ("kdtree", args.tolerance),
+            ("trace", args.tolerance),
+            ("assignments", args.cell_tolerance),
+        ):
+            error = abs(expected[key] - found[key]) / max(found[key], 1)
+            if error > tolerance:
+                failures.append(
+                    f"{name}: {found[key]} {key} items, {expected[key]} predicted"
+                )
+
+    timed = [timed_case(pixels) for pixels in TIMED_PIXELS]
+    calibration = Calibration.from_benchmarks(
+        {str(index): result for index, result in enumerate(timed[:-1])}
+    )
+    held_out = timed[-1]
+    predicted = plan(
+        run_parameters(held_out["params"]), max_processes=1, calibration=calibration
+    ).stage("trace")
+    ratio = predicted.seconds / held_out["seconds"]
+    results["calibrated trace"] = {
+        "pixels": held_out["params"]["pixels"],
+        "predicted_seconds": predicted.seconds,
+        "measured_seconds": held_out["seconds"],
+    }
+    if not 1 / args.time_factor <= ratio <= args.time_factor:
+        failures.append(
+            f"calibrated trace time off by {ratio:.2f}x for {held_out['params']['pixels']}"
+        )
+
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Bounds the assignment differences between float32 and float64 precision.
+
+Every case is traced once per precision and the (cell, camera, pixel) assignments are compared. Samples that land
+within rounding of a cell face or the subject bound may switch cell, so a small fraction of differing assignments is
+expected; more than --tolerance of them, or any Line.to_mesh sample count mismatch beyond it, fails.
+
+Run from the repository root:
+    python benchmarks/precision.py [--tolerance 0.001]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from packages.collections import Points, Squares, Rig
+from packages.objects import SubSpace
+from packages.tracing import trace
+
+DEF_TOLERANCE = 1e-3
+MESH_PIXELS = (48, 32)
+CASES = [
+    dict(cameras=3, pixels=(6, 4), density=40, subspace_count=3),
+    dict(cameras=6, pixels=(96, 64), density=160, subspace_count=8),
+    dict(cameras=12, pixels=(128, 96), density=None, subspace_count=24),
+]
+
+
+def pictures_of(case: dict):
+    cameras = Points.get_points_at_inclinations(3, case["cameras"], [20, 60])
+    return Squares.generate_pictures(cameras, 50, 36, 24, 1000)
+
+
+def assignments(case: dict, dtype) -> np.ndarray:
+    subspace = SubSpace(case["subspace_count"])
+    trace(
+        Rig.from_squares(pictures_of(case)),
+        subspace,
+        *case["pixels"],
+        3.5,
+        1,
+        density=case["density"],
+        step=None if case["density"] else subspace.step_length(),
+        dtype=dtype,
+    )
+    return np.unique(subspace.assignments, axis=0)
+
+
+def mesh_samples(case: dict, dtype) -> int:
+    """
+    Counts the Line.to_mesh samples of one camera, on a pixel grid of at most MESH_PIXELS.
+    """
+
+    picture = pictures_of(case)[0]
+    pixels = np.minimum(case["pixels"], MESH_PIXELS)
+    return sum(
+        len(ray.to_mesh(case["density"] or 40, 1, dtype))
+        for ray in picture.to_rays(*pixels, 3.5, dtype)
+    )
+
+
+def keys(rows: np.ndarray) -> np.ndarray:
+    cells, cameras, pixels = rows.astype(np.int64).T
+    return (cells << 42) | (cameras << 26) | pixels
+
+
+def compare(case: dict) -> dict:
+    single, double = assignments(case, np.float32), assignments(case, np.float64)
+    differing = len(np.setxor1d(keys(single), keys(double)))
+    samples32, samples64 = mesh_samples(case, np.float32), mesh_samples(
+        case, np.float64
+    )
+    return {
+        "case": case,
+        "assignments": len(double),
+        "differing": differing,
+        "fraction": differing / max(len(double), 1),
+        "mesh_fraction": abs(samples32 - samples64) / max(samples64, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tolerance", type=float, default=DEF_TOLERANCE)
+    args = parser.parse_args()
+
+    results = [compare(case) for case in CASES]
+    print(json.dumps(results, indent=2))
+    failures = [
+        result
+        for result in results
+        if max(result["fraction"], result["mesh_fraction"]) > args.tolerance
+    ]
+    for failure in failures:
+        print(
+            f"REGRESSION: {failure['case']} differs in {failure['fraction']:.2e} of "
+            f"assignments and {failure['mesh_fraction']:.2e} of mesh samples",
+            file=sys.stderr,
+        )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Times building a bvh.RayIndex over the rays of a rig and querying it, and checks the queries against brute force.
+
+The rays of every pixel are added in export.rig_rays chunks, so the build includes the incremental rebuilds. Random
+points and boxes inside the subject are then queried, and a sample of them is also tested against every ray. Any
+difference fails, as does a query batch slower than --budget seconds.
+
+Run from the repository root:
+    python benchmarks/rays.py [--width 160] [--height 120] [--queries 1000] [--budget 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from packages.bvh import RayIndex, segment_point_distances, segments_meet_boxes
+from packages.collections import Points, Rig
+from packages.export import rig_rays
+
+DEF_BUDGET = 5
+DEF_QUERIES = 1000
+DEF_EPSILON = 0.005
+DEF_BOX_SIZE = 0.02
+CHECKED = 50
+RAY_LENGTH = 3.5
+CHUNK_SIZE = 20_000
+
+
+def brute_force(segments: np.ndarray, run) -> tuple:
+    """
+    Returns the (query, ray id) pairs for which run(starts, ends) is True, testing every query against every ray.
+    """
+
+    return np.nonzero(run(segments[None, :, 0], segments[None, :, 1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=160)
+    parser.add_argument("--height", type=int, default=120)
+    parser.add_argument("--queries", type=int, default=DEF_QUERIES)
+    parser.add_argument("--budget", type=float, default=DEF_BUDGET)
+    args = parser.parse_args()
+
+    rig = Rig.from_cameras(
+        Points.get_points_at_inclinations(3, 8, [30, 60]), 50, 36, 24, 1000
+    )
+
+    def rays():
+        return rig_rays(rig, args.width, args.height, RAY_LENGTH, CHUNK_SIZE)
+
+    start = time.perf_counter()
+    index = RayIndex().extend(rays())
+    results = {"rays": len(index), "build_seconds": time.perf_counter() - start}
+
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-0.5, 0.5, (args.queries, 3))
+    lows, highs = points - DEF_BOX_SIZE / 2, points + DEF_BOX_SIZE / 2
+    segments = np.concatenate(list(rays()))
+    sample = slice(0, CHECKED)
+    cases = {
+        "near_points": (
+            lambda: index.near_points(points, DEF_EPSILON),
+            lambda starts, ends: segment_point_distances(
+                starts, ends, points[sample, None]
+            )
+            <= DEF_EPSILON,
+        ),
+        "through_boxes": (
+            lambda: index.through_boxes(lows, highs),
+            lambda starts, ends: segments_meet_boxes(
+                starts, ends, lows[sample, None], highs[sample, None]
+            ),
+        ),
+    }
+
+    failures = []
+    for name, (query, run) in cases.items():
+        start = time.perf_counter()
+        queries, ids = query()
+        seconds = time.perf_counter() - start
+        results[name] = {"seconds": seconds, "matches": len(ids)}
+        checked = queries < CHECKED
+        expected = brute_force(segments, run)
+        if not (
+            np.array_equal(queries[checked], expected[0])
+            and np.array_equal(ids[checked], expected[1])
+        ):
+            failures.append(f"{name} differs from brute force")
+        if seconds > args.budget:
+            failures.append(f"{name} took {seconds:.2f} s")
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
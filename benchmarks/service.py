@@ -0,0 +1,139 @@
+"""
+Drives a local service.AnalysisService with a stub client and checks that it coalesces, caches and answers right.
+
+The service listens on a free local port. A first wave of concurrent requests, --copies of each of a few distinct
+parameter sets, must run each set once. A second identical wave must be served from the cache. Every answer must
+equal service.analyse run directly, and malformed or out of range requests (NaN, non-positive or fractional counts,
+grids too large to run) must get an error. A service with a cache of a few results' bytes, run on threads with a
+stub task, must evict the least recently used results and stay within its bytes. The timings of both waves are
+reported.
+
+Run from the repository root:
+    python benchmarks/service.py [--copies 8] [--workers 2]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from packages.planner import RunParameters
+from packages.service import AnalysisService, analyse, parse_parameters, request
+
+DEF_COPIES = 8
+DEF_WORKERS = 2
+PARAMETERS = [
+    RunParameters(3, 4, [30, 60], 32, 24, 20, 8),
+    RunParameters(3, 6, [45], 32, 24, 20, 8),
+    RunParameters(2.5, 4, [20, 60], 24, 16, 20, 6),
+    # a grid whose dense per cell figures would not fit a request line
+    RunParameters(3, 4, [30, 60], 32, 24, 20, 48),
+]
+VALID = PARAMETERS[0]._asdict()
+INVALID = [
+    {"camera_radius": 3},
+    dict(VALID, camera_radius=float("nan")),
+    dict(VALID, inclinations=[30, float("nan")]),
+    dict(VALID, inclinations=[]),
+    dict(VALID, pixel_width=0),
+    dict(VALID, pixel_height=2.5),
+    dict(VALID, subject_radius=-1),
+    dict(VALID, subspace_count=10**6),
+    dict(VALID, pixel_width=10**5, pixel_height=10**5),
+]
+# the size in bytes of every stub result, and the cache that holds two of them
+STUB_BYTES = 1000
+STUB_CACHE = 2
+
+
+def stub(params: RunParameters) -> str:
+    return "x" * (STUB_BYTES - 2)
+
+
+async def wave(port: int, copies: int) -> tuple:
+    start = time.perf_counter()
+    answers = await asyncio.gather(
+        *(
+            request(params._asdict(), port=port)
+            for _ in range(copies)
+            for params in PARAMETERS
+        )
+    )
+    return time.perf_counter() - start, answers
+
+
+async def drive(copies: int, workers: int) -> tuple:
+    failures = []
+    async with AnalysisService(workers=workers) as service:
+        server = await service.serve(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            first_seconds, first = await wave(port, copies)
+            computed = dict(service.stats)
+            second_seconds, second = await wave(port, copies)
+            for parameters in INVALID:
+                try:
+                    await request(parameters, port=port)
+                    failures.append(f"{parameters} got an answer")
+                except RuntimeError:
+                    pass
+        stats = service.stats
+
+    expected = [
+        json.loads(json.dumps(analyse(parse_parameters(params._asdict()))))
+        for params in PARAMETERS
+    ]
+    if first + second != expected * (2 * copies):
+        failures.append("answers differ from analyse")
+    if computed["computed"] != len(PARAMETERS):
+        failures.append(
+            f"{computed['computed']} runs for {len(PARAMETERS)} distinct requests"
+        )
+    if stats["cached"] != len(PARAMETERS) * copies:
+        failures.append(f"{stats['cached']} of the second wave served from the cache")
+
+    with ThreadPoolExecutor(1) as executor:
+        async with AnalysisService(
+            executor, cache_bytes=STUB_CACHE * STUB_BYTES, task=stub
+        ) as service:
+            keys = [parse_parameters(params._asdict()) for params in PARAMETERS[:3]]
+            for params in [*keys, keys[1]]:
+                await service.analyse(params)
+            kept = list(service.cache)
+    if kept != [keys[2], keys[1]]:
+        failures.append(f"the byte bounded cache kept {len(kept)} results out of order")
+    if service.cached_bytes != STUB_CACHE * STUB_BYTES:
+        failures.append(
+            f"{service.cached_bytes} bytes cached, {STUB_CACHE * STUB_BYTES} expected"
+        )
+
+    results = {
+        "requests_per_wave": len(PARAMETERS) * copies,
+        "first_wave_seconds": first_seconds,
+        "cached_wave_seconds": second_seconds,
+        "stats": stats,
+    }
+    return results, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--copies", type=int, default=DEF_COPIES)
+    parser.add_argument("--workers", type=int, default=DEF_WORKERS)
+    args = parser.parse_args()
+
+    results, failures = asyncio.run(drive(args.copies, args.workers))
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
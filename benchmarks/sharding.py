@@ -0,0 +1,114 @@
+"""
+Times sharding.trace_sharded against tracing.trace on one rig and checks that the merged store holds the same rows.
+
+Every brick layout is run with --processes workers into a temporary directory. The timings, the tiles routed to
+shards and the largest shard file are reported. Any layout whose merged rows differ from tracing.trace fails, and so
+does tracing.trace into a store moved to disk with storage.stream_assignments. A run without a directory must merge
+the same rows and leave no temporary directory behind.
+
+Run from the repository root:
+    python benchmarks/sharding.py [--divisions 24] [--processes 4]
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from packages.collections import Points, Rig
+from packages.instrumentation import Instrumentation
+from packages.objects import SubSpace
+from packages.sharding import trace_sharded
+from packages.storage import MemmapArray, stream_assignments
+from packages.tracing import trace
+
+LAYOUTS = [(1, 1, 1), (4, 1, 1), (2, 2, 2)]
+PIXELS = (160, 120)
+DENSITY = 100
+RAY_LENGTH = 3.5
+
+
+def sorted_rows(rows: np.ndarray) -> np.ndarray:
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+def temporary_directories() -> set:
+    return set(glob.glob(os.path.join(tempfile.gettempdir(), "geomkit-*")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--divisions", type=int, default=24)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    rig = Rig.from_cameras(
+        Points.get_points_at_inclinations(3, 8, [30, 60]), 50, 36, 24, 1000
+    )
+    start = time.perf_counter()
+    reference = trace(
+        rig, SubSpace(args.divisions), *PIXELS, RAY_LENGTH, 1, DENSITY
+    ).assignments
+    results = {"trace_seconds": time.perf_counter() - start}
+    expected = sorted_rows(reference)
+
+    failures = []
+    subspace = SubSpace(args.divisions)
+    with tempfile.TemporaryDirectory() as directory:
+        sink = stream_assignments(subspace, os.path.join(directory, "assignments"))
+        start = time.perf_counter()
+        trace(rig, subspace, *PIXELS, RAY_LENGTH, 1, DENSITY)
+        results["streamed_trace_seconds"] = time.perf_counter() - start
+        if not np.array_equal(sorted_rows(subspace.assignments), expected):
+            failures.append("a streamed store differs from tracing.trace")
+        sink.close()
+    for layout in LAYOUTS:
+        subspace = SubSpace(args.divisions)
+        with tempfile.TemporaryDirectory() as directory, Instrumentation() as report:
+            start = time.perf_counter()
+            paths = trace_sharded(
+                rig,
+                subspace,
+                *PIXELS,
+                RAY_LENGTH,
+                1,
+                DENSITY,
+                directory=directory,
+                bricks=layout,
+                processes=args.processes,
+            )
+            seconds = time.perf_counter() - start
+            largest = max(len(MemmapArray.open(path)) for path in paths)
+        name = "x".join(map(str, layout))
+        results[name] = {
+            "seconds": seconds,
+            "shards": len(paths),
+            "routed_tiles": report.report()["counters"]["routed_tiles"],
+            "largest_shard_rows": largest,
+        }
+        if not np.array_equal(sorted_rows(subspace.assignments), expected):
+            failures.append(f"{name} bricks: merged rows differ from tracing.trace")
+    before, subspace = temporary_directories(), SubSpace(args.divisions)
+    paths = trace_sharded(rig, subspace, *PIXELS, RAY_LENGTH, 1, DENSITY)
+    if not np.array_equal(sorted_rows(subspace.assignments), expected):
+        failures.append(
+            "merged rows of a temporary directory differ from tracing.trace"
+        )
+    left = temporary_directories() - before
+    if left or any(os.path.exists(os.path.dirname(path)) for path in paths):
+        failures.append(f"temporary shard directories left behind: {sorted(left)}")
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Scaling benchmarks for every stage of the pipeline.
+
+Each stage runs on synthetic rigs across a sweep of one parameter (camera count, pixel dims, points_density_for_line
+or subspace_count) while the others keep their main.py values. Wall time (best of --repeat runs), peak traced memory
+and throughput are written to JSON and, when a baseline exists, compared against it to flag regressions.
+
+Run from the repository root:
+    python benchmarks/stages.py [--quick] [--output results.json] [--baseline baseline.json] [--save-baseline]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from main import assign_center
+from packages import KDTree
+from packages.collections import Points, Squares, Rig
+from packages.objects import SubSpace
+from packages.rendering import build_figure
+from packages.tracing import trace
+
+DEF_OUTPUT = os.path.join(ROOT, "benchmarks", "results.json")
+DEF_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+DEF_REPEAT = 3
+DEF_TOLERANCE = 0.25
+
+# the main.py configuration every sweep starts from
+DEFAULTS = dict(
+    subject_radius=1,
+    camera_radius=3,
+    cams_along_inclination=3,
+    inclinations=[20, 60],
+    focal_length=50,
+    sensor_width=36,
+    sensor_height=24,
+    pixels=(6, 4),
+    unit=1000,
+    density=40,
+    subspace_count=3,
+)
+SWEEPS = {
+    "cameras": [3, 12, 48, 192],
+    "pixels": [(6, 4), (24, 16), (96, 64)],
+    "density": [40, 160, 640],
+    "subspace_count": [3, 6, 12, 24],
+}
+QUICK_SWEEPS = {name: values[:2] for name, values in SWEEPS.items()}
+
+
+def rig_params(params: dict) -> dict:
+    if "cameras" not in params:
+        return params
+    per_ring = max(params["cameras"] // len(params["inclinations"]), 1)
+    return dict(params, cams_along_inclination=per_ring)
+
+
+def cameras_of(params: dict) -> Points:
+    return Points.get_points_at_inclinations(
+        params["camera_radius"],
+        params["cams_along_inclination"],
+        params["inclinations"],
+    )
+
+
+def pictures_of(params: dict):
+    return Squares.generate_pictures(
+        cameras_of(params),
+        params["focal_length"],
+        params["sensor_width"],
+        params["sensor_height"],
+        params["unit"],
+    )
+
+
+def rays_of(params: dict):
+    return [
+        ray
+        for picture in pictures_of(params)
+        for ray in picture.to_rays(*params["pixels"], params["camera_radius"] + 0.5)
+    ]
+
+
+def samples_of(params: dict):
+    return [
+        point
+        for ray in rays_of(params)
+        for point in ray.to_mesh(params["density"], params["subject_radius"])
+    ]
+
+
+# Every stage takes the case parameters and returns (run, items, unit): the callable timed, the number of items it
+# produces and what those items are, for throughput.
+
+
+def stage_cameras(params):
+    def run():
+        return cameras_of(params)
+
+    return run, len(cameras_of(params)), "cameras"
+
+
+def stage_pictures(params):
+    cameras = cameras_of(params)
+
+    def run():
+        return Squares.generate_pictures(
+            cameras,
+            params["focal_length"],
+            params["sensor_width"],
+            params["sensor_height"],
+            params["unit"],
+        )
+
+    return run, len(cameras), "pictures"
+
+
+def stage_rays(params):
+    pictures = pictures_of(params)
+
+    def run():
+        return [
+            picture.to_rays(*params["pixels"], params["camera_radius"] + 0.5)
+            for picture in pictures
+        ]
+
+    return run, len(pictures) * int(np.prod(params["pixels"])), "rays"
+
+
+def stage_mesh(params):
+    rays = rays_of(params)
+
+    def run():
+        return [
+            ray.to_mesh(params["density"], params["subject_radius"]) for ray in rays
+        ]
+
+    return run, len(rays) * params["density"], "samples"
+
+
+def stage_assignment(params):
+    point_cloud = samples_of(params)
+    coords = [point.array.tolist() for point in point_cloud]
+    subspace = SubSpace(params["subspace_count"])
+    radius = params["subject_radius"] / params["subspace_count"]
+
+    def run():
+        tree = KDTree(coords)
+        for centre in subspace.points:
+            assign_center(tree, point_cloud, centre, radius)
+
+    return run, len(point_cloud), "samples"
+
+
+def stage_tiled_assignment(params):
+    rig = Rig.from_squares(pictures_of(params))
+
+    def run():
+        return trace(
+            rig,
+            SubSpace(params["subspace_count"]),
+            *params["pixels"],
+            params["camera_radius"] + 0.5,
+            params["subject_radius"],
+            density=params["density"],
+        )
+
+    return run, len(rig) * int(np.prod(params["pixels"])), "rays"
+
+
+def stage_figure(params):
+    cameras = cameras_of(params)
+    pictures = pictures_of(params)
+    samples = samples_of(params)
+
+    def run():
+        return build_figure(cameras.elements, pictures, samples)
+
+    return run, len(samples), "points"
+
+
+STAGES = {
+    "Points.get_points_at_inclinations": stage_cameras,
+    "Squares.generate_pictures": stage_pictures,
+    "Square.to_rays": stage_rays,
+    "Line.to_mesh": stage_mesh,
+    "subspace assignment (KDTree)": stage_assignment,
+    "subspace assignment (tracing.trace)": stage_tiled_assignment,
+    "easy_plot figure build": stage_figure,
+}
+
+
+def measure(run, repeat: int = DEF_REPEAT) -> dict:
+    """
+    Times `run` (best of `repeat`) and measures its peak traced memory in a separate call, so tracing doesn't skew
+    the timing.
+    """
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(seconds), "peak_bytes": peak}
+
+
+def run_suite(sweeps: dict, repeat: int = DEF_REPEAT) -> dict:
+    """
+    Runs every stage over every sweep.
+
+    Returns:
+    dict: Results keyed "<stage>[<parameter>=<value>]".
+    """
+
+    results = {}
+    for stage, setup in STAGES.items():
+        for parameter, values in sweeps.items():
+            for value in values:
+                params = rig_params(dict(DEFAULTS, **{parameter: value}))
+                run, items, unit = setup(params)
+                result = measure(run, repeat)
+                result.update(
+                    stage=stage,
+                    parameter=parameter,
+                    value=value,
+                    params=params,
+                    items=items,
+                    unit=unit,
+                    throughput=items / result["seconds"],
+                )
+                key = f"{stage}[{parameter}={value}]"
+                results[key] = result
+                print(
+                    f"{key:70} {result['seconds'] * 1e3:10.2f} ms "
+                    f"{result['peak_bytes'] / 2**20:9.2f} MiB "
+                    f"{result['throughput']:14.0f} {unit}/s"
+                )
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = DEF_TOLERANCE) -> list:
+    """
+    Lists the cases that got slower or used more memory than the baseline by more than `tolerance`.
+    """
+
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            before, after = baseline[key][metric], result[metric]
+            if after > before * (1 + tolerance):
+                regressions.append(f"{key} {metric}: {before:.4g} -> {after:.4g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="run the short sweeps")
+    parser.add_argument("--repeat", type=int, default=DEF_REPEAT)
+    parser.add_argument("--output", default=DEF_OUTPUT)
+    parser.add_argument("--baseline", default=DEF_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=DEF_TOLERANCE)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store the results as baseline"
+    )
+    args = parser.parse_args()
+
+    results = run_suite(QUICK_SWEEPS if args.quick else SWEEPS, args.repeat)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline to store one")
+        return
+    with open(args.baseline) as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
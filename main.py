@@ -1,20 +1,31 @@
 from multiprocessing import Pool, cpu_count
-import time
+import os
 import numpy as np
 from tqdm import tqdm
-from scipy.spatial import KDTree
-from packages.collections import Points, Squares
+import packages
+from packages.collections import Points, Squares, Rig
+from packages.export import rig_rays
+from packages.instrumentation import Instrumentation, MemoryHook, count, stage
 from packages.multiprocessing_utils import picture_to_rays, ray_to_mesh_points
 from packages.objects import SubSpace, Point
+from packages.storage import (
+    Scratch,
+    MemmapArray,
+    ball_query,
+    load_assignments,
+    mesh_samples,
+    stream_assignments,
+)
+from packages.tracing import trace
+from contextlib import nullcontext
 from functools import partial
-from packages.rendering import easy_plot
 
 
 def assign_center(tree, points, centre, subspace_radius):
     distances, indices = tree.query(
         centre,
         distance_upper_bound=subspace_radius * np.sqrt(2),
-        k=len(coords),
+        k=len(points),
     )
     points = [
         points[i]
@@ -24,6 +35,65 @@ def assign_center(tree, points, centre, subspace_radius):
     return centre, points
 
 
+def out_of_core(
+    scratch: Scratch,
+    pictures,
+    subspace: SubSpace,
+    pixel_width,
+    pixel_height,
+    ray_length,
+    points_density_for_line,
+    subject_radius,
+    subspace_radius,
+    precision,
+) -> MemmapArray:
+    """
+    Runs the ray, point cloud and assignment stages with every intermediate appended to a memmap in the scratch
+    directory and read back in windows, so memory stays bound however large the rig: rays, samples, the camera and
+    pixel each sample came from, and (centre, sample) assignment rows matching assign_center. The rows are then read
+    back into subspace.subspace_assignments, like the in-memory assignment stage fills it.
+    """
+
+    rig = Rig.from_squares(pictures)
+    with stage("rays"):
+        rays = scratch.array("rays", (2, 3), precision)
+        rays.extend(
+            rig_rays(rig, pixel_width, pixel_height, ray_length, dtype=precision)
+        )
+    count("rays", len(rays))
+
+    with stage("point cloud"):
+        point_cloud = scratch.array("samples", (3,), precision)
+        owners = scratch.array("owners", (2,), np.int32)
+        for samples, ids in mesh_samples(
+            rig,
+            pixel_width,
+            pixel_height,
+            ray_length,
+            points_density_for_line,
+            subject_radius,
+            dtype=precision,
+        ):
+            point_cloud.append(samples)
+            owners.append(ids)
+        point_cloud.flush()
+        owners.flush()
+    count("samples_kept", len(point_cloud))
+    count("samples_discarded", len(rays) * points_density_for_line - len(point_cloud))
+
+    with stage("assignment"):
+        assignments = scratch.array("assignments", (2,), np.int64)
+        for centre, indices in ball_query(
+            point_cloud, subspace.centres, subspace_radius * np.sqrt(2)
+        ):
+            assignments.append(
+                np.column_stack((np.full(len(indices), centre), indices))
+            )
+        assignments.flush()
+        load_assignments(subspace, point_cloud, assignments)
+    return point_cloud
+
+
 if __name__ == "__main__":
     subject_radius = 1
     camera_radius = 3
@@ -42,71 +112,147 @@ if __name__ == "__main__":
     subspace_count = 3
     # CPU_COUNT = 1
     CPU_COUNT = cpu_count()
+    # precision = np.float32  # halves ray and sample memory
+    precision = np.float64
+    # scratch_directory = "scratch"  # keep rays and samples on disk for rigs that don't fit in memory
+    scratch_directory = None
+    # report_path = "report.json"  # per-stage timings, counters and peak memory
+    report_path = None
+    # tile_size = 64  # trace full-resolution sensors tile by tile into the SubSpace store, see tracing.trace
+    tile_size = None
 
-    cameras = Points.get_points_at_inclinations(
-        camera_radius, cams_along_inclination, inclinations_range
-    )
-    pictures = Squares.generate_pictures(
-        cameras, focal_length, sensor_width, sensor_height, unit
+    instrumentation = (
+        Instrumentation([MemoryHook("rss")]) if report_path else nullcontext()
     )
+    with instrumentation:
+        with stage("cameras"):
+            cameras = Points.get_points_at_inclinations(
+                camera_radius, cams_along_inclination, inclinations_range
+            )
+            pictures = Squares.generate_pictures(
+                cameras, focal_length, sensor_width, sensor_height, unit
+            )
 
-    # get rays
-    print("getting rays ...")
-    with Pool(CPU_COUNT) as pool:
-        func = partial(
-            picture_to_rays,
-            pixel_width=pixel_width,
-            pixel_height=pixel_height,
-            camera_radius=camera_radius,
-            offset=0.5,
-        )
-        rays_temp = list(tqdm(pool.imap(func, pictures), total=len(pictures)))
-    rays = [ray for sublist in rays_temp for ray in sublist]
-    time.sleep(0.5)
-    print("got rays")
-
-    # point cloud
-    print("getting point cloud ...")
-    with Pool(CPU_COUNT) as pool:
-        func = partial(
-            ray_to_mesh_points,
-            points_density_for_line=points_density_for_line,
-            subject_radius=subject_radius,
-        )
-        point_cloud_temp = list(tqdm(pool.imap(func, rays), total=len(rays)))
-    point_cloud = [point for sublist in point_cloud_temp for point in sublist]
-    time.sleep(0.5)
-    print("got point cloud")
-
-    subspace = SubSpace(subspace_count)
-    coords = [point.array.tolist() for point in point_cloud]
-    subspace_tree = KDTree(coords)
-
-    # subspace assignment
-    print("assigning point cloud ...")
-    # all_close_points = []
-    for subspace_centre in tqdm(subspace.points, desc="Assigning points"):
-        subspace_centre, close_points = assign_center(
-            subspace_tree, point_cloud, subspace_centre, subject_radius / subspace_count
-        )
-        for point in close_points:
-            subspace.subspace_assignments[str(subspace_centre)].add(point)
-        # all_close_points.extend(close_points)
-    time.sleep(0.5)
-    print("assigned point cloud")
-
-    # for k, v in subspace.subspace_assignments.items():
-    #     print(k)
-    #     print(v)
-    #     print("\n")
-
-    print("rendering...")
-    easy_plot(
-        Point.origin(),
-        cameras.elements,
-        subspace,
-        window_size=window_size,
-        subject_radius=subject_radius,
-        show_surface=False,
-    )
-    print("render completed")
+        if tile_size:
+            subspace = SubSpace(subspace_count)
+            if scratch_directory:
+                # (cell, camera, pixel) rows go to disk as tiles finish, so memory is bound by the tiles
+                assignments = stream_assignments(
+                    subspace,
+                    os.path.join(Scratch(scratch_directory).directory, "assignments"),
+                )
+            print("tracing pixel tiles ...")
+            trace(
+                Rig.from_squares(pictures),
+                subspace,
+                pixel_width,
+                pixel_height,
+                camera_radius + 0.5,
+                subject_radius,
+                points_density_for_line,
+                dtype=precision,
+                tile_size=tile_size,
+                processes=CPU_COUNT,
+            )
+            if scratch_directory:
+                assignments.flush()
+                print(f"assignments stored in {scratch_directory}")
+            print("traced pixel tiles")
+        elif scratch_directory:
+            subspace = SubSpace(subspace_count)
+            out_of_core(
+                Scratch(scratch_directory),
+                pictures,
+                subspace,
+                pixel_width,
+                pixel_height,
+                camera_radius + 0.5,
+                points_density_for_line,
+                subject_radius,
+                subject_radius / subspace_count,
+                precision,
+            )
+            print(f"rays, point cloud and assignments stored in {scratch_directory}")
+        else:
+            # get rays
+            print("getting rays ...")
+            with stage("rays"), Pool(CPU_COUNT) as pool:
+                func = partial(
+                    picture_to_rays,
+                    pixel_width=pixel_width,
+                    pixel_height=pixel_height,
+                    camera_radius=camera_radius,
+                    offset=0.5,
+                    dtype=precision,
+                )
+                rays_temp = list(tqdm(pool.imap(func, pictures), total=len(pictures)))
+            rays = [ray for sublist in rays_temp for ray in sublist]
+            count("rays", len(rays))
+            print("got rays")
+
+            # point cloud
+            print("getting point cloud ...")
+            with stage("point cloud"), Pool(CPU_COUNT) as pool:
+                func = partial(
+                    ray_to_mesh_points,
+                    points_density_for_line=points_density_for_line,
+                    subject_radius=subject_radius,
+                    dtype=precision,
+                )
+                point_cloud_temp = list(tqdm(pool.imap(func, rays), total=len(rays)))
+            point_cloud = [point for sublist in point_cloud_temp for point in sublist]
+            count("samples_kept", len(point_cloud))
+            count(
+                "samples_discarded",
+                len(rays) * points_density_for_line - len(point_cloud),
+            )
+            print("got point cloud")
+
+            subspace = SubSpace(subspace_count)
+            with stage("kdtree"):
+                coords = [point.array.tolist() for point in point_cloud]
+                subspace_tree = packages.KDTree(coords)
+
+            # subspace assignment
+            print("assigning point cloud ...")
+            # all_close_points = []
+            with stage("assignment"):
+                for subspace_centre in tqdm(subspace.points, desc="Assigning points"):
+                    subspace_centre, close_points = assign_center(
+                        subspace_tree,
+                        point_cloud,
+                        subspace_centre,
+                        subject_radius / subspace_count,
+                    )
+                    for point in close_points:
+                        subspace.subspace_assignments[str(subspace_centre)].add(point)
+                    # all_close_points.extend(close_points)
+            if report_path:
+                count(
+                    "cells_touched",
+                    sum(
+                        1 for points in subspace.subspace_assignments.values() if points
+                    ),
+                )
+            print("assigned point cloud")
+
+        # for k, v in subspace.subspace_assignments.items():
+        #     print(k)
+        #     print(v)
+        #     print("\n")
+
+        print("rendering...")
+        with stage("rendering"):
+            packages.easy_plot(
+                Point.origin(),
+                cameras.elements,
+                subspace,
+                window_size=window_size,
+                subject_radius=subject_radius,
+                show_surface=False,
+            )
+        print("render completed")
+
+    if report_path:
+        instrumentation.write_report(report_path)
+        print(f"report written to {report_path}")
@@ -1,5 +1,38 @@
+import importlib
+
 from .collections import *
 from .multiprocessing_utils import *
 from .objects import *
-from .rendering import *
 from .utils import *
+from .rendering_constants import RENDERING_ALL
+
+# Heavy optional dependencies are only imported on first use, so that worker processes and short scripts that never
+# plot or query a KDTree don't pay for them. The public names of the rendering module are looked up there.
+LAZY_MODULES = ("rendering",)
+LAZY_ATTRIBUTES = {"KDTree": "scipy.spatial"}
+LAZY_NAMES = (*LAZY_MODULES, *LAZY_ATTRIBUTES, *RENDERING_ALL)
+
+# The lazy names are listed too, so a star import still brings in the rendering functions, loading plotly and scipy.
+__all__ = [
+    name
+    for name in globals()
+    if not name.startswith(("_", "LAZY_"))
+    and name not in ("importlib", "RENDERING_ALL")
+] + [name for name in LAZY_NAMES if name not in globals()]
+
+
+def __getattr__(name: str):
+    if name in LAZY_MODULES:
+        value = importlib.import_module(f"{__name__}.{name}")
+    elif name in LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(LAZY_ATTRIBUTES[name]), name)
+    elif name in RENDERING_ALL:
+        value = getattr(importlib.import_module(f"{__name__}.rendering"), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_NAMES))
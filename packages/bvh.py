@@ -0,0 +1,341 @@
+from typing import Callable, Iterable, List, Optional, Tuple
+import numpy as np
+from packages.objects import Line
+
+DEF_LEAF_SIZE = 16
+DEF_PIECES = 16
+DEF_QUERY_BATCH = 256
+MORTON_BITS = 10
+
+
+def morton_codes(points: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """
+    Returns the Morton codes of (N, 3) points quantised to MORTON_BITS per axis within a box, so that sorting by code
+    keeps nearby points together.
+    """
+
+    scale = (2**MORTON_BITS - 1) / np.maximum(high - low, 1e-12)
+    cells = np.clip((points - low) * scale, 0, 2**MORTON_BITS - 1).astype(np.int32)
+    codes = np.zeros(len(points), dtype=np.int32)
+    for axis in range(3):
+        codes |= spread_bits(cells[:, axis]) << axis
+    return codes
+
+
+def spread_bits(values: np.ndarray) -> np.ndarray:
+    """
+    Spreads the low MORTON_BITS bits of integers two zero bits apart, e.g. 0b111 into 0b1001001.
+    """
+
+    for shift, mask in (
+        (16, 0x30000FF),
+        (8, 0x300F00F),
+        (4, 0x30C30C3),
+        (2, 0x9249249),
+    ):
+        values = (values | (values << shift)) & mask
+    return values
+
+
+def segment_point_distances(
+    starts: np.ndarray, ends: np.ndarray, points: np.ndarray
+) -> np.ndarray:
+    """
+    Returns the distances between paired (..., 3) segments and points.
+    """
+
+    directions = ends - starts
+    lengths = np.einsum("...i,...i->...", directions, directions)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.einsum("...i,...i->...", points - starts, directions) / lengths
+    t = np.clip(np.nan_to_num(t), 0, 1)
+    return np.linalg.norm(points - starts - t[..., None] * directions, axis=-1)
+
+
+def segments_meet_boxes(
+    starts: np.ndarray, ends: np.ndarray, lows: np.ndarray, highs: np.ndarray
+) -> np.ndarray:
+    """
+    Tests whether paired (..., 3) segments pass through axis aligned boxes, with the slab method clipped to the
+    segments.
+    """
+
+    directions = ends - starts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        near = (lows - starts) / directions
+        far = (highs - starts) / directions
+    # a segment parallel to a slab lies inside it everywhere or nowhere
+    parallel = directions == 0
+    outside = np.any(parallel & ((starts < lows) | (starts > highs)), axis=-1)
+    near = np.where(parallel, -np.inf, near)
+    far = np.where(parallel, np.inf, far)
+    enter = np.maximum(np.minimum(near, far).max(axis=-1), 0)
+    exit_ = np.minimum(np.maximum(near, far).min(axis=-1), 1)
+    return (enter <= exit_) & ~outside
+
+
+def point_box_distances(
+    points: np.ndarray, lows: np.ndarray, highs: np.ndarray
+) -> np.ndarray:
+    """
+    Returns the distances between paired (..., 3) points and axis aligned boxes, 0 inside.
+    """
+
+    return np.linalg.norm(points - np.clip(points, lows, highs), axis=-1)
+
+
+class RayBVH:
+    """
+    A bounding volume hierarchy over a fixed set of ray segments, built bottom up in a few vectorised passes.
+
+    Segments are sorted by the Morton code of their midpoints and cut into leaves of leaf_size. Every level above
+    holds the bounding boxes of pairs of nodes of the level below, up to a single root. Queries walk the levels top
+    down for a whole batch at once, keeping the (query, node) pairs whose box passes, and only test the segments of
+    the leaves they reach exactly.
+
+    Parameters:
+    starts, ends (np.ndarray): The (N, 3) end points of the segments, N > 0.
+    ids (np.ndarray): The (N,) ids reported for the segments.
+    leaf_size (int): The number of segments per leaf.
+    """
+
+    def __init__(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        ids: np.ndarray,
+        leaf_size: int = DEF_LEAF_SIZE,
+    ):
+        middles = (starts + ends) / 2
+        order = np.argsort(
+            morton_codes(middles, middles.min(axis=0), middles.max(axis=0))
+        )
+        self.starts, self.ends, self.ids = starts[order], ends[order], ids[order]
+        self.leaf_size = leaf_size
+        leaves = np.arange(0, len(order), leaf_size)
+        self.levels: List[Tuple[np.ndarray, np.ndarray]] = [
+            (
+                np.minimum.reduceat(np.minimum(self.starts, self.ends), leaves),
+                np.maximum.reduceat(np.maximum(self.starts, self.ends), leaves),
+            )
+        ]
+        while len(self.levels[-1][0]) > 1:
+            low, high = self.levels[-1]
+            pairs = np.arange(0, len(low), 2)
+            self.levels.append(
+                (np.minimum.reduceat(low, pairs), np.maximum.reduceat(high, pairs))
+            )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def walk(self, count: int, keep: Callable) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Walks the hierarchy for a batch of queries.
+
+        Parameters:
+        count (int): The number of queries.
+        keep (Callable): Called with (query indices, node lows, node highs) at every level, returning which
+        (query, node) pairs to descend into.
+
+        Returns:
+        Tuple[np.ndarray, np.ndarray]: The query indices and the positions of the segments, in self.starts order, of
+        every leaf the queries reach.
+        """
+
+        queries, nodes = np.arange(count), np.zeros(count, dtype=np.int64)
+        for level in range(len(self.levels) - 1, -1, -1):
+            low, high = self.levels[level]
+            passed = keep(queries, low[nodes], high[nodes])
+            queries, nodes = queries[passed], nodes[passed]
+            if level:
+                queries = np.repeat(queries, 2)
+                nodes = (nodes[:, None] * 2 + [0, 1]).ravel()
+                exists = nodes < len(self.levels[level - 1][0])
+                queries, nodes = queries[exists], nodes[exists]
+        first = nodes * self.leaf_size
+        counts = np.minimum(first + self.leaf_size, len(self)) - first
+        offsets = np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts
+        )
+        return np.repeat(queries, counts), np.repeat(first, counts) + offsets
+
+    def near_points(self, points: np.ndarray, epsilon) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the segments that pass within epsilon of each of the (Q, 3) points.
+
+        Parameters:
+        points (np.ndarray): The (Q, 3) points.
+        epsilon (float or np.ndarray): The distance, for all points or (Q,) for each.
+
+        Returns:
+        Tuple[np.ndarray, np.ndarray]: The point index and segment id of every match.
+        """
+
+        epsilon = np.broadcast_to(epsilon, len(points))
+        queries, positions = self.walk(
+            len(points),
+            lambda queries, low, high: point_box_distances(points[queries], low, high)
+            <= epsilon[queries],
+        )
+        hit = (
+            segment_point_distances(
+                self.starts[positions], self.ends[positions], points[queries]
+            )
+            <= epsilon[queries]
+        )
+        return queries[hit], self.ids[positions[hit]]
+
+    def through_boxes(
+        self, lows: np.ndarray, highs: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the segments that pass through each of the (Q, 3) boxes given by their lower and upper corners.
+
+        Returns:
+        Tuple[np.ndarray, np.ndarray]: The box index and segment id of every match.
+        """
+
+        queries, positions = self.walk(
+            len(lows),
+            lambda queries, low, high: np.all(
+                (low <= highs[queries]) & (lows[queries] <= high), axis=-1
+            ),
+        )
+        hit = segments_meet_boxes(
+            self.starts[positions], self.ends[positions], lows[queries], highs[queries]
+        )
+        return queries[hit], self.ids[positions[hit]]
+
+
+class RayIndex:
+    """
+    A growing index of ray segments answering "which rays pass near this point" and "which rays cross this box".
+
+    Rays are added in batches, e.g. the chunks of export.rig_rays or the lines of Square.to_rays, and kept in a few
+    RayBVH of different sizes: every new batch gets its own hierarchy, which is merged and rebuilt with the last one
+    while that one is no bigger. Adding N rays in any batches rebuilds each ray O(log N) times, and a query visits
+    O(log N) hierarchies.
+
+    Rays run from their camera across the whole subject, so the box of a leaf of whole rays would hold most of the
+    scene. Every ray is therefore indexed as `pieces` equal segments, which keeps leaf boxes tight, and matches are
+    reported once per ray.
+
+    Parameters:
+    leaf_size (int): The number of segments per leaf of every hierarchy.
+    pieces (int): The number of segments every ray is split into.
+    """
+
+    def __init__(self, leaf_size: int = DEF_LEAF_SIZE, pieces: int = DEF_PIECES):
+        self.leaf_size = leaf_size
+        self.pieces = pieces
+        self.trees: List[RayBVH] = []
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, segments: np.ndarray, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Adds a batch of rays.
+
+        Parameters:
+        segments (np.ndarray): The (N, 2, 3) start and end points of the rays.
+        ids (np.ndarray, optional): Their ids, by default the order they were added in, which for rays from
+        export.rig_rays is camera * pixel_width * pixel_height + pixel.
+
+        Returns:
+        np.ndarray: The ids of the added rays.
+        """
+
+        segments = np.asarray(segments, dtype=float).reshape(-1, 2, 3)
+        if ids is None:
+            ids = np.arange(self.count, self.count + len(segments))
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) != len(segments):
+            raise ValueError(f"got {len(ids)} ids for {len(segments)} rays")
+        if not len(segments):
+            return ids
+        self.count += len(segments)
+        cuts = np.linspace(0, 1, self.pieces + 1)[:, None]
+        points = segments[:, :1] + cuts * (segments[:, 1:] - segments[:, :1])
+        starts = points[:, :-1].reshape(-1, 3)
+        ends = points[:, 1:].reshape(-1, 3)
+        merged = np.repeat(ids, self.pieces)
+        while self.trees and len(self.trees[-1]) <= len(starts):
+            tree = self.trees.pop()
+            starts = np.concatenate((tree.starts, starts))
+            ends = np.concatenate((tree.ends, ends))
+            merged = np.concatenate((tree.ids, merged))
+        self.trees.append(RayBVH(starts, ends, merged, self.leaf_size))
+        return ids
+
+    def extend(self, batches: Iterable[np.ndarray]) -> "RayIndex":
+        """
+        Adds every (N, 2, 3) batch of an iterable, e.g. export.rig_rays.
+        """
+
+        for batch in batches:
+            self.add(batch)
+        return self
+
+    def add_lines(
+        self, lines: List[Line], ids: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Adds rays given as Line objects, e.g. from Square.to_rays.
+        """
+
+        return self.add(
+            np.array([[line.start.array, line.end.array] for line in lines]), ids
+        )
+
+    def query(self, run: Callable, *args) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Runs a RayBVH query on every hierarchy, DEF_QUERY_BATCH queries at a time, so that the (query, node) pairs
+        of a walk stay few.
+
+        Parameters:
+        run (Callable): Called with a hierarchy and the batch of every argument, returning (query indices, ids).
+        args (np.ndarray): Per query arguments, split into batches along their first axis.
+        """
+
+        found = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))]
+        for start in range(0, len(args[0]), DEF_QUERY_BATCH):
+            batch = [arg[start : start + DEF_QUERY_BATCH] for arg in args]
+            for tree in self.trees:
+                queries, ids = run(tree, *batch)
+                found.append((queries + start, ids))
+        queries, ids = (np.concatenate(column) for column in zip(*found))
+        order = np.lexsort((ids, queries))
+        queries, ids = queries[order], ids[order]
+        first = np.ones(len(ids), dtype=bool)
+        first[1:] = (queries[1:] != queries[:-1]) | (ids[1:] != ids[:-1])
+        return queries[first], ids[first]
+
+    def near_points(self, points: np.ndarray, epsilon) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the rays that pass within epsilon of each of the (Q, 3) points, epsilon being a float or (Q,) array.
+
+        Returns:
+        Tuple[np.ndarray, np.ndarray]: The point index and ray id of every match, sorted by point then ray.
+        """
+
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        return self.query(
+            RayBVH.near_points, points, np.broadcast_to(epsilon, len(points))
+        )
+
+    def through_boxes(
+        self, lows: np.ndarray, highs: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the rays that pass through each of the (Q, 3) boxes given by their lower and upper corners.
+
+        Returns:
+        Tuple[np.ndarray, np.ndarray]: The box index and ray id of every match, sorted by box then ray.
+        """
+
+        lows = np.asarray(lows, dtype=float).reshape(-1, 3)
+        highs = np.asarray(highs, dtype=float).reshape(-1, 3)
+        return self.query(RayBVH.through_boxes, lows, highs)
@@ -1,21 +1,115 @@
-from typing import List
-from packages.objects import Point, Vector, Square
+from typing import List, Optional
+import numpy as np
+from packages.objects import Point, Vector, Square, Plane
+from packages.utils import (
+    norms,
+    pol_to_cart_arr,
+    pixel_grid,
+    pinhole_from_corners,
+    intrinsic_matrix,
+    world_to_camera,
+    camera_to_world,
+    camera_to_pixel,
+    pixel_to_camera,
+    precision,
+    plane_line_intersection,
+)
+
+GOLDEN_ANGLE = np.pi * (3 - np.sqrt(5))
+# degrees about the x- and then the y-axis, which moves every geodesic point off the poles and the equator
+GEODESIC_TILT = 10
+PHI = (1 + np.sqrt(5)) / 2
+# The fraction of a band the Fibonacci lattice is shifted by. Half a band would put the middle point of an odd count
+# exactly on the equator; this keeps every point at least 0.118 bands off it.
+FIBONACCI_OFFSET = 1 / PHI
+ICOSAHEDRON_VERTICES = np.array(
+    [
+        [-1, PHI, 0],
+        [1, PHI, 0],
+        [-1, -PHI, 0],
+        [1, -PHI, 0],
+        [0, -1, PHI],
+        [0, 1, PHI],
+        [0, -1, -PHI],
+        [0, 1, -PHI],
+        [PHI, 0, -1],
+        [PHI, 0, 1],
+        [-PHI, 0, -1],
+        [-PHI, 0, 1],
+    ]
+)
+ICOSAHEDRON_FACES = np.array(
+    [
+        [0, 11, 5],
+        [0, 5, 1],
+        [0, 1, 7],
+        [0, 7, 10],
+        [0, 10, 11],
+        [1, 5, 9],
+        [5, 11, 4],
+        [11, 10, 2],
+        [10, 7, 6],
+        [7, 1, 8],
+        [3, 9, 4],
+        [3, 4, 2],
+        [3, 2, 6],
+        [3, 6, 8],
+        [3, 8, 9],
+        [4, 9, 5],
+        [2, 4, 11],
+        [6, 2, 10],
+        [8, 6, 7],
+        [9, 8, 1],
+    ]
+)
 
 
 class Points:
     """
     A class representing a collection of points in 3D space.
+
+    The points are kept either as Point objects or as one (N, 3) array, and each form is built from the other on
+    first access, so array-backed collections from the samplers below feed batched code without creating any Point.
     """
 
-    def __init__(self, elements: List[Point]):
+    def __init__(self, elements: List[Point] = None, array: np.ndarray = None):
         """
         Creates a new Points object.
 
         Parameters:
-        elements (List[Point]): A list of Point objects.
+        elements (List[Point], optional): A list of Point objects.
+        array (np.ndarray, optional): The (N, 3) coordinates of the points, instead of elements.
         """
 
-        self.elements = elements
+        if (elements is None) == (array is None):
+            raise ValueError("exactly one of elements and array must be given")
+        self._elements = elements
+        self._array = None if array is None else np.asarray(array, dtype=float)
+
+    @staticmethod
+    def from_array(array: np.ndarray) -> "Points":
+        return Points(array=np.reshape(array, (-1, 3)))
+
+    @property
+    def elements(self) -> List[Point]:
+        if self._elements is None:
+            self._elements = [Point.from_np(point) for point in self._array]
+        return self._elements
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        Returns the (N, 3) coordinates of the points.
+        """
+
+        if self._array is None:
+            self._array = np.array(
+                [point.array for point in self._elements], dtype=float
+            ).reshape(-1, 3)
+        return self._array
+
+    def __len__(self) -> int:
+        return len(self._array) if self._elements is None else len(self._elements)
 
     def __iter__(self):
         """
@@ -24,6 +118,24 @@ class Points:
 
         return iter(self.elements)
 
+    @staticmethod
+    def from_polar(r, inclinations, azimuths, normalise: bool = False) -> "Points":
+        """
+        Creates array-backed points from broadcastable spherical coordinates in degrees.
+
+        Parameters:
+        r (float): The radius, ignored if normalise is True.
+        inclinations, azimuths (np.ndarray): The inclination and azimuth of every point.
+        normalise (bool, optional): Whether to place the points on the unit sphere, defaults to False.
+
+        Returns:
+        Points: The generated Points object.
+        """
+
+        return Points.from_array(
+            pol_to_cart_arr(1 if normalise else r, inclinations, azimuths)
+        )
+
     @staticmethod
     def get_points_at_inclination(
         num_samples: int, incl: float, r: float = 1, normalise: bool = False
@@ -31,6 +143,9 @@ class Points:
         """
         Static method to get a list of points at a certain inclination.
 
+        The points are evenly spaced in azimuth from 0 degrees. Inclinations within 5 degrees of a pole give the pole
+        alone.
+
         Parameters:
         num_samples (int): The number of points to generate.
         incl (float): The inclination angle in degrees.
@@ -38,20 +153,16 @@ class Points:
         normalise (bool, optional): Whether to normalise the points, defaults to False.
 
         Returns:
-        Points: The generated Points object.
+        Points: The generated array-backed Points object.
         """
 
         if incl < 5:
-            points = [Vector.from_polar(r, 0, 0, normalise=normalise).direction]
-        elif 175 < incl:
-            points = [Vector.from_polar(r, 180, 0, normalise=normalise).direction]
-        else:
-            azimuth_samples = [i * 360 / num_samples for i in range(num_samples + 1)]
-            points = [
-                Vector.from_polar(r, incl, azimuth, normalise=normalise).direction
-                for azimuth in azimuth_samples
-            ]
-        return Points(points)
+            return Points.from_polar(r, 0, [0], normalise)
+        if 175 < incl:
+            return Points.from_polar(r, 180, [0], normalise)
+        return Points.from_polar(
+            r, incl, np.arange(num_samples) * 360 / num_samples, normalise
+        )
 
     @staticmethod
     def get_points_at_inclinations(
@@ -73,14 +184,17 @@ class Points:
         Points: A collection of points at the specified inclinations.
         """
 
-        points = [
-            point
-            for inclination in inclinations
-            for point in Points.get_points_at_inclination(
-                num_samples, inclination, r, normalise
+        return Points.from_array(
+            np.concatenate(
+                [
+                    Points.get_points_at_inclination(
+                        num_samples, inclination, r, normalise
+                    ).array
+                    for inclination in inclinations
+                ]
+                or [np.empty((0, 3))]
             )
-        ]
-        return Points(points)
+        )
 
     @staticmethod
     def orbitals(
@@ -104,15 +218,83 @@ class Points:
         Points: A collection of points distributed like atomic orbitals.
         """
 
-        incl_range = range(0, incl_rotations * 360 * density, incl_rotations * 360)
-        azim_range = range(0, azim_rotations * 360 * density, azim_rotations * 360)
-        inclinations = [incl / density for incl in incl_range]
-        azimuths = [azimuth / density for azimuth in azim_range]
-        points = [
-            Vector.from_polar(r, inclination, azimuth, normalise=normalise).end
-            for inclination, azimuth in zip(inclinations, azimuths)
-        ]
-        return Points(points)
+        steps = np.arange(density)
+        return Points.from_polar(
+            r,
+            steps * (incl_rotations * 360) / density,
+            steps * (azim_rotations * 360) / density,
+            normalise,
+        )
+
+    @staticmethod
+    def fibonacci(
+        num_samples: int,
+        r: float = 1,
+        max_inclination: float = 180,
+        normalise: bool = False,
+    ) -> "Points":
+        """
+        Places points almost uniformly over a spherical cap with the Fibonacci lattice: equal area bands in
+        inclination, each turned by the golden angle in azimuth.
+
+        Each point sits FIBONACCI_OFFSET of the way through its band rather than halfway, so no point lands on a pole
+        or the equator, where Squares.generate_pictures can't orient a picture, whatever the number of samples.
+
+        Parameters:
+        num_samples (int): The number of points to generate.
+        r (float, optional): The radius of the sphere, defaults to 1.
+        max_inclination (float, optional): The cap's inclination in degrees, 180 for the whole sphere and 90 for
+        the upper hemisphere.
+        normalise (bool, optional): If True, the points are normalised, defaults to False.
+
+        Returns:
+        Points: The generated array-backed Points object.
+        """
+
+        bottom = np.cos(np.radians(max_inclination))
+        z = 1 - (np.arange(num_samples) + FIBONACCI_OFFSET) * (1 - bottom) / num_samples
+        azimuths = np.degrees(np.arange(num_samples) * GOLDEN_ANGLE) % 360
+        return Points.from_polar(r, np.degrees(np.arccos(z)), azimuths, normalise)
+
+    @staticmethod
+    def geodesic(
+        frequency: int,
+        r: float = 1,
+        max_inclination: float = 180,
+        normalise: bool = False,
+    ) -> "Points":
+        """
+        Places points on the vertices of a geodesic sphere, an icosahedron whose faces are split into frequency**2
+        triangles and pushed out onto the sphere, giving 10 * frequency**2 + 2 near uniform points on the whole sphere.
+
+        The icosahedron is turned by GEODESIC_TILT about two axes so that no point lands on a pole or the equator, where
+        Squares.generate_pictures can't orient a picture.
+
+        Parameters:
+        frequency (int): The number of segments every icosahedron edge is split into.
+        r (float, optional): The radius of the sphere, defaults to 1.
+        max_inclination (float, optional): Points with a greater inclination in degrees are left out.
+        normalise (bool, optional): If True, the points are normalised, defaults to False.
+
+        Returns:
+        Points: The generated array-backed Points object.
+        """
+
+        if frequency < 1:
+            raise ValueError(f"frequency must be at least 1, got {frequency}")
+        i, j = np.triu_indices(frequency + 1)
+        weights = np.column_stack((frequency - j, j - i, i)) / frequency
+        corners = ICOSAHEDRON_VERTICES[ICOSAHEDRON_FACES]
+        points = np.einsum("wk,fkc->fwc", weights, corners).reshape(-1, 3)
+        points /= norms(points)[:, None]
+        _, first = np.unique(np.round(points, 9), axis=0, return_index=True)
+        points = points[np.sort(first)]
+        cos, sin = np.cos(np.radians(GEODESIC_TILT)), np.sin(np.radians(GEODESIC_TILT))
+        about_x = np.array([[1, 0, 0], [0, cos, -sin], [0, sin, cos]])
+        about_y = np.array([[cos, 0, sin], [0, 1, 0], [-sin, 0, cos]])
+        points = points @ (about_y @ about_x).T
+        points = points[points[:, 2] >= np.cos(np.radians(max_inclination)) - 1e-12]
+        return Points.from_array(points if normalise else points * r)
 
 
 class Squares:
@@ -152,11 +334,385 @@ class Squares:
         Square: Many new Square objects representing the pictures of the original Squares as seen from the cameras.
         """
 
+        corners = Squares.picture_corners(
+            points.array,
+            focal_length,
+            width,
+            height,
+            unit,
+        )
+        return [
+            Square(*(Point.from_np(corner) for corner in square), point, index)
+            for index, (point, square) in enumerate(zip(points.elements, corners))
+        ]
+
+    @staticmethod
+    def picture_corners(
+        cameras: np.ndarray,
+        focal_length: float,
+        width: float,
+        height: float,
+        unit: float,
+    ) -> np.ndarray:
+        """
+        Computes the sensor corners Square.generate_picture builds, for many cameras at once.
+
+        Each sensor lies in the plane perpendicular to its camera's position vector, focal_length / 1000 closer to
+        the origin. Its up edge points towards where the z-axis meets that plane, found with one PlaneArray
+        intersection for all cameras; cameras whose plane is parallel to the z-axis get NaN corners, as
+        generate_picture divides by zero there.
+
+        Parameters:
+        cameras (np.ndarray): The (N, 3) camera positions.
+        focal_length, width, height (float): The camera's focal length and sensor size (in mm).
+        unit (float): The unit of length used in the picture (mm).
+
+        Returns:
+        np.ndarray: The (N, 4, 3) corners a, b, c, d of every picture.
+        """
+
+        lengths = np.linalg.norm(cameras, axis=-1, keepdims=True)
+        centres = cameras * (lengths - focal_length / 1000) / lengths
+        planes = PlaneArray.from_normals_and_points(cameras, centres)
+        up, _ = planes.intersect(
+            np.zeros((len(cameras), 3)),
+            np.broadcast_to(Vector.up().direction.array, cameras.shape),
+            paired=True,
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            m_u = up - centres
+            m_u *= height / (2 * unit) / np.linalg.norm(m_u, axis=-1, keepdims=True)
+            m_rl = np.cross(m_u, cameras)
+            m_rl *= width / (2 * unit) / np.linalg.norm(m_rl, axis=-1, keepdims=True)
+        return np.stack(
+            (
+                centres + m_u - m_rl,
+                centres + m_u + m_rl,
+                centres - m_u + m_rl,
+                centres - m_u - m_rl,
+            ),
+            axis=1,
+        )
+
+
+class PlaneArray:
+    """
+    An array-backed collection of planes a*x + b*y + c*z + d = 0, the batched equivalent of a list of Plane.
+
+    The unit normals and offsets of the normalised equations are computed once, so intersecting many lines with
+    many planes is a single NumPy call.
+    """
+
+    def __init__(self, coefficients: np.ndarray):
+        """
+        Creates a new PlaneArray object.
+
+        Parameters:
+        coefficients (np.ndarray): The (N, 4) coefficients [a, b, c, d] of every plane.
+
+        Raises:
+        ValueError: If a, b, and c are all zero for any plane.
+        """
+
+        self.coefficients = np.asarray(coefficients, dtype=float).reshape(-1, 4)
+        lengths = np.linalg.norm(self.coefficients[:, :3], axis=-1)
+        if np.any(lengths == 0):
+            raise ValueError(
+                "Invalid plane: coefficients a, b, and c cannot all be zero."
+            )
+        self.unit_normals = self.coefficients[:, :3] / lengths[:, None]
+        self.offsets = self.coefficients[:, 3] / lengths
+
+    @staticmethod
+    def from_planes(planes: List[Plane]) -> "PlaneArray":
+        return PlaneArray(np.array([plane.coefficients for plane in planes]))
+
+    @staticmethod
+    def from_normals_and_points(
+        normals: np.ndarray, points: np.ndarray
+    ) -> "PlaneArray":
+        """
+        Builds the planes perpendicular to (N, 3) normals through (N, 3) points, like Plane.is_perpendicular_to_at.
+        """
+
+        offsets = -np.einsum("ni,ni->n", normals, points)
+        return PlaneArray(np.column_stack((normals, offsets)))
+
+    def to_planes(self) -> List[Plane]:
+        return [Plane(*coefficients) for coefficients in self.coefficients]
+
+    def __len__(self) -> int:
+        return len(self.coefficients)
+
+    @property
+    def points(self) -> np.ndarray:
+        """
+        Returns the (N, 3) point of every plane closest to the origin.
+        """
+
+        return -self.offsets[:, None] * self.unit_normals
+
+    def signed_distances(self, points: np.ndarray) -> np.ndarray:
+        """
+        Returns the (..., N) signed distances of (..., 3) points to every plane, positive on the normals' side.
+        """
+
+        return np.asarray(points) @ self.unit_normals.T + self.offsets
+
+    def intersect(
+        self, origins: np.ndarray, directions: np.ndarray, paired: bool = False
+    ):
+        """
+        Intersects lines with the planes.
+
+        Parameters:
+        origins, directions (np.ndarray): Points on the lines and their directions, with shape (..., 3), e.g. (M, 3)
+        ray bundles.
+        paired (bool): If True, line i is only intersected with plane i, otherwise every line with every plane.
+
+        Returns:
+        tuple: The (..., N, 3) intersection points ((..., 3) if paired) and the line parameters t, with point =
+        origin + t * direction, both NaN where a line is parallel to its plane.
+        """
+
+        return plane_line_intersection(
+            self.unit_normals, self.offsets, origins, directions, paired
+        )
+
+
+class Rig:
+    """
+    An array-backed collection of pinhole cameras, the batched equivalent of a list of Square pictures.
+
+    Every camera is stored as rows of stacked arrays so that world <-> camera <-> pixel transforms for the whole
+    rig are single NumPy calls. Camera frames follow Square.pinhole: x along a -> b, y along a -> d and z forward.
+    """
+
+    def __init__(
+        self,
+        sources: np.ndarray,
+        rotations: np.ndarray,
+        focals: np.ndarray,
+        widths: np.ndarray,
+        heights: np.ndarray,
+    ):
+        """
+        Creates a new Rig object.
+
+        Parameters:
+        sources (np.ndarray): The (N, 3) camera centres.
+        rotations (np.ndarray): The (N, 3, 3) world to camera rotations.
+        focals (np.ndarray): The (N,) focal distances in world units.
+        widths, heights (np.ndarray): The (N,) sensor sizes in world units.
+        """
+
+        self.sources = np.asarray(sources, dtype=float)
+        self.rotations = np.asarray(rotations, dtype=float)
+        self.translations = -np.einsum("nij,nj->ni", self.rotations, self.sources)
+        self.focals = np.asarray(focals, dtype=float)
+        self.widths = np.asarray(widths, dtype=float)
+        self.heights = np.asarray(heights, dtype=float)
+        self._intrinsics = {}
+
+    def __len__(self):
+        return len(self.sources)
+
+    @staticmethod
+    def from_squares(squares: List[Square]) -> "Rig":
+        """
+        Builds a Rig from pictures, reusing each Square's cached pinhole model.
+
+        Parameters:
+        squares (List[Square]): The pictures, in camera order.
+
+        Returns:
+        Rig: The equivalent array-backed rig.
+        """
+
+        rotations, _, focals, widths, heights = zip(
+            *(square.pinhole for square in squares)
+        )
+        return Rig(
+            np.array([square.source.array for square in squares]),
+            np.array(rotations),
+            np.array(focals),
+            np.array(widths),
+            np.array(heights),
+        )
+
+    @staticmethod
+    def from_cameras(
+        cameras: Points,
+        focal_length: float,
+        width: float,
+        height: float,
+        unit: float,
+    ) -> "Rig":
+        """
+        Builds the Rig of the pictures Squares.generate_pictures would take from the cameras, without building them.
+        """
+
+        sources = cameras.array
+        return Rig.from_corners(
+            Squares.picture_corners(sources, focal_length, width, height, unit),
+            sources,
+        )
+
+    @staticmethod
+    def from_corners(corners: np.ndarray, sources: np.ndarray) -> "Rig":
+        """
+        Builds a Rig from (N, 4, 3) sensor corners ordered a, b, c, d and (N, 3) camera centres.
+        """
+
+        rotations, _, focals, widths, heights = pinhole_from_corners(
+            corners[:, 0], corners[:, 1], corners[:, 3], sources
+        )
+        return Rig(sources, rotations, focals, widths, heights)
+
+    @property
+    def corners(self) -> np.ndarray:
+        """
+        Returns the (N, 4, 3) world sensor corners a, b, c, d of every camera.
+        """
+
+        half_w, half_h = self.widths / 2, self.heights / 2
+        local = np.stack(
+            (
+                np.stack((-half_w, -half_h, self.focals), axis=-1),
+                np.stack((half_w, -half_h, self.focals), axis=-1),
+                np.stack((half_w, half_h, self.focals), axis=-1),
+                np.stack((-half_w, half_h, self.focals), axis=-1),
+            ),
+            axis=1,
+        )
+        return self.camera_to_world(local)
+
+    def to_squares(self) -> List[Square]:
+        """
+        Converts the rig back to scalar Square pictures named by camera index.
+        """
+
         return [
-            Square.generate_picture(point, focal_length, width, height, unit, index)
-            for index, point in enumerate(points.elements)
+            Square(
+                *(Point.from_np(corner) for corner in corners),
+                Point.from_np(source),
+                index,
+            )
+            for index, (corners, source) in enumerate(zip(self.corners, self.sources))
         ]
 
+    def intrinsics(self, pixel_width: int, pixel_height: int) -> np.ndarray:
+        """
+        Returns the cached (N, 3, 3) K matrices of the rig for a given pixel grid.
+        """
+
+        key = (pixel_width, pixel_height)
+        if key not in self._intrinsics:
+            self._intrinsics[key] = intrinsic_matrix(
+                self.focals, self.widths, self.heights, pixel_width, pixel_height
+            )
+        return self._intrinsics[key]
+
+    def world_to_camera(
+        self, points: np.ndarray, cameras: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Transforms world points into camera frames.
+
+        Parameters:
+        points (np.ndarray): (P, 3) points shared by all cameras or (N, P, 3) points per camera.
+        cameras (np.ndarray, optional): Indices of the cameras to use, defaults to all of them.
+
+        Returns:
+        np.ndarray: The (N, P, 3) camera frame points.
+        """
+
+        cameras = slice(None) if cameras is None else cameras
+        return world_to_camera(
+            points, self.rotations[cameras], self.translations[cameras]
+        )
+
+    def camera_to_world(
+        self, points: np.ndarray, cameras: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Transforms (N, P, 3) camera frame points into the world frame.
+        """
+
+        cameras = slice(None) if cameras is None else cameras
+        return camera_to_world(
+            points, self.rotations[cameras], self.translations[cameras]
+        )
+
+    def world_to_pixel(
+        self,
+        points: np.ndarray,
+        pixel_width: int,
+        pixel_height: int,
+        cameras: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Projects world points onto every camera's pixel grid, returning (N, P, 2) continuous (w, h) coordinates.
+        """
+
+        cameras = slice(None) if cameras is None else cameras
+        return camera_to_pixel(
+            self.world_to_camera(points, cameras),
+            self.intrinsics(pixel_width, pixel_height)[cameras],
+        )
+
+    def pixel_to_world(
+        self,
+        pixels: np.ndarray,
+        pixel_width: int,
+        pixel_height: int,
+        depth=None,
+        cameras: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Back-projects (P, 2) or (N, P, 2) pixel coordinates to world points at a camera depth, which defaults to
+        each sensor plane.
+        """
+
+        cameras = slice(None) if cameras is None else cameras
+        depth = self.focals[cameras][:, None] if depth is None else depth
+        return self.camera_to_world(
+            pixel_to_camera(
+                pixels, self.intrinsics(pixel_width, pixel_height)[cameras], depth
+            ),
+            cameras,
+        )
+
+    def pixel_directions(
+        self,
+        pixel_width: int,
+        pixel_height: int,
+        pixels: Optional[np.ndarray] = None,
+        cameras: Optional[np.ndarray] = None,
+        dtype=None,
+    ) -> np.ndarray:
+        """
+        Returns the unit world directions of rays through pixel centres.
+
+        Parameters:
+        pixel_width, pixel_height (int): The pixel grid of every sensor.
+        pixels (np.ndarray, optional): (P, 2) pixel coordinates, defaults to the whole grid in to_pixel_array order.
+        cameras (np.ndarray, optional): Indices of the cameras to use, defaults to all of them.
+        dtype (optional): The dtype of the directions, defaults to the precision setting. They are always computed
+        in float64.
+
+        Returns:
+        np.ndarray: The (N, P, 3) ray directions.
+        """
+
+        cameras = slice(None) if cameras is None else cameras
+        pixels = pixel_grid(pixel_width, pixel_height) if pixels is None else pixels
+        rays = pixel_to_camera(
+            pixels, self.intrinsics(pixel_width, pixel_height)[cameras]
+        )
+        rays /= np.linalg.norm(rays, axis=-1, keepdims=True)
+        return (rays @ self.rotations[cameras]).astype(precision(dtype), copy=False)
+
 
 # class AmbiguousPlanes:
 #     """
@@ -0,0 +1,284 @@
+from typing import List, NamedTuple, Optional, Tuple
+import numpy as np
+from packages.collections import Rig
+from packages.objects import SubSpace, SUBJECT_MARGIN
+from packages.utils import pixel_grid, pixel_to_camera
+
+DEF_TILE_SIZE = 64
+FRUSTUM_PADDING = 0.5
+
+
+class PixelTile(NamedTuple):
+    """
+    A rectangular block of pixels [w0, w1) x [h0, h1) on the sensor of one camera.
+    """
+
+    camera: int
+    w0: int
+    w1: int
+    h0: int
+    h1: int
+
+    @property
+    def size(self) -> int:
+        return (self.w1 - self.w0) * (self.h1 - self.h0)
+
+    def pixels(self) -> np.ndarray:
+        """
+        Returns the (P, 2) pixel coordinates of the tile in to_pixel_array order.
+        """
+
+        return pixel_grid(self.w1 - self.w0, self.h1 - self.h0) + [self.w0, self.h0]
+
+    def pixel_ids(self, pixel_height: int) -> np.ndarray:
+        """
+        Returns the flat ids (w * pixel_height + h) of the tile's pixels, matching the to_pixel_array index.
+        """
+
+        w, h = self.pixels().astype(np.int64).T
+        return w * pixel_height + h
+
+
+class CellRange(NamedTuple):
+    """
+    A box [i0, i1) x [j0, j1) x [k0, k1) of SubSpace cell indices.
+    """
+
+    i0: int
+    i1: int
+    j0: int
+    j1: int
+    k0: int
+    k1: int
+
+    @property
+    def low(self) -> np.ndarray:
+        return np.array([self.i0, self.j0, self.k0])
+
+    @property
+    def high(self) -> np.ndarray:
+        return np.array([self.i1, self.j1, self.k1])
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.high - self.low))
+
+    def bounds(self, subspace: SubSpace) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the world space box covered by the range.
+        """
+
+        low, _ = subspace.bounds
+        return (
+            low + self.low * subspace.cell_size,
+            low + self.high * subspace.cell_size,
+        )
+
+    def cell_ids(self, subspace: SubSpace) -> np.ndarray:
+        """
+        Returns the flat ids of every cell in the range.
+        """
+
+        grid = np.stack(
+            np.meshgrid(
+                *(np.arange(lo, hi) for lo, hi in zip(self.low, self.high)),
+                indexing="ij",
+            ),
+            axis=-1,
+        )
+        return subspace.cell_ids(grid.reshape(-1, 3))
+
+    def contains(self, subspace: SubSpace, cell_ids: np.ndarray) -> np.ndarray:
+        """
+        Tests which of the given cell ids lie inside the range.
+        """
+
+        indices = subspace.cell_indices(cell_ids)
+        return np.all((indices >= self.low) & (indices < self.high), axis=-1)
+
+    def intersection(self, other: "CellRange") -> Optional["CellRange"]:
+        """
+        Returns the cells the two ranges share, or None if they share none.
+        """
+
+        low, high = np.maximum(self.low, other.low), np.minimum(self.high, other.high)
+        if np.any(low >= high):
+            return None
+        return CellRange(low[0], high[0], low[1], high[1], low[2], high[2])
+
+    @staticmethod
+    def of(subspace: SubSpace, cell_ids: np.ndarray) -> Optional["CellRange"]:
+        """
+        Returns the tightest range holding all the given cells, or None if there are none.
+        """
+
+        if not len(cell_ids):
+            return None
+        indices = subspace.cell_indices(cell_ids)
+        low, high = indices.min(axis=0), indices.max(axis=0) + 1
+        return CellRange(low[0], high[0], low[1], high[1], low[2], high[2])
+
+
+def split_tiles(
+    camera: int, pixel_width: int, pixel_height: int, tile_size: int = DEF_TILE_SIZE
+) -> List[PixelTile]:
+    """
+    Splits a camera's sensor into square pixel tiles, the last row and column possibly smaller.
+    """
+
+    return [
+        PixelTile(
+            camera,
+            w0,
+            min(w0 + tile_size, pixel_width),
+            h0,
+            min(h0 + tile_size, pixel_height),
+        )
+        for w0 in range(0, pixel_width, tile_size)
+        for h0 in range(0, pixel_height, tile_size)
+    ]
+
+
+def frustum_planes(
+    rig: Rig,
+    tiles: List[PixelTile],
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    padding: float = FRUSTUM_PADDING,
+) -> np.ndarray:
+    """
+    Builds the view frustum of each tile as six inward facing planes.
+
+    The side planes pass through the camera centre and the tile's outer pixel edges (the pixel centres padded by
+    `padding` pixels), the near plane through the camera centre and the far plane at `ray_length` along the optical
+    axis, which bounds every ray of that length.
+
+    Returns:
+    np.ndarray: A (T, 6, 4) array of [a, b, c, d] coefficients, with a point x inside when a*x + b*y + c*z + d >= 0
+    for all six planes.
+    """
+
+    cameras = np.array([tile.camera for tile in tiles])
+    corners = np.array(
+        [
+            [
+                [tile.w0 - padding, tile.h0 - padding],
+                [tile.w1 - 1 + padding, tile.h0 - padding],
+                [tile.w1 - 1 + padding, tile.h1 - 1 + padding],
+                [tile.w0 - padding, tile.h1 - 1 + padding],
+            ]
+            for tile in tiles
+        ]
+    )
+    directions = pixel_to_camera(
+        corners, rig.intrinsics(pixel_width, pixel_height)[cameras]
+    )
+    sides = np.cross(directions, np.roll(directions, -1, axis=1))
+    forward = np.broadcast_to([0.0, 0.0, 1.0], (len(tiles), 1, 3))
+    normals = (
+        np.concatenate((sides, forward, -forward), axis=1) @ rig.rotations[cameras]
+    )
+    offsets = -np.einsum("tpi,ti->tp", normals, rig.sources[cameras])
+    offsets[:, 5] += ray_length
+    return np.concatenate((normals, offsets[..., None]), axis=-1)
+
+
+def spheres_in_frustums(
+    planes: np.ndarray, centre: np.ndarray, radius: float
+) -> np.ndarray:
+    """
+    Conservatively tests whether a sphere touches each of the (T, 6, 4) frustums.
+    """
+
+    normals, offsets = planes[..., :3], planes[..., 3]
+    distances = normals @ centre + offsets
+    return np.all(distances >= -radius * np.linalg.norm(normals, axis=-1), axis=-1)
+
+
+def boxes_in_frustum(
+    planes: np.ndarray, low: np.ndarray, high: np.ndarray
+) -> np.ndarray:
+    """
+    Conservatively tests which of the (C, 3) axis aligned boxes touch a single (6, 4) frustum.
+    """
+
+    normals, offsets = planes[:, :3], planes[:, 3]
+    centres, halves = (low + high) / 2, (high - low) / 2
+    reach = centres @ normals.T + halves @ np.abs(normals).T + offsets
+    return np.all(reach >= 0, axis=-1)
+
+
+def subdivide(tile: PixelTile, tile_size: int) -> List[PixelTile]:
+    """
+    Halves a tile along each side longer than tile_size, cutting on the tile_size grid so that repeated subdivision
+    ends on exactly the tiles of split_tiles.
+    """
+
+    def cuts(start, end):
+        if end - start <= tile_size:
+            return [(start, end)]
+        middle = start + -(-(end - start) // tile_size // 2) * tile_size
+        return [(start, middle), (middle, end)]
+
+    return [
+        PixelTile(tile.camera, w0, w1, h0, h1)
+        for w0, w1 in cuts(tile.w0, tile.w1)
+        for h0, h1 in cuts(tile.h0, tile.h1)
+    ]
+
+
+def cull(
+    rig: Rig,
+    subspace: SubSpace,
+    pixel_width: int,
+    pixel_height: int,
+    subject_radius: float,
+    ray_length: float,
+    tile_size: int = DEF_TILE_SIZE,
+) -> List[Tuple[PixelTile, CellRange]]:
+    """
+    Culls cameras and pixel tiles that cannot see the subject before any ray is built.
+
+    Each camera's full frustum is first tested against the subject bound and the SubSpace cells inside it. Surviving
+    sensors are then subdivided like a quadtree down to tile_size, every sub-frustum being tested the same way but
+    only against the cells its parent touched, so full resolution sensors cost little more than their visible
+    tiles. Only tiles that touch at least one cell survive, each paired with the tightest range holding those cells.
+
+    Parameters:
+    rig (Rig): The cameras.
+    subspace (SubSpace): The cells rays are assigned to.
+    pixel_width, pixel_height (int): The pixel grid of every sensor.
+    subject_radius (float): The radius of the subject sphere centred at the origin.
+    ray_length (float): The length of every ray from its camera.
+    tile_size (int): The edge of the pixel tiles in pixels.
+
+    Returns:
+    List[Tuple[PixelTile, CellRange]]: The surviving tiles with the cells their rays can reach.
+    """
+
+    bound = subject_radius * SUBJECT_MARGIN
+    origin = np.zeros(3)
+    low, high = subspace.cell_bounds()
+    nearest = np.clip(origin, low, high)
+    subject_cells = np.flatnonzero(np.linalg.norm(nearest, axis=-1) <= bound)
+
+    survivors = []
+    pending = [
+        (PixelTile(camera, 0, pixel_width, 0, pixel_height), subject_cells)
+        for camera in range(len(rig))
+    ]
+    while pending:
+        tile, cells = pending.pop()
+        planes = frustum_planes(rig, [tile], pixel_width, pixel_height, ray_length)
+        if not spheres_in_frustums(planes, origin, bound)[0]:
+            continue
+        cells = cells[boxes_in_frustum(planes[0], low[cells], high[cells])]
+        if not len(cells):
+            continue
+        children = subdivide(tile, tile_size)
+        if len(children) == 1:
+            survivors.append((tile, CellRange.of(subspace, cells)))
+        else:
+            pending.extend((child, cells) for child in reversed(children))
+    return survivors
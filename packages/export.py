@@ -0,0 +1,322 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+from collections.abc import Iterator as StreamIterator
+from typing import BinaryIO, Iterator, List, Tuple
+import numpy as np
+from packages.collections import Rig
+from packages.objects import Point, Vector, Line, Square, SubSpace
+from packages.storage import MemmapArray
+from packages.utils import flatten, precision
+
+DEF_CHUNK_SIZE = 1_000_000
+DEF_COLOUR = (200, 200, 200)
+PLY_COUNT_WIDTH = 20
+
+GLB_MAGIC = 0x46546C67
+GLB_JSON = 0x4E4F534A
+GLB_BIN = 0x004E4942
+GLTF_FLOAT = 5126
+GLTF_UNSIGNED_BYTE = 5121
+GLTF_ARRAY_BUFFER = 34962
+GLTF_POINTS, GLTF_LINES, GLTF_TRIANGLES = 0, 1, 4
+
+
+def chunked(array: np.ndarray, chunk_size: int = DEF_CHUNK_SIZE) -> Iterator:
+    """
+    Yields consecutive windows of an array (or np.memmap) along its first axis.
+    """
+
+    for start in range(0, len(array), chunk_size):
+        yield array[start : start + chunk_size]
+
+
+def count_colours(counts: np.ndarray) -> np.ndarray:
+    """
+    Maps counts to (N, 3) uint8 colours on a blue to red ramp, on a log scale.
+    """
+
+    level = np.log1p(counts)
+    level = level / (level.max() or 1)
+    return np.column_stack(
+        (255 * level, 64 * np.ones_like(level), 255 * (1 - level))
+    ).astype(np.uint8)
+
+
+def subspace_points(
+    subspace: SubSpace, chunk_size: int = DEF_CHUNK_SIZE
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Streams the samples of a SubSpace's assignments, then the centres of the cells in its array store coloured by
+    their number of contributions.
+    """
+
+    for points in subspace.subspace_assignments.values():
+        if points:
+            coords = np.array([point.array for point in points])
+            yield coords, np.tile(np.uint8(DEF_COLOUR), (len(coords), 1))
+    if len(subspace.assignments):
+        counts = np.bincount(
+            subspace.assignments[:, 0], minlength=len(subspace.centres)
+        )
+        seen = np.flatnonzero(counts)
+        colours = count_colours(counts[seen])
+        for start in range(0, len(seen), chunk_size):
+            window = slice(start, start + chunk_size)
+            yield subspace.centres[seen[window]], colours[window]
+
+
+def rig_rays(
+    rig: Rig,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    chunk_size: int = DEF_CHUNK_SIZE,
+    dtype=None,
+) -> Iterator[np.ndarray]:
+    """
+    Streams the rays of every pixel of a rig as (n, 2, 3) start and end points, one camera (or part of one) at a
+    time, without building all rays at once. The points are of the given dtype, the precision setting by default.
+    """
+
+    dtype = precision(dtype)
+
+    pixels = pixel_width * pixel_height
+    for camera in range(len(rig)):
+        for start in range(0, pixels, chunk_size):
+            ids = np.arange(start, min(start + chunk_size, pixels))
+            grid = np.column_stack((ids // pixel_height, ids % pixel_height))
+            directions = rig.pixel_directions(
+                pixel_width, pixel_height, grid.astype(float), [camera], dtype
+            )[0]
+            source = np.broadcast_to(
+                rig.sources[camera].astype(dtype), directions.shape
+            )
+            yield np.stack((source, source + ray_length * directions), axis=1)
+
+
+def scene_chunks(*args, chunk_size: int = DEF_CHUNK_SIZE):
+    """
+    Splits a scene, given like the arguments of easy_plot, into streams of chunks.
+
+    Points, vectors (their end points), SubSpace samples and store cells and (N, 3) arrays become points; lines and
+    (N, 2, 3) arrays become segments; squares become two triangles each. Iterators, e.g. generators from rig_rays
+    or chunked, and MemmapArrays are streamed chunk by chunk and classified by the shape of their chunks.
+
+    Returns:
+    Iterator[Tuple[str, np.ndarray, np.ndarray]]: ("points", coords, colours), ("lines", segments, None) or
+    ("triangles", triangles, None) chunks.
+    """
+
+    args = flatten(args)
+    singles = [
+        arg.array if isinstance(arg, Point) else arg.end.array
+        for arg in args
+        if isinstance(arg, (Point, Vector))
+    ]
+    if singles:
+        yield "points", np.array(singles), np.tile(
+            np.uint8(DEF_COLOUR), (len(singles), 1)
+        )
+    lines = [[arg.start.array, arg.end.array] for arg in args if isinstance(arg, Line)]
+    if lines:
+        yield "lines", np.array(lines), None
+    squares = [
+        [arg.a.array, arg.b.array, arg.c.array, arg.d.array]
+        for arg in args
+        if isinstance(arg, Square)
+    ]
+    if squares:
+        quads = np.array(squares)
+        yield "triangles", quads[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3, 3), None
+
+    for arg in args:
+        if isinstance(arg, SubSpace):
+            for coords, colours in subspace_points(arg, chunk_size):
+                yield "points", coords, colours
+        elif isinstance(arg, np.ndarray):
+            yield from classify(chunked(arg, chunk_size))
+        elif isinstance(arg, MemmapArray):
+            yield from classify(arg.windows(chunk_size))
+        elif isinstance(arg, StreamIterator):
+            yield from classify(arg)
+
+
+def classify(chunks) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        if chunk.ndim == 3:
+            yield "lines", chunk, None
+        else:
+            yield "points", chunk, np.tile(np.uint8(DEF_COLOUR), (len(chunk), 1))
+
+
+def write_ply(path: str, *args, chunk_size: int = DEF_CHUNK_SIZE) -> int:
+    """
+    Streams the points of a scene to a binary little endian PLY point cloud with per vertex colours.
+
+    The vertex count is written as a fixed width placeholder and patched once every chunk has been written, so
+    memory stays constant however many points are exported.
+
+    Parameters:
+    path (str): The file to write.
+    *args: The scene, as accepted by scene_chunks. Lines and triangles are skipped.
+    chunk_size (int): The number of points handled at a time.
+
+    Returns:
+    int: The number of points written.
+    """
+
+    vertex = np.dtype(
+        [("x", "<f4"), ("y", "<f4"), ("z", "<f4")]
+        + [("red", "u1"), ("green", "u1"), ("blue", "u1")]
+    )
+    count = 0
+    with open(path, "wb") as file:
+        file.write(b"ply\nformat binary_little_endian 1.0\nelement vertex ")
+        count_offset = file.tell()
+        file.write(b"0" * PLY_COUNT_WIDTH)
+        file.write(
+            b"\nproperty float x\nproperty float y\nproperty float z\n"
+            b"property uchar red\nproperty uchar green\nproperty uchar blue\n"
+            b"end_header\n"
+        )
+        for kind, coords, colours in scene_chunks(*args, chunk_size=chunk_size):
+            if kind != "points":
+                continue
+            rows = np.empty(len(coords), dtype=vertex)
+            rows["x"], rows["y"], rows["z"] = np.asarray(coords, dtype="<f4").T
+            rows["red"], rows["green"], rows["blue"] = colours.T
+            file.write(rows.tobytes())
+            count += len(rows)
+        file.seek(count_offset)
+        file.write(str(count).zfill(PLY_COUNT_WIDTH).encode())
+    return count
+
+
+class GlbStream:
+    """
+    A vertex attribute being streamed to its own scratch file, with the bounds glTF needs for positions.
+    """
+
+    def __init__(self, directory: str, components: int, dtype: str):
+        self.file: BinaryIO = tempfile.TemporaryFile(dir=directory)
+        self.components, self.dtype = components, np.dtype(dtype)
+        self.count = 0
+        self.low = np.full(components, np.inf)
+        self.high = np.full(components, -np.inf)
+
+    def write(self, values: np.ndarray):
+        values = np.asarray(values).reshape(-1, self.components)
+        if not len(values):
+            return
+        self.file.write(values.astype(self.dtype).tobytes())
+        self.low = np.minimum(self.low, values.min(axis=0))
+        self.high = np.maximum(self.high, values.max(axis=0))
+        self.count += len(values)
+
+    @property
+    def byte_length(self) -> int:
+        return self.count * self.components * self.dtype.itemsize
+
+
+def write_glb(path: str, *args, chunk_size: int = DEF_CHUNK_SIZE) -> None:
+    """
+    Streams a scene to a binary glTF (.glb) file with one mesh per kind: a coloured point cloud, a set of line
+    segments (e.g. rays) and a set of triangles (e.g. pictures).
+
+    Each attribute is streamed to a scratch file beside the output while its count and bounds are tracked, then the
+    JSON chunk is written and the scratch files are copied into the binary chunk, so memory stays constant.
+
+    Parameters:
+    path (str): The file to write.
+    *args: The scene, as accepted by scene_chunks.
+    chunk_size (int): The number of items handled at a time.
+
+    Returns:
+    None
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    positions = {
+        kind: GlbStream(directory, 3, "<f4")
+        for kind in ("points", "lines", "triangles")
+    }
+    colours = GlbStream(directory, 4, "u1")
+    for kind, values, values_colours in scene_chunks(*args, chunk_size=chunk_size):
+        positions[kind].write(values)
+        if kind == "points":
+            colours.write(
+                np.column_stack(
+                    (values_colours, np.full(len(values_colours), 255, np.uint8))
+                )
+            )
+
+    streams: List[GlbStream] = []
+    meshes, accessors, views = [], [], []
+    for kind, mode in (
+        ("points", GLTF_POINTS),
+        ("lines", GLTF_LINES),
+        ("triangles", GLTF_TRIANGLES),
+    ):
+        stream = positions[kind]
+        if not stream.count:
+            continue
+        attributes = {"POSITION": len(accessors)}
+        for attribute in [stream] + ([colours] if kind == "points" else []):
+            accessors.append(
+                {
+                    "bufferView": len(views),
+                    "componentType": GLTF_FLOAT
+                    if attribute is stream
+                    else GLTF_UNSIGNED_BYTE,
+                    "count": attribute.count,
+                    "type": f"VEC{attribute.components}",
+                }
+            )
+            views.append(
+                {
+                    "buffer": 0,
+                    "byteOffset": sum(s.byte_length for s in streams),
+                    "byteLength": attribute.byte_length,
+                    "target": GLTF_ARRAY_BUFFER,
+                }
+            )
+            streams.append(attribute)
+        accessors[attributes["POSITION"]]["min"] = stream.low.tolist()
+        accessors[attributes["POSITION"]]["max"] = stream.high.tolist()
+        if kind == "points":
+            attributes["COLOR_0"] = attributes["POSITION"] + 1
+            accessors[-1]["normalized"] = True
+        meshes.append({"primitives": [{"attributes": attributes, "mode": mode}]})
+
+    binary_length = sum(stream.byte_length for stream in streams)
+    document = {
+        "asset": {"version": "2.0", "generator": "GeomKit"},
+        "scene": 0,
+        "scenes": [{"nodes": list(range(len(meshes)))}],
+        "nodes": [{"mesh": index} for index in range(len(meshes))],
+        "meshes": meshes,
+        "accessors": accessors,
+        "bufferViews": views,
+        "buffers": [{"byteLength": binary_length}] if binary_length else [],
+    }
+    content = json.dumps(document, separators=(",", ":")).encode()
+    content += b" " * (-len(content) % 4)
+    padding = -binary_length % 4
+    total = 12 + 8 + len(content) + (8 + binary_length + padding if streams else 0)
+
+    with open(path, "wb") as file:
+        file.write(struct.pack("<III", GLB_MAGIC, 2, total))
+        file.write(struct.pack("<II", len(content), GLB_JSON))
+        file.write(content)
+        if streams:
+            file.write(struct.pack("<II", binary_length + padding, GLB_BIN))
+            for stream in streams:
+                stream.file.seek(0)
+                shutil.copyfileobj(stream.file, file)
+            file.write(b"\0" * padding)
+    for stream in list(positions.values()) + [colours]:
+        stream.file.close()
@@ -0,0 +1,267 @@
+import cProfile
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+REPORT_VERSION = 1
+STAGE_SEPARATOR = "/"
+MEMORY_MODES = ("tracemalloc", "rss")
+
+# The instrumentation collecting the current run, if any. Every module-level helper checks it first and does nothing
+# else when it is None, so instrumented code costs a global lookup while instrumentation is off.
+ACTIVE: Optional["Instrumentation"] = None
+NULL_STAGE = nullcontext()
+
+
+class Hook:
+    """
+    Something run around every stage, e.g. a memory probe or a profiler.
+
+    start is called when a stage is entered and stop when it is left, in nested order. Whatever stop returns is merged
+    into the stage's entry of the report.
+    """
+
+    def start(self, path: str) -> None:
+        pass
+
+    def stop(self, path: str) -> Optional[dict]:
+        return None
+
+
+class MemoryHook(Hook):
+    """
+    Records the memory high-water mark of every stage.
+
+    With "tracemalloc" the peak of Python allocations (numpy included) while the stage ran is recorded, which is
+    precise but slows allocation heavy code down; tracing is started if it isn't already. With "rss" the peak
+    resident set size of the process so far is recorded, which is free but can only grow.
+    """
+
+    def __init__(self, mode: str = "tracemalloc"):
+        if mode not in MEMORY_MODES:
+            raise ValueError(f"mode must be one of {MEMORY_MODES}, got {mode!r}")
+        if mode == "rss" and resource is None:
+            raise ValueError("rss is not available on this platform")
+        self.mode = mode
+        self.peaks: List[int] = []
+
+    def start(self, path: str) -> None:
+        if self.mode == "rss":
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.peaks:
+            # the parent keeps the peak reached so far, since the child resets it
+            self.peaks[-1] = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+        self.peaks.append(0)
+        tracemalloc.reset_peak()
+
+    def stop(self, path: str) -> dict:
+        if self.mode == "rss":
+            return {"peak_rss_bytes": peak_rss()}
+        peak = max(self.peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if self.peaks:
+            self.peaks[-1] = max(self.peaks[-1], peak)
+        return {"peak_traced_bytes": peak}
+
+
+class ProfileHook(Hook):
+    """
+    Runs cProfile over the outermost stage whose name is in `stages` (every stage if None) and dumps its statistics
+    to "<directory>/<stage path>.prof", readable with pstats or snakeviz.
+
+    Any other profiler can be plugged in the same way by subclassing Hook.
+    """
+
+    def __init__(self, directory: str, stages: Optional[Iterable[str]] = None):
+        self.directory = directory
+        self.stages = None if stages is None else set(stages)
+        self.profiler: Optional[cProfile.Profile] = None
+        self.path: Optional[str] = None
+
+    def start(self, path: str) -> None:
+        name = path.rsplit(STAGE_SEPARATOR, 1)[-1]
+        if self.profiler is not None or (
+            self.stages is not None and name not in self.stages
+        ):
+            return
+        self.profiler, self.path = cProfile.Profile(), path
+        self.profiler.enable()
+
+    def stop(self, path: str) -> Optional[dict]:
+        if path != self.path:
+            return None
+        self.profiler.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        file = os.path.join(
+            self.directory,
+            path.replace(STAGE_SEPARATOR, ".").replace(" ", "_") + ".prof",
+        )
+        self.profiler.dump_stats(file)
+        self.profiler, self.path = None, None
+        return {"profile": file}
+
+
+class Instrumentation:
+    """
+    Collects stage timings, counters and hook results for one run of the pipeline.
+
+    Stages nest: a stage entered inside another is recorded under "<parent>/<name>", and repeated stages are
+    aggregated into a call count and total time. Use it as a context manager to make it the active instrumentation
+    that the module-level stage and count helpers report to.
+
+    Parameters:
+    hooks (Iterable[Hook]): Run around every stage, e.g. MemoryHook() or ProfileHook("profiles").
+    """
+
+    def __init__(self, hooks: Iterable[Hook] = ()):
+        self.hooks = list(hooks)
+        self.stages: Dict[str, dict] = {}
+        self.counters: Dict[str, int] = {}
+        self.path: List[str] = []
+        self.started = time.perf_counter()
+        self.previous: List[Optional[Instrumentation]] = []
+
+    def __enter__(self) -> "Instrumentation":
+        global ACTIVE
+        self.previous.append(ACTIVE)
+        ACTIVE = self
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global ACTIVE
+        ACTIVE = self.previous.pop()
+
+    @contextmanager
+    def stage(self, name: str):
+        self.path.append(name)
+        path = STAGE_SEPARATOR.join(self.path)
+        for hook in self.hooks:
+            hook.start(path)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            results = {}
+            for hook in reversed(self.hooks):
+                results.update(hook.stop(path) or {})
+            self.path.pop()
+            self.record(path, {"calls": 1, "seconds": seconds, **results})
+
+    def record(self, path: str, entry: dict) -> None:
+        """
+        Adds an entry to a stage's aggregate: calls and seconds are summed, other numbers keep their maximum and
+        anything else its latest value.
+        """
+
+        total = self.stages.setdefault(path, {"calls": 0, "seconds": 0.0})
+        for key, value in entry.items():
+            if key in ("calls", "seconds"):
+                total[key] += value
+            elif isinstance(value, (int, float)) and key in total:
+                total[key] = max(total[key], value)
+            else:
+                total[key] = value
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def merge(self, report: dict) -> None:
+        """
+        Folds a report from elsewhere, e.g. a worker process, into this one, nesting its stages under the current one.
+        """
+
+        prefix = "".join(part + STAGE_SEPARATOR for part in self.path)
+        for path, entry in report["stages"].items():
+            self.record(prefix + path, entry)
+        for name, value in report["counters"].items():
+            self.count(name, value)
+
+    def report(self) -> dict:
+        """
+        Returns:
+        dict: A JSON serialisable summary of the run: wall time, stages (by path, in first entry order), counters and
+        the environment.
+        """
+
+        return {
+            "version": REPORT_VERSION,
+            "wall_seconds": time.perf_counter() - self.started,
+            "stages": self.stages,
+            "counters": self.counters,
+            "environment": {
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "pid": os.getpid(),
+                "cpu_count": os.cpu_count(),
+            },
+        }
+
+    def write_report(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=2)
+
+
+class Collected:
+    """
+    Wraps a task so that a worker process runs it under its own Instrumentation and returns the resulting report
+    with the task's result, for the parent to merge.
+    """
+
+    def __init__(self, task):
+        self.task = task
+
+    def __call__(self, item):
+        with Instrumentation() as local:
+            result = self.task(item)
+        return result, local.report()
+
+
+def enabled() -> bool:
+    return ACTIVE is not None
+
+
+def stage(name: str):
+    """
+    Times a block as a stage of the active instrumentation, or does nothing when there is none.
+    """
+
+    return NULL_STAGE if ACTIVE is None else ACTIVE.stage(name)
+
+
+def count(name: str, value: int = 1) -> None:
+    """
+    Adds to a counter of the active instrumentation, or does nothing when there is none.
+    """
+
+    if ACTIVE is not None:
+        ACTIVE.count(name, value)
+
+
+def merge(report: dict) -> None:
+    """
+    Folds a report into the active instrumentation, or does nothing when there is none.
+    """
+
+    if ACTIVE is not None:
+        ACTIVE.merge(report)
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of this process in bytes.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -1,9 +1,30 @@
 from packages.objects import Square, Line
 
+_worker_task = None
 
-def picture_to_rays(picture: Square, pixel_width, pixel_height, camera_radius, offset):
-    return picture.to_rays(pixel_width, pixel_height, camera_radius + offset)
 
+def picture_to_rays(
+    picture: Square, pixel_width, pixel_height, camera_radius, offset, dtype=None
+):
+    return picture.to_rays(pixel_width, pixel_height, camera_radius + offset, dtype)
 
-def ray_to_mesh_points(ray: Line, points_density_for_line, subject_radius):
-    return ray.to_mesh(points_density_for_line, subject_radius)
+
+def ray_to_mesh_points(ray: Line, points_density_for_line, subject_radius, dtype=None):
+    return ray.to_mesh(points_density_for_line, subject_radius, dtype)
+
+
+def ray_to_adaptive_mesh_points(ray: Line, step, subject_radius, dtype=None):
+    return ray.to_adaptive_mesh(step, subject_radius, dtype)
+
+
+def init_worker(task):
+    """
+    Pool initializer that ships a task, with everything bound to it, to a worker once instead of once per item.
+    """
+
+    global _worker_task
+    _worker_task = task
+
+
+def run_worker(item):
+    return _worker_task(item)
@@ -2,10 +2,27 @@ import json
 from collections import defaultdict
 from typing import Optional, Tuple, List
 import numpy as np
-from packages.utils import distance, pol_to_cart, cart_to_pol
+from packages.utils import (
+    norms,
+    pol_to_cart,
+    cart_to_pol,
+    pixel_grid,
+    pinhole_from_corners,
+    intrinsic_matrix,
+    world_to_camera,
+    camera_to_world,
+    camera_to_pixel,
+    pixel_to_camera,
+    precision,
+    PRECISIONS,
+    plane_line_intersection,
+)
 
 
 NORMALISE_DEFAULT = True
+SUBJECT_MARGIN = 1.2
+ASSIGNMENT_DTYPE = np.int32
+DEF_NYQUIST_FACTOR = 2
 
 
 class Point:
@@ -13,6 +30,8 @@ class Point:
     This class represents a 3D point in space. The point is defined by three coordinates (a, b, c).
     """
 
+    __slots__ = ("array", "name")
+
     def __init__(self, a: float, b: float, c: float, name: str = None) -> None:
         """
         Constructor for a Point object.
@@ -26,6 +45,15 @@ class Point:
         self.array = np.array([a, b, c])
         self.name = name
 
+    def __reduce__(self):
+        """
+        Pickles the Point as its raw coordinates, which is what multiprocessing ships the most of.
+        """
+
+        if self.array.dtype == np.float64:
+            return Point, (*self.array.tolist(), self.name)
+        return Point.from_np, (self.array, self.name)
+
     def __str__(self):
         """
         Returns a string representation of the Point.
@@ -95,7 +123,7 @@ class Point:
         float: The magnitude of the Point.
         """
 
-        return distance(*self.array)
+        return norms(self.array)
 
     @staticmethod
     def from_np(abc: np.ndarray, name: str = None):
@@ -206,7 +234,18 @@ class Point:
         Vector: A new Vector object that represents the Point.
         """
 
-        return Vector(*self.array, start_point=Point.origin(), normalise=normalise)
+        return Vector(*self.array, start_point=ORIGIN, normalise=normalise)
+
+
+# Shared points for defaults and axes, read only since every Vector without a start point refers to ORIGIN.
+ORIGIN = Point(0, 0, 0)
+RIGHT = Point(1, 0, 0)
+FORWARD = Point(0, 1, 0)
+UP = Point(0, 0, 1)
+ORIGIN.array.flags.writeable = False
+RIGHT.array.flags.writeable = False
+FORWARD.array.flags.writeable = False
+UP.array.flags.writeable = False
 
 
 class Line:
@@ -214,6 +253,8 @@ class Line:
     A class representing a line in 3D space, defined by a start point and an end point.
     """
 
+    __slots__ = ("start", "end", "name")
+
     def __init__(
         self,
         start_point: Optional[Point] = None,
@@ -232,6 +273,9 @@ class Line:
         self.end = end_point
         self.name = name
 
+    def __reduce__(self):
+        return Line, (self.start, self.end, self.name)
+
     @staticmethod
     def from_(start_point: Point) -> "AmbiguousLine":
         """
@@ -285,23 +329,60 @@ class Line:
         float: The length of the line.
         """
 
-        return distance(*(self.end.array - self.start.array))
+        return norms(self.end.array - self.start.array)
 
-    def to_mesh(self, density: int, subject_radius: float) -> List[Point]:
+    def to_mesh(self, density: int, subject_radius: float, dtype=None) -> List[Point]:
         x1, y1, z1 = self.start.array
         x2, y2, z2 = self.end.array
+        dtype = precision(dtype)
         points = np.column_stack(
             (
-                np.linspace(x1, x2, density),
-                np.linspace(y1, y2, density),
-                np.linspace(z1, z2, density),
+                np.linspace(x1, x2, density, dtype=dtype),
+                np.linspace(y1, y2, density, dtype=dtype),
+                np.linspace(z1, z2, density, dtype=dtype),
             )
         )
-        points = [Point.from_np(point, self.name) for point in points]
-        points = [
-            point for point in points if distance(*point.array) < (subject_radius * 1.2)
+        points = points[norms(points) < (subject_radius * SUBJECT_MARGIN)]
+        return [Point.from_np(point, self.name) for point in points]
+
+    def to_adaptive_mesh(
+        self, step: float, subject_radius: float, dtype=None
+    ) -> List[Point]:
+        """
+        Samples the line every `step` from its start point, like to_mesh but with a fixed spacing instead of a fixed
+        count, and only along its chord through the subject bound.
+
+        Parameters:
+        step (float): The distance between neighbouring samples, e.g. SubSpace.step_length().
+        subject_radius (float): The radius of the subject sphere centred at the origin.
+        dtype (optional): The dtype of the samples, defaults to the precision setting.
+
+        Returns:
+        List[Point]: The samples inside the subject bound, named after the line, none for a line of zero length.
+
+        Raises:
+        ValueError: If step isn't positive.
+        """
+
+        if not step > 0:
+            raise ValueError(f"step must be positive, got {step}")
+        start, direction = self.start.array, self.end.array - self.start.array
+        length = norms(direction)
+        if length == 0:
+            return []
+        direction = direction / length
+        radius = subject_radius * SUBJECT_MARGIN
+        b = np.dot(direction, start)
+        discriminant = b**2 - (np.dot(start, start) - radius**2)
+        if discriminant < 0:
+            return []
+        enter = max(-b - np.sqrt(discriminant), 0)
+        exit_ = min(-b + np.sqrt(discriminant), length)
+        distances = np.arange(np.ceil(enter / step), np.floor(exit_ / step) + 1) * step
+        points = (start + distances[:, None] * direction).astype(precision(dtype))
+        return [
+            Point.from_np(point, self.name) for point in points[norms(points) < radius]
         ]
-        return points
 
     def with_name(self, name: str):
         self.name = name
@@ -342,6 +423,8 @@ class Vector:
     This class represents a 3D vector in space. A vector is defined by its direction and start point.
     """
 
+    __slots__ = ("direction", "start")
+
     def __init__(
         self,
         x: float,
@@ -357,7 +440,7 @@ class Vector:
         x (float): x-direction of the vector.
         y (float): y-direction of the vector.
         z (float): z-direction of the vector.
-        start_point (Optional[Point]): The start point of the vector. If None, the start point is the origin.
+        start_point (Optional[Point]): The start point of the vector. If None, the start point is the shared ORIGIN.
         normalise (bool): If True, the created vector is normalised to have a length of 1.
 
         Raises:
@@ -366,12 +449,16 @@ class Vector:
 
         try:
             self.direction = Point(
-                *(np.array([x, y, z]) / (distance(x, y, z) if normalise else 1))
+                *(np.array([x, y, z]) / (norms([x, y, z]) if normalise else 1))
             )
-            self.start = start_point if start_point is not None else Point.origin()
+            self.start = start_point if start_point is not None else ORIGIN
         except ZeroDivisionError:
             raise ZeroDivisionError("Vector must have non-zero length")
 
+    def __reduce__(self):
+        start = None if self.start is ORIGIN else self.start
+        return Vector, (*self.direction.array.tolist(), start, False)
+
     def __neg__(self):
         """
         Defines the negation of a Vector object, reversing its direction.
@@ -450,7 +537,7 @@ class Vector:
         Vector: A new Vector object in the right direction.
         """
 
-        return Vector(*Point.right().array)
+        return Vector(*RIGHT.array)
 
     @staticmethod
     def forward():
@@ -461,7 +548,7 @@ class Vector:
         Vector: A new Vector object in the forward direction.
         """
 
-        return Vector(*Point.forward().array)
+        return Vector(*FORWARD.array)
 
     @staticmethod
     def up():
@@ -472,7 +559,7 @@ class Vector:
         Vector: A new Vector object in the up direction.
         """
 
-        return Vector(*Point.up().array)
+        return Vector(*UP.array)
 
     @property
     def magnitude(self) -> float:
@@ -483,7 +570,7 @@ class Vector:
         float: The magnitude of the vector.
         """
 
-        return distance(*self.direction.array)
+        return norms(self.direction.array)
 
     @property
     def end(self) -> Point:
@@ -655,6 +742,8 @@ class Square:
     A class representing a square in 3D space, defined by four points.
     """
 
+    __slots__ = ("a", "b", "c", "d", "source", "name", "_pinhole", "_intrinsics")
+
     def __init__(
         self,
         a: Point,
@@ -675,6 +764,123 @@ class Square:
         self.a, self.b, self.c, self.d = a, b, c, d
         self.source = source_point
         self.name = name
+        self._pinhole = None
+        self._intrinsics = {}
+
+    def __reduce__(self):
+        """
+        Pickles the Square as its corners and source, leaving the pinhole caches to be rebuilt on demand.
+        """
+
+        return Square, (self.a, self.b, self.c, self.d, self.source, self.name)
+
+    @property
+    def pinhole(self) -> Tuple[np.ndarray, np.ndarray, float, float, float]:
+        """
+        The cached pinhole model of the camera that took this picture. It is computed from the corners on first
+        access, which already encode the focal length, sensor size and unit the picture was generated with, so
+        the corners must not be mutated afterwards.
+
+        Returns:
+        tuple: The rotation R (3, 3), translation t (3,), focal distance, sensor width and sensor height in world
+        units, such that a world point p maps to R @ p + t in camera coordinates.
+        """
+
+        if self._pinhole is None:
+            self._pinhole = pinhole_from_corners(
+                self.a.array, self.b.array, self.d.array, self.source.array
+            )
+        return self._pinhole
+
+    @property
+    def rotation(self) -> np.ndarray:
+        return self.pinhole[0]
+
+    @property
+    def translation(self) -> np.ndarray:
+        return self.pinhole[1]
+
+    def intrinsics(self, pixel_width: int, pixel_height: int) -> np.ndarray:
+        """
+        Returns the cached K matrix of the camera for a given pixel grid.
+
+        Parameters:
+        pixel_width (int): The number of pixels along a -> b.
+        pixel_height (int): The number of pixels along a -> d.
+
+        Returns:
+        np.ndarray: The (3, 3) intrinsic matrix.
+        """
+
+        key = (pixel_width, pixel_height)
+        if key not in self._intrinsics:
+            _, _, focal, width, height = self.pinhole
+            self._intrinsics[key] = intrinsic_matrix(
+                focal, width, height, pixel_width, pixel_height
+            )
+        return self._intrinsics[key]
+
+    def world_to_camera(self, points: np.ndarray) -> np.ndarray:
+        """
+        Transforms (P, 3) world points into the camera frame.
+        """
+
+        return world_to_camera(points, self.rotation, self.translation)
+
+    def camera_to_world(self, points: np.ndarray) -> np.ndarray:
+        """
+        Transforms (P, 3) camera frame points into the world frame.
+        """
+
+        return camera_to_world(points, self.rotation, self.translation)
+
+    def world_to_pixel(
+        self, points: np.ndarray, pixel_width: int, pixel_height: int
+    ) -> np.ndarray:
+        """
+        Projects (P, 3) world points onto the pixel grid, returning (P, 2) continuous (w, h) pixel coordinates.
+        """
+
+        return camera_to_pixel(
+            self.world_to_camera(points), self.intrinsics(pixel_width, pixel_height)
+        )
+
+    def pixel_to_world(
+        self, pixels: np.ndarray, pixel_width: int, pixel_height: int, depth=None
+    ) -> np.ndarray:
+        """
+        Back-projects (P, 2) pixel coordinates to world points at a given camera depth.
+
+        Parameters:
+        pixels (np.ndarray): The (w, h) pixel coordinates.
+        pixel_width, pixel_height (int): The pixel grid the coordinates refer to.
+        depth (float or np.ndarray, optional): Depth along the optical axis, defaults to the sensor plane.
+
+        Returns:
+        np.ndarray: The (P, 3) world points.
+        """
+
+        depth = self.pinhole[2] if depth is None else depth
+        return self.camera_to_world(
+            pixel_to_camera(pixels, self.intrinsics(pixel_width, pixel_height), depth)
+        )
+
+    def pixel_directions(
+        self, pixel_width: int, pixel_height: int, dtype=None
+    ) -> np.ndarray:
+        """
+        Returns the unit world directions of the rays through every pixel centre, in to_pixel_array order.
+
+        Returns:
+        np.ndarray: A (pixel_width * pixel_height, 3) array of the given dtype, defaulting to the precision setting.
+        """
+
+        rays = pixel_to_camera(
+            pixel_grid(pixel_width, pixel_height),
+            self.intrinsics(pixel_width, pixel_height),
+        )
+        rays /= np.linalg.norm(rays, axis=-1, keepdims=True)
+        return (rays @ self.rotation).astype(precision(dtype), copy=False)
 
     @staticmethod
     def generate_picture(
@@ -711,10 +917,11 @@ class Square:
         m_rl = Vector.cross_product(m_u, camera.vector()).change_size_to(
             width / (2 * unit)
         )
-        a = center.move_by(m_u).move_by(-m_rl)
-        b = center.move_by(m_u).move_by(m_rl)
-        c = center.move_by(-m_u).move_by(m_rl)
-        d = center.move_by(-m_u).move_by(-m_rl)
+        centre, up, side = center.array, m_u.direction.array, m_rl.direction.array
+        a = Point(*(centre + up - side))
+        b = Point(*(centre + up + side))
+        c = Point(*(centre - up + side))
+        d = Point(*(centre - up - side))
         return Square(a, b, c, d, camera, name)
 
     def to_mesh(self):
@@ -733,27 +940,32 @@ class Square:
         z = matrix[2].tolist()
         return x, y, z
 
-    def to_pixel_array(self, pixel_width, pixel_height) -> List[Point]:
-        width_steps = np.linspace(0, 1, pixel_width)
-        height_steps = np.linspace(0, 1, pixel_height)
-        pixels = []
-        for w_ind, ws in enumerate(width_steps):
-            for h_ind, hs in enumerate(height_steps):
-                top = (1 - ws) * self.a.array + ws * self.b.array
-                bottom = (1 - ws) * self.d.array + ws * self.c.array
-                pixel = (1 - hs) * top + hs * bottom
-                pixels.append(
-                    Point.from_np(pixel, f"img_{self.name} w_{w_ind} h_{h_ind}")
-                )
-        return pixels
-
-    def to_rays(self, pixel_width, pixel_height, ray_length: float) -> List[Line]:
-        pixels = self.to_pixel_array(pixel_width, pixel_height)
+    def pixel_names(self, pixel_width, pixel_height) -> List[str]:
         return [
-            (
-                Line.from_(self.source).to(pixel).vector(True) * ray_length
-            ).line.with_name(pixel.name)
-            for pixel in pixels
+            f"img_{self.name} w_{w_ind} h_{h_ind}"
+            for w_ind in range(pixel_width)
+            for h_ind in range(pixel_height)
+        ]
+
+    def to_pixel_array(self, pixel_width, pixel_height, dtype=None) -> List[Point]:
+        pixels = self.pixel_to_world(
+            pixel_grid(pixel_width, pixel_height), pixel_width, pixel_height
+        ).astype(precision(dtype), copy=False)
+        return [
+            Point.from_np(pixel, name)
+            for pixel, name in zip(pixels, self.pixel_names(pixel_width, pixel_height))
+        ]
+
+    def to_rays(
+        self, pixel_width, pixel_height, ray_length: float, dtype=None
+    ) -> List[Line]:
+        ends = self.source.array + ray_length * self.pixel_directions(
+            pixel_width, pixel_height, np.float64
+        )
+        ends = ends.astype(precision(dtype), copy=False)
+        return [
+            Line(self.source, Point.from_np(end), name)
+            for end, name in zip(ends, self.pixel_names(pixel_width, pixel_height))
         ]
 
 
@@ -819,15 +1031,14 @@ class Plane:
         Point: The point of intersection.
         """
 
-        a, b, c, d = self.coefficients
-        plane_normal = np.array([a, b, c])
-        plane_point = -d * plane_normal / (np.linalg.norm(plane_normal) ** 2)
-        vector_direction = vector.direction.array
-        vector_point = vector.start.array
-        t = np.dot((plane_point - vector_point), plane_normal) / np.dot(
-            vector_direction, plane_normal
+        point, _ = plane_line_intersection(
+            self.coefficients[None, :3],
+            self.coefficients[None, 3],
+            vector.start.array,
+            vector.direction.array,
+            paired=True,
         )
-        return Point.from_np(t * vector_direction + vector_point)
+        return Point.from_np(point[0])
 
     def to_mesh(self, plane_size: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
@@ -872,6 +1083,121 @@ class SubSpace:
                 for y in length_division
                 for z in length_division
             ]
+        self.divisions = subspace_divisions
+        self.length = length
+        self.centres = (
+            np.zeros((1, 3))
+            if subspace_divisions == 1
+            else np.array(self.points, dtype=float)
+        )
+        self.assignment_chunks = []
+        # an object with append(rows) and an array property, e.g. a storage.MemmapArray, see
+        # storage.stream_assignments
+        self.assignment_sink = None
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.divisions, self.divisions, self.divisions
+
+    @property
+    def cell_size(self) -> float:
+        """
+        The edge length of the cubic cell around each centre, i.e. the spacing between neighbouring centres.
+        """
+
+        return self.length / (self.divisions - 1) if self.divisions > 1 else self.length
+
+    def step_length(self, nyquist_factor: float = DEF_NYQUIST_FACTOR) -> float:
+        """
+        Returns the spacing of samples along rays that resolves every cell, i.e. nyquist_factor samples per cell edge.
+        """
+
+        return self.cell_size / nyquist_factor
+
+    @property
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the lower and upper corners of the axis aligned box covered by all cells.
+        """
+
+        half = (
+            (self.length + self.cell_size) / 2
+            if self.divisions > 1
+            else self.length / 2
+        )
+        return np.full(3, -half), np.full(3, half)
+
+    def cell_ids(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Converts (..., 3) integer (x, y, z) cell indices to flat cell ids, in the order of self.points.
+        """
+
+        return np.ravel_multi_index(tuple(np.moveaxis(indices, -1, 0)), self.shape)
+
+    def cell_indices(self, cell_ids: np.ndarray) -> np.ndarray:
+        """
+        Converts flat cell ids to (..., 3) integer (x, y, z) cell indices.
+        """
+
+        return np.stack(np.unravel_index(cell_ids, self.shape), axis=-1)
+
+    def cell_bounds(self, cell_ids: Optional[np.ndarray] = None):
+        """
+        Returns the lower and upper corners of the boxes of the given cells, defaulting to all of them.
+        """
+
+        centres = self.centres if cell_ids is None else self.centres[cell_ids]
+        return centres - self.cell_size / 2, centres + self.cell_size / 2
+
+    def locate(self, points: np.ndarray) -> np.ndarray:
+        """
+        Finds the cell containing each of the (..., 3) points.
+
+        Returns:
+        np.ndarray: The flat cell ids, -1 for points outside every cell.
+        """
+
+        low, _ = self.bounds
+        points = np.asarray(points)
+        low = low.astype(points.dtype) if points.dtype in PRECISIONS else low
+        indices = np.floor((points - low) / self.cell_size).astype(np.int64)
+        inside = np.all((indices >= 0) & (indices < self.divisions), axis=-1)
+        ids = self.cell_ids(np.clip(indices, 0, self.divisions - 1))
+        return np.where(inside, ids, -1)
+
+    def add_assignments(
+        self, cells: np.ndarray, cameras: np.ndarray, pixels: np.ndarray
+    ) -> None:
+        """
+        Appends a batch of (cell, camera, pixel) contributions to the array-backed assignment store, in memory, or
+        to the assignment sink when one is set.
+        """
+
+        if len(cells):
+            rows = np.column_stack(np.broadcast_arrays(cells, cameras, pixels)).astype(
+                ASSIGNMENT_DTYPE
+            )
+            if self.assignment_sink is None:
+                self.assignment_chunks.append(rows)
+            else:
+                self.assignment_sink.append(rows)
+
+    @property
+    def assignments(self) -> np.ndarray:
+        """
+        Returns every stored contribution as an (K, 3) array of [cell, camera, pixel] rows, read from the sink when
+        one is set, e.g. a read only np.memmap.
+        """
+
+        if self.assignment_sink is not None:
+            return self.assignment_sink.array
+        if len(self.assignment_chunks) != 1:
+            self.assignment_chunks = [
+                np.concatenate(self.assignment_chunks)
+                if self.assignment_chunks
+                else np.empty((0, 3), dtype=ASSIGNMENT_DTYPE)
+            ]
+        return self.assignment_chunks[0]
 
     def json(self):
         json.load()
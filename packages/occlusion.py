@@ -0,0 +1,322 @@
+from functools import partial
+from multiprocessing import Pool
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import numpy as np
+from packages.collections import Rig
+from packages.culling import PixelTile, CellRange, DEF_TILE_SIZE, cull
+from packages.instrumentation import Collected, count, enabled, merge, stage
+from packages.multiprocessing_utils import init_worker, run_worker
+from packages.objects import SubSpace, SUBJECT_MARGIN
+from packages.tracing import clip_rays, ray_samples, store_assignments
+from packages.utils import norms, pixel_grid, precision
+
+
+class DepthBuffer(NamedTuple):
+    """
+    The first occupied cell every pixel ray of one camera meets, in pixel id (w * pixel_height + h) order.
+
+    depths: The distance from the camera to where the ray enters that cell, inf for rays that meet none.
+    cells: Its flat cell id, -1 for rays that meet none.
+    """
+
+    depths: np.ndarray
+    cells: np.ndarray
+
+    @property
+    def hit(self) -> np.ndarray:
+        return self.cells >= 0
+
+
+def voxelise_sphere(
+    subspace: SubSpace, radius: float, centre: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Returns the (C,) occupancy of a solid sphere, the cells whose centre lies within radius of its centre, the origin
+    by default.
+    """
+
+    centre = np.zeros(3) if centre is None else np.asarray(centre)
+    return norms(subspace.centres - centre) <= radius
+
+
+def first_hits(
+    origin: np.ndarray,
+    directions: np.ndarray,
+    subspace: SubSpace,
+    occupancy: np.ndarray,
+    ray_length: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Walks rays through the SubSpace grid cell by cell until they meet an occupied cell, for all rays at once.
+
+    Every ray is clipped to the grid box and stepped with the 3D DDA of Amanatides and Woo: each step moves it into
+    the neighbouring cell across the nearest cell face, so it visits exactly the cells it crosses, in order. Rays
+    that hit, leave the grid or pass ray_length drop out after each step, so a step costs as much as the rays still
+    walking and there are at most 3 * subspace.divisions steps.
+
+    Parameters:
+    origin (np.ndarray): The (3,) shared start of the rays.
+    directions (np.ndarray): The (R, 3) unit ray directions.
+    occupancy (np.ndarray): The (C,) occupancy of every cell, in cell id order.
+    ray_length (float): The length of every ray.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The (R,) distances at which the rays enter their first occupied cell and its
+    cell id, inf and -1 for rays that meet none.
+    """
+
+    occupancy = np.asarray(occupancy, dtype=bool).reshape(-1)
+    directions = np.asarray(directions, dtype=np.float64)
+    depths = np.full(len(directions), np.inf)
+    cells = np.full(len(directions), -1, dtype=np.int64)
+    low, high = subspace.bounds
+    enter, exit_ = clip_rays(origin, directions, low, high, np.inf, ray_length)
+    walking = np.flatnonzero(enter <= exit_)
+    if not occupancy.any() or not len(walking):
+        return depths, cells
+
+    size, divisions = subspace.cell_size, subspace.divisions
+    rays, t, end = directions[walking], enter[walking], exit_[walking]
+    index = np.floor((origin + t[:, None] * rays - low) / size)
+    index = np.clip(index, 0, divisions - 1).astype(np.int64)
+    steps = np.sign(rays).astype(np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        deltas = np.where(rays != 0, size / np.abs(rays), np.inf)
+        faces = low + (index + (steps > 0)) * size
+        crossings = np.where(rays != 0, (faces - origin) / rays, np.inf)
+
+    while len(walking):
+        ids = subspace.cell_ids(index)
+        hit = occupancy[ids]
+        depths[walking[hit]], cells[walking[hit]] = t[hit], ids[hit]
+        rows = np.arange(len(walking))
+        axis = np.argmin(crossings, axis=1)
+        t = crossings[rows, axis]
+        index[rows, axis] += steps[rows, axis]
+        crossings[rows, axis] += deltas[rows, axis]
+        go = ~hit & (t <= end) & np.all((index >= 0) & (index < divisions), axis=-1)
+        walking, t, end, index = walking[go], t[go], end[go], index[go]
+        steps, deltas, crossings = steps[go], deltas[go], crossings[go]
+    return depths, cells
+
+
+def depth_buffer(
+    rig: Rig,
+    subspace: SubSpace,
+    occupancy: np.ndarray,
+    camera: int,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    dtype=None,
+) -> DepthBuffer:
+    """
+    Computes the first hit of every pixel ray of one camera against an occupancy grid in one vectorised walk, see
+    first_hits.
+    """
+
+    directions = rig.pixel_directions(
+        pixel_width,
+        pixel_height,
+        pixel_grid(pixel_width, pixel_height),
+        [camera],
+        dtype,
+    )[0]
+    return DepthBuffer(
+        *first_hits(rig.sources[camera], directions, subspace, occupancy, ray_length)
+    )
+
+
+def occluded_tile(
+    rig: Rig,
+    subspace: SubSpace,
+    tile: PixelTile,
+    cell_range: CellRange,
+    buffer: DepthBuffer,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    density: Optional[int],
+    subject_radius: float,
+    step: Optional[float] = None,
+    dtype=None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Traces the rays of one pixel tile like tracing.trace_tile, stopping every ray at its first occupied cell.
+
+    Chords are cut at the depth of each ray's first hit, so samples are only built in front of it. The free cells
+    those samples fall in are assigned, and so is the hit cell itself, however briefly the ray crosses it.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The flat cell ids and pixel ids of every distinct (cell, pixel) pair.
+    """
+
+    dtype = precision(dtype)
+    origin = rig.sources[tile.camera]
+    directions = rig.pixel_directions(
+        pixel_width, pixel_height, tile.pixels(), [tile.camera], dtype
+    )[0]
+    pixels = tile.pixel_ids(pixel_height)
+    depths, first = buffer.depths[pixels], buffer.cells[pixels]
+    bound = subject_radius * SUBJECT_MARGIN
+    low, high = cell_range.bounds(subspace)
+    enter, exit_ = clip_rays(origin, directions, low, high, bound, ray_length)
+    exit_ = np.minimum(exit_, depths)
+    ahead = enter <= exit_
+    count("rays", len(ahead))
+    count("rays_occluded", (first >= 0).sum())
+
+    samples, ray = ray_samples(
+        origin, directions[ahead], enter[ahead], exit_[ahead], ray_length, density, step
+    )
+    distances = np.einsum(
+        "si,si->s", samples - origin.astype(samples.dtype), directions[ahead][ray]
+    )
+    in_front = distances < depths[ahead][ray]
+    cells = subspace.locate(samples)
+    keep = in_front & (np.linalg.norm(samples, axis=-1) < bound) & (cells >= 0)
+    keep[keep] = cell_range.contains(subspace, cells[keep])
+    count("samples_kept", keep.sum())
+    count("samples_discarded", len(keep) - keep.sum())
+
+    hit = first >= 0
+    hit[hit] = cell_range.contains(subspace, first[hit])
+    cells = np.concatenate((cells[keep], first[hit]))
+    pixels = np.concatenate((pixels[ahead][ray][keep], pixels[hit]))
+    pairs = np.unique(cells * (pixel_width * pixel_height) + pixels)
+    return pairs // (pixel_width * pixel_height), pairs % (pixel_width * pixel_height)
+
+
+def occluded_camera(
+    item: Tuple[int, List[Tuple[PixelTile, CellRange]]],
+    rig: Rig,
+    subspace: SubSpace,
+    occupancy: np.ndarray,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    **kwargs,
+) -> Tuple[int, np.ndarray, np.ndarray]:
+    """
+    Builds one camera's depth buffer and traces its culled tiles against it.
+    """
+
+    camera, pairs = item
+    with stage("depth_buffer"):
+        buffer = depth_buffer(
+            rig,
+            subspace,
+            occupancy,
+            camera,
+            pixel_width,
+            pixel_height,
+            ray_length,
+            kwargs.get("dtype"),
+        )
+    found = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))]
+    with stage("occluded_tile"):
+        for tile, cell_range in pairs:
+            found.append(
+                occluded_tile(
+                    rig,
+                    subspace,
+                    tile,
+                    cell_range,
+                    buffer,
+                    pixel_width,
+                    pixel_height,
+                    ray_length,
+                    **kwargs,
+                )
+            )
+    cells, pixels = (np.concatenate(column) for column in zip(*found))
+    return camera, cells, pixels
+
+
+def trace_occluded(
+    rig: Rig,
+    subspace: SubSpace,
+    occupancy: np.ndarray,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    subject_radius: float,
+    density: Optional[int] = None,
+    step: Optional[float] = None,
+    dtype=None,
+    tile_size: int = DEF_TILE_SIZE,
+    processes: int = 1,
+    on_assignments: Optional[Callable] = None,
+) -> SubSpace:
+    """
+    Assigns the pixels of every camera to the SubSpace cells they see like tracing.trace, except that a ray stops at
+    the first occupied cell it meets: cells behind an opaque one are hidden from that pixel.
+
+    Each camera first gets a DepthBuffer over its whole pixel grid from one vectorised walk through the occupancy
+    grid. Its culled tiles are then traced only up to each ray's first hit, see occluded_tile, so both the samples
+    per ray and the assignment shrink with how much of the subject is solid. With no occupied cell the result is
+    that of tracing.trace.
+
+    Parameters:
+    occupancy (np.ndarray): The (C,) occupancy of every cell in cell id order, or the (n, n, n) grid, e.g.
+    voxelise_sphere(subspace, subject_radius).
+    processes (int): The number of worker processes, each handling whole cameras, 1 to run in this process.
+
+    See tracing.trace for the other parameters.
+
+    Returns:
+    SubSpace: The given subspace, for chaining.
+    """
+
+    if density is None and step is None:
+        raise ValueError("density or step is required")
+    occupancy = np.asarray(occupancy, dtype=bool).reshape(-1)
+    if len(occupancy) != len(subspace.centres):
+        raise ValueError(
+            f"occupancy has {len(occupancy)} cells, the SubSpace {len(subspace.centres)}"
+        )
+    with stage("cull"):
+        pairs = cull(
+            rig,
+            subspace,
+            pixel_width,
+            pixel_height,
+            subject_radius,
+            ray_length,
+            tile_size,
+        )
+    count("tiles", len(pairs))
+    cameras = {}
+    for tile, cell_range in pairs:
+        cameras.setdefault(tile.camera, []).append((tile, cell_range))
+    task = partial(
+        occluded_camera,
+        rig=rig,
+        subspace=SubSpace(subspace.divisions, subspace.length),
+        occupancy=occupancy,
+        pixel_width=pixel_width,
+        pixel_height=pixel_height,
+        ray_length=ray_length,
+        density=density,
+        subject_radius=subject_radius,
+        step=step,
+        dtype=precision(dtype),
+    )
+    with stage("assign"):
+        if processes == 1:
+            for camera, cells, pixels in map(task, cameras.items()):
+                store_assignments(subspace, cells, camera, pixels, on_assignments)
+        else:
+            collect = enabled()
+            with Pool(
+                processes,
+                initializer=init_worker,
+                initargs=(Collected(task) if collect else task,),
+            ) as pool:
+                for result in pool.imap_unordered(run_worker, cameras.items()):
+                    if collect:
+                        result, report = result
+                        merge(report)
+                    camera, cells, pixels = result
+                    store_assignments(subspace, cells, camera, pixels, on_assignments)
+    return subspace
@@ -0,0 +1,408 @@
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+from packages.export import DEF_CHUNK_SIZE
+from packages.objects import SUBJECT_MARGIN
+from packages.tracing import clip_rays
+
+DEF_PROBES = 4096
+PROBE_SAMPLES = 1_000_000  # samples held at once while probing
+DEF_RAY_OFFSET = 0.5
+TILE_SIZES = (256, 128, 64, 32, 16, 8)
+ASSIGNMENT_BYTES = 12  # one (cell, camera, pixel) int32 row of the array store
+EXPORT_POINT_BYTES = 64  # coords, colours and the PLY row of one exported point
+PROCESS_BYTES = 64 * 2**20  # the resident size of an idle interpreter with numpy
+
+# Measured on a single core with benchmarks/stages.py and Calibration.from_benchmarks. Seconds and bytes per item of
+# each stage, the items being those counted by predict_counts.
+DEF_CALIBRATION = {
+    "cameras": {"seconds_per_item": 1.1e-5, "bytes_per_item": 4.0e2},
+    "pictures": {"seconds_per_item": 2.0e-4, "bytes_per_item": 2.2e3},
+    "rays": {"seconds_per_item": 9.2e-6, "bytes_per_item": 4.1e2},
+    "mesh": {"seconds_per_item": 5.8e-6, "bytes_per_item": 8.8e1},
+    "kdtree": {"seconds_per_item": 3.0e-6, "bytes_per_item": 2.0e2},
+    "assignment": {"seconds_per_item": 2.8e-7, "bytes_per_item": 2.4},
+    "trace": {"seconds_per_item": 3.1e-6, "bytes_per_item": 2.8e1},
+    "figure": {"seconds_per_item": 7.6e-6, "bytes_per_item": 1.8e2},
+}
+
+# The benchmark stages (benchmarks/stages.py) each planner stage is calibrated from.
+BENCHMARK_STAGES = {
+    "Points.get_points_at_inclinations": "cameras",
+    "Squares.generate_pictures": "pictures",
+    "Square.to_rays": "rays",
+    "Line.to_mesh": "mesh",
+    "subspace assignment (KDTree)": "assignment",
+    "subspace assignment (tracing.trace)": "trace",
+    "easy_plot figure build": "figure",
+}
+
+
+class RunParameters(NamedTuple):
+    """
+    The parameters of a run, named as in main.py.
+    """
+
+    camera_radius: float
+    cams_along_inclination: int
+    inclinations: List[float]
+    pixel_width: int
+    pixel_height: int
+    points_density_for_line: int
+    subspace_count: int
+    subject_radius: float = 1
+    focal_length: float = 50
+    sensor_width: float = 36
+    sensor_height: float = 24
+    unit: float = 1_000
+    ray_offset: float = DEF_RAY_OFFSET
+    subspace_length: float = 1
+
+    @property
+    def ray_length(self) -> float:
+        return self.camera_radius + self.ray_offset
+
+    @property
+    def cameras(self) -> int:
+        """
+        The number of cameras Points.get_points_at_inclinations places: one at a pole, num_samples elsewhere.
+        """
+
+        return sum(
+            1 if incl < 5 or 175 < incl else self.cams_along_inclination
+            for incl in self.inclinations
+        )
+
+    @property
+    def rays(self) -> int:
+        return self.cameras * self.pixel_width * self.pixel_height
+
+    @property
+    def cells(self) -> int:
+        return self.subspace_count**3
+
+
+class RayStatistics(NamedTuple):
+    """
+    Per ray means over the probe rays of one camera.
+    """
+
+    hit_fraction: float  # rays crossing the subject bound within the SubSpace grid
+    kept_samples: float  # Line.to_mesh samples inside the subject bound
+    traced_samples: float  # samples tracing.trace builds along the clipped chord
+    cells: float  # distinct SubSpace cells the samples fall in
+
+
+class StagePlan(NamedTuple):
+    name: str
+    items: int
+    bytes: int
+    seconds: float
+
+
+class Plan(NamedTuple):
+    """
+    The predicted cost of a run and the settings chosen for it.
+
+    stages holds one entry per stage, legacy (Pool + KDTree) and tiled tracing alike. peak_bytes is the largest
+    resident size of the tiled pipeline with the chosen tile_size and processes, fits whether that is within the
+    memory cap, and legacy_fits the same for the legacy pipeline, which holds every ray and sample at once.
+    """
+
+    parameters: RunParameters
+    statistics: RayStatistics
+    stages: List[StagePlan]
+    tile_size: int
+    processes: int
+    chunk_size: int
+    peak_bytes: int
+    legacy_peak_bytes: int
+    fits: bool
+    legacy_fits: bool
+
+    def stage(self, name: str) -> StagePlan:
+        return next(stage for stage in self.stages if stage.name == name)
+
+    def report(self) -> dict:
+        """
+        Returns:
+        dict: A JSON serialisable version of the plan.
+        """
+
+        report = self._asdict()
+        report["parameters"] = self.parameters._asdict()
+        report["statistics"] = self.statistics._asdict()
+        report["stages"] = [stage._asdict() for stage in self.stages]
+        return report
+
+
+def probe_directions(params: RunParameters, probes: int, seed: int) -> np.ndarray:
+    """
+    Returns unit ray directions of one camera looking down +z at the origin, through every pixel centre when there
+    are no more than `probes` pixels and through `probes` random pixel centres otherwise.
+
+    Every camera sits at camera_radius and looks at the origin, so the subject and the SubSpace grid look the same
+    from each of them, up to rotation.
+    """
+
+    pixels = params.pixel_width * params.pixel_height
+    if pixels <= probes:
+        ids = np.arange(pixels)
+    else:
+        ids = np.random.default_rng(seed).integers(0, pixels, probes)
+    w, h = ids // params.pixel_height, ids % params.pixel_height
+    x = (w / max(params.pixel_width - 1, 1) - 0.5) * params.sensor_width / params.unit
+    y = (h / max(params.pixel_height - 1, 1) - 0.5) * params.sensor_height / params.unit
+    directions = np.column_stack((x, y, np.full(len(ids), params.focal_length / 1000)))
+    return directions / np.linalg.norm(directions, axis=-1, keepdims=True)
+
+
+def ray_statistics(
+    params: RunParameters, probes: int = DEF_PROBES, seed: int = 0
+) -> RayStatistics:
+    """
+    Estimates per ray sample and cell counts by Monte Carlo over the pixels of a single camera, without building
+    any camera, picture or ray object.
+    """
+
+    origin = np.array([0.0, 0.0, -params.camera_radius])
+    directions = probe_directions(params, probes, seed)
+    bound = params.subject_radius * SUBJECT_MARGIN
+    density = params.points_density_for_line
+    step = params.ray_length / max(density - 1, 1)
+
+    divisions, length = params.subspace_count, params.subspace_length
+    cell_size = length / (divisions - 1) if divisions > 1 else length
+    half = (length + cell_size) / 2 if divisions > 1 else length / 2
+    enter, exit_ = clip_rays(
+        origin,
+        directions,
+        np.full(3, -half),
+        np.full(3, half),
+        bound,
+        params.ray_length,
+    )
+    hit = enter <= exit_
+    first = np.where(hit, np.floor(enter / step), 0)
+    last = np.where(hit, np.ceil(exit_ / step), -1)
+    traced = last - first + 1
+
+    # the Line.to_mesh samples of a batch of rays at a time
+    t = np.arange(density) * step
+    batch = max(PROBE_SAMPLES // density, 1)
+    kept, cells = 0, 0
+    for start in range(0, len(directions), batch):
+        samples = origin + directions[start : start + batch, None, :] * t[:, None]
+        inside = np.linalg.norm(samples, axis=-1) < bound
+        kept += inside.sum()
+        indices = np.floor((samples + half) / cell_size).astype(np.int64)
+        inside &= np.all((indices >= 0) & (indices < divisions), axis=-1)
+        ids = np.ravel_multi_index(
+            tuple(np.moveaxis(np.clip(indices, 0, divisions - 1), -1, 0)),
+            (divisions,) * 3,
+        )
+        ray = np.broadcast_to(np.arange(len(ids))[:, None], ids.shape)
+        cells += len(np.unique(ray[inside] * divisions**3 + ids[inside]))
+
+    return RayStatistics(
+        hit_fraction=float(hit.mean()),
+        kept_samples=kept / len(directions),
+        traced_samples=float(traced.mean()),
+        cells=cells / len(directions),
+    )
+
+
+def predict_counts(params: RunParameters, statistics: RayStatistics) -> Dict[str, int]:
+    """
+    Returns the number of items each stage handles, in the units the calibration is expressed in.
+    """
+
+    samples = params.rays * statistics.kept_samples
+    return {
+        "cameras": params.cameras,
+        "pictures": params.cameras,
+        "rays": params.rays,
+        "mesh": params.rays * params.points_density_for_line,
+        "kdtree": int(samples),
+        # every SubSpace centre queries the whole tree
+        "assignment": int(params.cells * samples),
+        "trace": int(params.rays * statistics.traced_samples),
+        "figure": int(samples),
+    }
+
+
+def choose_settings(
+    params: RunParameters,
+    statistics: RayStatistics,
+    calibration: Dict[str, dict],
+    memory_cap: Optional[int],
+    max_processes: int,
+) -> tuple:
+    """
+    Picks the largest tile size and most processes whose tiled tracing fits the memory cap, preferring processes.
+
+    Returns:
+    tuple: (tile_size, processes, peak_bytes, fits)
+    """
+
+    store = params.rays * statistics.cells * ASSIGNMENT_BYTES
+    per_sample = calibration["trace"]["bytes_per_item"]
+
+    def peak(tile_size, processes):
+        tile = tile_size**2 * statistics.traced_samples * per_sample
+        workers = processes * (PROCESS_BYTES + tile) if processes > 1 else tile
+        return int(PROCESS_BYTES + store + workers)
+
+    options = [
+        (tile_size, processes)
+        for processes in range(max_processes, 0, -1)
+        for tile_size in TILE_SIZES
+    ]
+    for tile_size, processes in options:
+        if memory_cap is None or peak(tile_size, processes) <= memory_cap:
+            return tile_size, processes, peak(tile_size, processes), True
+    tile_size, processes = TILE_SIZES[-1], 1
+    return tile_size, processes, peak(tile_size, processes), False
+
+
+def plan(
+    params: RunParameters,
+    memory_cap: Optional[int] = None,
+    max_processes: Optional[int] = None,
+    calibration: Optional[Dict[str, dict]] = None,
+    probes: int = DEF_PROBES,
+    seed: int = 0,
+) -> Plan:
+    """
+    Predicts per stage item counts, memory and time of a run from its parameters alone, and picks the tile size,
+    number of processes and export chunk size that fit a memory cap.
+
+    Parameters:
+    params (RunParameters): The run.
+    memory_cap (int, optional): The memory available in bytes, unlimited if None.
+    max_processes (int, optional): The most worker processes to use, os.cpu_count() if None.
+    calibration (dict, optional): Seconds and bytes per item of each stage, DEF_CALIBRATION if None, e.g. from
+    Calibration.from_benchmarks.
+    probes (int): The number of pixel rays sampled to estimate the per ray statistics.
+    seed (int): The seed of the pixel sampling.
+
+    Returns:
+    Plan: The prediction, with tile_size and processes for tracing.trace and chunk_size for packages.export.
+    """
+
+    calibration = DEF_CALIBRATION if calibration is None else calibration
+    max_processes = max_processes or os.cpu_count() or 1
+    statistics = ray_statistics(params, probes, seed)
+    counts = predict_counts(params, statistics)
+    tile_size, processes, peak_bytes, fits = choose_settings(
+        params, statistics, calibration, memory_cap, max_processes
+    )
+
+    stages = []
+    for name, items in counts.items():
+        cost = calibration[name]
+        seconds = items * cost["seconds_per_item"]
+        stages.append(
+            StagePlan(
+                name,
+                items,
+                int(items * cost["bytes_per_item"]),
+                seconds / processes if name == "trace" else seconds,
+            )
+        )
+    plans = {stage.name: stage for stage in stages}
+    # the legacy pipeline holds every ray, sample and the tree at once
+    legacy_peak_bytes = PROCESS_BYTES + sum(
+        plans[name].bytes for name in ("rays", "mesh", "kdtree")
+    )
+    store = params.rays * statistics.cells * ASSIGNMENT_BYTES
+    chunk_size = DEF_CHUNK_SIZE
+    if memory_cap is not None:
+        spare = memory_cap - PROCESS_BYTES - store
+        chunk_size = int(np.clip(spare // EXPORT_POINT_BYTES, 1, DEF_CHUNK_SIZE))
+
+    return Plan(
+        parameters=params,
+        statistics=statistics,
+        stages=stages,
+        tile_size=tile_size,
+        processes=processes,
+        chunk_size=chunk_size,
+        peak_bytes=peak_bytes,
+        legacy_peak_bytes=int(legacy_peak_bytes),
+        fits=fits,
+        legacy_fits=memory_cap is None or legacy_peak_bytes <= memory_cap,
+    )
+
+
+class Calibration:
+    """
+    Builds per item costs from measured runs.
+    """
+
+    @staticmethod
+    def from_benchmarks(results: dict, probes: int = DEF_PROBES) -> Dict[str, dict]:
+        """
+        Calibrates from the output of benchmarks/stages.py: each case's item counts are predicted from its parameters
+        and divided into its measured time and peak memory, and the median over a stage's cases is kept.
+
+        Parameters:
+        results (dict): The JSON results, keyed by case.
+        probes (int): The number of probe rays per case.
+
+        Returns:
+        Dict[str, dict]: The calibration, with DEF_CALIBRATION filling stages the results don't cover.
+        """
+
+        costs: Dict[str, List[tuple]] = {}
+        for result in results.values():
+            name = BENCHMARK_STAGES.get(result["stage"])
+            if name is None or "params" not in result:
+                continue
+            case = result["params"]
+            params = RunParameters(
+                camera_radius=case["camera_radius"],
+                cams_along_inclination=case["cams_along_inclination"],
+                inclinations=case["inclinations"],
+                pixel_width=case["pixels"][0],
+                pixel_height=case["pixels"][1],
+                points_density_for_line=case["density"],
+                subspace_count=case["subspace_count"],
+                subject_radius=case["subject_radius"],
+                focal_length=case["focal_length"],
+                sensor_width=case["sensor_width"],
+                sensor_height=case["sensor_height"],
+                unit=case["unit"],
+            )
+            items = predict_counts(params, ray_statistics(params, probes))[name]
+            if items:
+                costs.setdefault(name, []).append(
+                    (result["seconds"] / items, result["peak_bytes"] / items)
+                )
+
+        calibration = {name: dict(cost) for name, cost in DEF_CALIBRATION.items()}
+        for name, values in costs.items():
+            seconds, bytes_ = np.median(values, axis=0)
+            calibration[name] = {
+                "seconds_per_item": float(seconds),
+                "bytes_per_item": float(bytes_),
+            }
+        return calibration
+
+    @staticmethod
+    def load(path: str) -> Dict[str, dict]:
+        """
+        Loads a calibration saved with Calibration.save, or calibrates from benchmark results.
+        """
+
+        with open(path) as file:
+            data = json.load(file)
+        if all(name in DEF_CALIBRATION for name in data):
+            return data
+        return Calibration.from_benchmarks(data)
+
+    @staticmethod
+    def save(calibration: Dict[str, dict], path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(calibration, file, indent=2)
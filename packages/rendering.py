@@ -1,14 +1,30 @@
+import asyncio
+import os
+import queue
 import random
+import threading
+import time
 import typing
 
 import numpy as np
 import plotly.graph_objects as go
 from enum import Enum
-from typing import List
+from typing import List, Optional, Tuple
 from packages.objects import Point, Plane, Vector, Square, Line, SubSpace
+from packages.rendering_constants import (
+    DEF_WINDOW_SIZE,
+    RAND_COLOURSCALE,
+    DEF_POINT_BUDGET,
+    MAX_SPLAT_SCALE,
+    LOD_ITERATIONS,
+    LOD_FILL,
+    DEF_REFRESH_INTERVAL,
+    RENDERING_ALL,
+)
+from packages.storage import MemmapArray, DEF_WINDOW
 from packages.utils import flatten
 
-DEF_WINDOW_SIZE = 5
+__all__ = list(RENDERING_ALL)
 
 
 def rand_colour():
@@ -59,72 +75,355 @@ class Axis(Enum):
         fig.add_trace(Axis.Z.get(window_size))
 
 
+def separated(segments: np.ndarray) -> np.ndarray:
+    """
+    Joins (L, V, 3) polylines into one (L * (V + 1), 3) array with a row of NaNs closing each polyline, which plotly
+    draws as breaks between them.
+    """
+
+    gaps = np.full((len(segments), 1, 3), np.nan)
+    return np.concatenate((segments, gaps), axis=1).reshape(-1, 3)
+
+
+def grid_triangles(rows: int, columns: int, count: int) -> np.ndarray:
+    """
+    Returns the (count * 2 * (rows - 1) * (columns - 1), 3) vertex indices triangulating `count` stacked
+    rows x columns vertex grids.
+    """
+
+    r, c = np.meshgrid(np.arange(rows - 1), np.arange(columns - 1), indexing="ij")
+    top_left = (r * columns + c).ravel()
+    quads = np.stack(
+        (top_left, top_left + 1, top_left + columns + 1, top_left + columns), axis=-1
+    )
+    triangles = np.concatenate((quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]))
+    offsets = np.arange(count)[:, None, None] * rows * columns
+    return (triangles + offsets).reshape(-1, 3)
+
+
+def voxel_downsample(
+    coords: np.ndarray, voxel_size: float, weights: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Replaces all the points falling in the same cube of a voxel_size grid by their (weighted) mean.
+
+    Parameters:
+    coords (np.ndarray): The (N, 3) points.
+    voxel_size (float): The edge of the grid cubes.
+    weights (np.ndarray, optional): The (N,) weight of each point, defaults to 1.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The (M, 3) representative points and the (M,) summed weights they stand for.
+    """
+
+    weights = np.ones(len(coords)) if weights is None else weights
+    keys = np.floor(coords / voxel_size).astype(np.int64)
+    keys -= keys.min(axis=0)
+    dims = keys.max(axis=0) + 1
+    packed = (keys[:, 0] * dims[1] + keys[:, 1]) * dims[2] + keys[:, 2]
+    _, inverse = np.unique(packed, return_inverse=True)
+    totals = np.bincount(inverse, weights)
+    means = np.column_stack([np.bincount(inverse, weights * axis) for axis in coords.T])
+    return means / totals[:, None], totals
+
+
+def level_of_detail(
+    coords: np.ndarray, point_budget: int, weights: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decimates a point cloud to at most point_budget points, picking the finest voxel grid that fits the budget.
+
+    Starting from a grid with about point_budget cubes over the cloud's extent, the voxel size is doubled or halved
+    until the budget is bracketed and then bisected until at least LOD_FILL of the budget is used, so surfaces and
+    volumes both end up near the budget.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The representative points and the summed weights (point counts by default)
+    they stand for.
+    """
+
+    weights = np.ones(len(coords)) if weights is None else weights
+    if len(coords) <= point_budget:
+        return coords, weights
+    extent = np.ptp(coords, axis=0).max() or 1
+    voxel_size = extent / np.cbrt(point_budget)
+    too_fine, too_coarse, best = None, None, None
+    for _ in range(LOD_ITERATIONS):
+        decimated = voxel_downsample(coords, voxel_size, weights)
+        if len(decimated[0]) > point_budget:
+            too_fine = voxel_size
+        else:
+            too_coarse, best = voxel_size, decimated
+            if len(decimated[0]) >= point_budget * LOD_FILL:
+                break
+        if too_fine is None:
+            voxel_size /= 2
+        elif too_coarse is None:
+            voxel_size *= 2
+        else:
+            voxel_size = np.sqrt(too_fine * too_coarse)
+    if best is None:
+        keep = np.random.choice(len(coords), point_budget, replace=False)
+        best = coords[keep], weights[keep] * len(coords) / point_budget
+    return best
+
+
+def windowed_level_of_detail(
+    windows: typing.Iterable[np.ndarray], point_budget: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decimates a point cloud read one window at a time, e.g. from MemmapArray.windows, to at most point_budget points.
+
+    Every window is decimated on its own and merged with the points kept so far, which are decimated again, with
+    their weights, whenever they exceed twice the budget, so memory is bound by the window and the budget.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The representative points and the point counts they stand for.
+    """
+
+    coords, weights = np.empty((0, 3)), np.empty(0)
+    for window in windows:
+        kept, counts = level_of_detail(np.asarray(window, dtype=float), point_budget)
+        coords = np.concatenate((coords, kept))
+        weights = np.concatenate((weights, counts))
+        if len(coords) > 2 * point_budget:
+            coords, weights = level_of_detail(coords, point_budget, weights)
+    return level_of_detail(coords, point_budget, weights)
+
+
+def splat_sizes(counts: np.ndarray, marker_size: float) -> np.ndarray:
+    """
+    Scales markers standing for many points by the cube root of their count, up to MAX_SPLAT_SCALE times.
+    """
+
+    return marker_size * np.clip(np.cbrt(counts), 1, MAX_SPLAT_SCALE)
+
+
 def handle_lines(
     fig, lines: List[Line], line_thickness: float, line_opacity: float = 0.5
 ):
-    for line in lines:
-        sx, sy, sz = line.start.array
-        ex, ey, ez = line.end.array
-        fig.add_trace(
-            go.Scatter3d(
-                x=[sx, ex],
-                y=[sy, ey],
-                z=[sz, ez],
-                mode="lines",
-                line=dict(color=rand_colour(), width=line_thickness),
-                opacity=line_opacity,
-            )
+    if not lines:
+        return
+    segments = np.array([[line.start.array, line.end.array] for line in lines])
+    x, y, z = separated(segments).T
+    fig.add_trace(
+        go.Scatter3d(
+            x=x,
+            y=y,
+            z=z,
+            mode="lines",
+            line=dict(
+                color=np.repeat(np.random.rand(len(lines)), 3),
+                colorscale=RAND_COLOURSCALE,
+                width=line_thickness,
+            ),
+            opacity=line_opacity,
         )
+    )
 
 
 def handle_points(
-    fig, points: List[Point], marker_size: float, consistent_colouring: bool = False
+    fig,
+    points: List[Point],
+    marker_size: float,
+    consistent_colouring: bool = False,
+    point_budget: Optional[int] = None,
 ):
-    def_colour = rand_colour()
-    for point in points:
-        x, y, z = point.array
+    if not points:
+        return
+    coords = np.array([point.array for point in points])
+    hovertext, sizes = [point.name for point in points], marker_size
+    if point_budget is not None and len(coords) > point_budget:
+        coords, counts = level_of_detail(coords, point_budget)
+        hovertext = [f"{count:.0f} points" for count in counts]
+        sizes = splat_sizes(counts, marker_size)
+    x, y, z = coords.T
+    fig.add_trace(
+        go.Scatter3d(
+            x=x,
+            y=y,
+            z=z,
+            mode="markers",
+            hovertext=hovertext,
+            marker=dict(
+                size=sizes,
+                color=rand_colour()
+                if consistent_colouring
+                else np.random.rand(len(coords)),
+                colorscale=RAND_COLOURSCALE,
+            ),
+        )
+    )
+
+
+def handle_clouds(
+    fig,
+    clouds: List[MemmapArray],
+    marker_size: float,
+    point_budget: Optional[int] = None,
+):
+    """
+    Adds the stored point clouds, each read in windows and decimated to the point budget if given.
+    """
+
+    for cloud in clouds:
+        if not len(cloud):
+            continue
+        if point_budget is None:
+            coords, counts = np.asarray(cloud.array, dtype=float), np.ones(len(cloud))
+        else:
+            coords, counts = windowed_level_of_detail(
+                cloud.windows(DEF_WINDOW), point_budget
+            )
+        x, y, z = coords.T
         fig.add_trace(
             go.Scatter3d(
-                x=[x],
-                y=[y],
-                z=[z],
+                x=x,
+                y=y,
+                z=z,
                 mode="markers",
-                name=point.name,
+                hovertext=[f"{count:.0f} points" for count in counts],
                 marker=dict(
-                    size=marker_size,
-                    color=def_colour if consistent_colouring else rand_colour(),
+                    size=splat_sizes(counts, marker_size),
+                    color=np.random.rand(len(coords)),
+                    colorscale=RAND_COLOURSCALE,
                 ),
             )
         )
 
 
 def handle_squares(fig, squares: List[Square], plane_opacity: float):
-    for square in squares:
-        x, y, z = square.to_mesh()
-        fig.add_trace(
-            go.Mesh3d(x=x, y=y, z=z, opacity=plane_opacity, color=rand_colour())
+    if not squares:
+        return
+    x, y, z = (
+        np.array(
+            [
+                [square.a.array, square.b.array, square.d.array, square.c.array]
+                for square in squares
+            ]
+        )
+        .reshape(-1, 3)
+        .T
+    )
+    i, j, k = grid_triangles(2, 2, len(squares)).T
+    fig.add_trace(
+        go.Mesh3d(
+            x=x,
+            y=y,
+            z=z,
+            i=i,
+            j=j,
+            k=k,
+            opacity=plane_opacity,
+            intensity=np.repeat(np.random.rand(len(squares)), 2),
+            intensitymode="cell",
+            colorscale=RAND_COLOURSCALE,
+            showscale=False,
         )
+    )
 
 
 def handle_planes(fig, planes: List[Plane], plane_size: float, plane_opacity: float):
-    for plane in planes:
-        x, y, z = plane.to_mesh(plane_size)
-        fig.add_trace(
-            go.Plane(x=x, y=y, z=z, opacity=plane_opacity, color=rand_colour())
+    if not planes:
+        return
+    meshes = np.array(
+        [np.stack(plane.to_mesh(plane_size), axis=-1) for plane in planes]
+    )
+    count, rows, columns, _ = meshes.shape
+    x, y, z = meshes.reshape(-1, 3).T
+    i, j, k = grid_triangles(rows, columns, count).T
+    fig.add_trace(
+        go.Mesh3d(
+            x=x,
+            y=y,
+            z=z,
+            i=i,
+            j=j,
+            k=k,
+            opacity=plane_opacity,
+            intensity=np.repeat(np.random.rand(count), 2 * (rows - 1) * (columns - 1)),
+            intensitymode="cell",
+            colorscale=RAND_COLOURSCALE,
+            showscale=False,
         )
+    )
+
+
+def cell_counts_trace(
+    subspace: SubSpace,
+    counts: np.ndarray,
+    marker_size: float,
+    point_budget: Optional[int] = None,
+):
+    """
+    Returns a marker trace of the centres of the cells with a non-zero count, coloured by that count.
+
+    Parameters:
+    subspace (SubSpace): The cells.
+    counts (np.ndarray): The count of every cell, e.g. its number of contributions in the store.
+    marker_size (float): Size of the markers.
+    point_budget (int, optional): The number of markers to decimate the cells to when there are more.
+
+    Returns:
+    plotly.graph_objects.Scatter3d: The trace.
+    """
+
+    seen = np.flatnonzero(counts)
+    centres, counts = subspace.centres[seen], counts[seen].astype(float)
+    if point_budget is not None:
+        centres, counts = level_of_detail(centres, point_budget, counts)
+    x, y, z = centres.T
+    return go.Scatter3d(
+        x=x,
+        y=y,
+        z=z,
+        mode="markers",
+        hovertext=[f"{count:.0f} contributions" for count in counts],
+        marker=dict(size=marker_size, color=counts, colorscale="Viridis"),
+    )
 
 
-def handle_subspace(fig, subspace: List[SubSpace], marker_size: float):
+def handle_subspace(
+    fig,
+    subspace: List[SubSpace],
+    marker_size: float,
+    point_budget: Optional[int] = None,
+):
     for ss in subspace:
-        for centre_coord, set_of_points in ss.subspace_assignments.items():
-            # print("Coord", centre_coord)
-            # print("Points", set_of_points)
-            # print()
-            # print()
-            # print()
-            handle_points(
-                fig, list(set_of_points), marker_size, consistent_colouring=True
+        cells = [
+            np.array([point.array for point in points])
+            for points in ss.subspace_assignments.values()
+            if points
+        ]
+        total = sum(len(coords) for coords in cells)
+        if cells:
+            share = 1 if point_budget is None else min(point_budget / total, 1)
+            decimated = [
+                level_of_detail(coords, max(int(len(coords) * share), 1))
+                for coords in cells
+            ]
+            x, y, z = np.concatenate([coords for coords, _ in decimated]).T
+            counts = np.concatenate([counts for _, counts in decimated])
+            fig.add_trace(
+                go.Scatter3d(
+                    x=x,
+                    y=y,
+                    z=z,
+                    mode="markers",
+                    hovertext=[f"{count:.0f} points" for count in counts],
+                    marker=dict(
+                        size=splat_sizes(counts, marker_size),
+                        color=np.repeat(
+                            np.random.rand(len(cells)),
+                            [len(coords) for coords, _ in decimated],
+                        ),
+                        colorscale=RAND_COLOURSCALE,
+                    ),
+                )
             )
+        if len(ss.assignments):
+            counts = np.bincount(ss.assignments[:, 0], minlength=len(ss.centres))
+            fig.add_trace(cell_counts_trace(ss, counts, marker_size, point_budget))
 
 
 def add_surface(fig, subject_radius):
@@ -136,7 +435,7 @@ def add_surface(fig, subject_radius):
     fig.add_trace(go.Surface(x=x, y=y, z=z))
 
 
-def easy_plot(
+def build_figure(
     *args,
     marker_size: float = 4,
     line_thickness: float = 4,
@@ -145,19 +444,23 @@ def easy_plot(
     window_size=DEF_WINDOW_SIZE,
     subject_radius: float = 1,
     show_surface: bool = False,
+    point_budget: Optional[int] = DEF_POINT_BUDGET,
 ):
     """
-    Plots 3D points, vectors, planes and squares using Plotly.
+    Builds a Plotly figure of 3D points, vectors, planes and squares.
 
     Parameters:
-    *args (any): Variable length argument list containing objects to plot.
+    *args (any): Variable length argument list containing objects to plot. Point clouds stored in MemmapArrays are
+    read in windows.
     marker_size (float): Size of the markers for points. Defaults to 3.
     plane_size (float): Size of the mesh for planes. Defaults to 2.
     plane_opacity (float): Opacity of planes and squares. Defaults to 0.5.
     window_size (float): The range of values to plot along each axis. Defaults to DEF_WINDOW_SIZE.
+    point_budget (int, optional): The number of markers each point cloud is decimated to when larger, so the
+    figure stays interactive. None plots every point. Defaults to DEF_POINT_BUDGET.
 
     Returns:
-    None
+    plotly.graph_objects.Figure: The figure.
     """
 
     fig = go.Figure()
@@ -169,19 +472,21 @@ def easy_plot(
     planes = [plane for plane in args if isinstance(plane, Plane)]
     vectors = [vector.end for vector in args if isinstance(vector, Vector)]
     subspace = [subspace for subspace in args if isinstance(subspace, SubSpace)]
+    clouds = [cloud for cloud in args if isinstance(cloud, MemmapArray)]
 
     if len(subspace) > 2:
         raise ValueError("Can't have more than one SubSpace")
 
-    if not (points or squares or planes or vectors):
+    if not (points or squares or planes or vectors or clouds):
         raise ValueError("No points or planes were passed")
 
     handle_lines(fig, lines, line_thickness)
-    handle_points(fig, points, marker_size=marker_size)
+    handle_points(fig, points, marker_size=marker_size, point_budget=point_budget)
     handle_squares(fig, squares, plane_opacity=plane_opacity)
     handle_planes(fig, planes, plane_size=plane_size, plane_opacity=plane_opacity)
-    handle_points(fig, vectors, marker_size=marker_size)
-    handle_subspace(fig, subspace, marker_size=marker_size)
+    handle_points(fig, vectors, marker_size=marker_size, point_budget=point_budget)
+    handle_subspace(fig, subspace, marker_size=marker_size, point_budget=point_budget)
+    handle_clouds(fig, clouds, marker_size=marker_size, point_budget=point_budget)
 
     if show_surface:
         add_surface(fig, subject_radius)
@@ -197,4 +502,230 @@ def easy_plot(
         ),
         showlegend=False,
     )
-    fig.show()
+    return fig
+
+
+def easy_plot(*args, **kwargs):
+    """
+    Plots 3D points, vectors, planes and squares using Plotly, in a browser.
+
+    Parameters:
+    *args, **kwargs: The objects to plot and the options of build_figure.
+
+    Returns:
+    None
+    """
+
+    build_figure(*args, **kwargs).show()
+
+
+def export_html(path: str, *args, include_plotlyjs=True, **kwargs):
+    """
+    Writes the scene easy_plot would show to a standalone HTML file, without needing a browser.
+
+    Parameters:
+    path (str): The file to write.
+    *args, **kwargs: The objects to plot and the options of build_figure.
+    include_plotlyjs (bool or str): Embed plotly.js (True) so the file works offline, or e.g. "cdn" to link it.
+
+    Returns:
+    None
+    """
+
+    build_figure(*args, **kwargs).write_html(path, include_plotlyjs=include_plotlyjs)
+
+
+class ProgressiveViewer:
+    """
+    Shows the results of a running pipeline as they are produced, refreshed at most every `interval` seconds.
+
+    A static scene (e.g. cameras and pictures) is drawn once, and batches of store contributions or points handed
+    to add / add_points are accumulated and redrawn by a background thread, so the pipeline only ever pays for a
+    queue put. The figure is either a go.FigureWidget updated in place (in a notebook) or, when a path is given, an
+    HTML snapshot loading plotly.js from its CDN, atomically rewritten on every refresh, which suits headless runs.
+    Pass viewer.add as the on_assignments hook of tracing.trace to follow an assignment run.
+
+    ipywidgets aren't thread safe, so the widget is only ever updated on the notebook's event loop, which start must
+    be called from. That loop only runs between cells or while a cell awaits, so run the pipeline in a thread or an
+    awaited executor for the widget to refresh while it works.
+
+    If a refresh fails, e.g. on a write error, the thread stops, later batches are dropped and stop raises the error.
+    """
+
+    def __init__(
+        self,
+        *args,
+        subspace: Optional[SubSpace] = None,
+        path: Optional[str] = None,
+        interval: float = DEF_REFRESH_INTERVAL,
+        **kwargs,
+    ):
+        """
+        Creates a new ProgressiveViewer object.
+
+        Parameters:
+        *args: The static scene, as accepted by build_figure. May be empty.
+        subspace (SubSpace, optional): The cells that contributions passed to add refer to.
+        path (str, optional): The HTML snapshot to rewrite. If None, a go.FigureWidget is used instead.
+        interval (float): The minimum number of seconds between refreshes.
+        **kwargs: The options of build_figure.
+        """
+
+        self.args, self.kwargs = args, kwargs
+        self.subspace, self.path, self.interval = subspace, path, interval
+        self.marker_size = kwargs.get("marker_size", 4)
+        self.point_budget = kwargs.get("point_budget", DEF_POINT_BUDGET)
+        self.counts = None if subspace is None else np.zeros(len(subspace.centres))
+        self.points, self.point_counts = [], []
+        self.batches = queue.SimpleQueue()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.figure, self.static_traces = None, 0
+        self.loop, self.error = None, None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add(self, cells: np.ndarray, cameras=None, pixels=None) -> None:
+        """
+        Queues a batch of contributions to the subspace's cells, with the signature of SubSpace.add_assignments.
+
+        Raises:
+        ValueError: If the viewer was created without a subspace.
+        """
+
+        if self.counts is None:
+            raise ValueError("cell contributions need a viewer created with a subspace")
+        if self.error is None:
+            self.batches.put(("cells", cells))
+
+    def add_points(self, coords: np.ndarray) -> None:
+        """
+        Queues a batch of (N, 3) points, e.g. samples along rays.
+        """
+
+        if self.error is None:
+            self.batches.put(("points", coords))
+
+    def start(self) -> None:
+        """
+        Draws the static scene and starts the background thread.
+
+        Raises:
+        RuntimeError: If the viewer has no path and isn't started from a running event loop, e.g. a notebook cell.
+        """
+
+        if self.path is None:
+            try:
+                self.loop = asyncio.get_running_loop()
+            except RuntimeError:
+                raise RuntimeError(
+                    "a FigureWidget viewer needs a notebook event loop, "
+                    "pass path to write HTML snapshots instead"
+                ) from None
+        static = build_figure(*self.args, **self.kwargs) if self.args else go.Figure()
+        self.figure = static if self.path is not None else go.FigureWidget(static)
+        self.static_traces = len(self.figure.data)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Waits for every queued batch to be drawn and stops the background thread, if it was ever started.
+
+        Raises:
+        Exception: The error that stopped the background thread, if any.
+        """
+
+        if self.thread.ident is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self) -> None:
+        last_refresh = 0.0
+        try:
+            while True:
+                stopping = self.stopped.is_set()
+                changed = self.drain()
+                if changed and (
+                    stopping or time.monotonic() - last_refresh >= self.interval
+                ):
+                    self.refresh()
+                    last_refresh = time.monotonic()
+                if stopping:
+                    return
+                time.sleep(min(self.interval, 0.1))
+        except Exception as error:
+            self.error = error
+
+    def drain(self) -> bool:
+        changed = False
+        while True:
+            try:
+                kind, values = self.batches.get_nowait()
+            except queue.Empty:
+                return changed
+            if kind == "cells":
+                self.counts += np.bincount(values, minlength=len(self.counts))
+            else:
+                self.points.append(np.asarray(values))
+                self.point_counts.append(np.ones(len(values)))
+            changed = True
+
+    def traces(self) -> list:
+        traces = []
+        if self.counts is not None and self.counts.any():
+            traces.append(
+                cell_counts_trace(
+                    self.subspace, self.counts, self.marker_size, self.point_budget
+                )
+            )
+        if self.points:
+            coords = np.concatenate(self.points)
+            counts = np.concatenate(self.point_counts)
+            if self.point_budget is not None:
+                coords, counts = level_of_detail(coords, self.point_budget, counts)
+            self.points, self.point_counts = [coords], [counts]
+            x, y, z = coords.T
+            traces.append(
+                go.Scatter3d(
+                    x=x,
+                    y=y,
+                    z=z,
+                    mode="markers",
+                    marker=dict(
+                        size=splat_sizes(counts, self.marker_size),
+                        color=rand_colour(),
+                    ),
+                )
+            )
+        return traces
+
+    def refresh(self) -> None:
+        traces = self.traces()
+        if self.loop is None:
+            self.draw(traces)
+        else:
+            self.loop.call_soon_threadsafe(self.draw_widget, traces)
+
+    def draw_widget(self, traces: list) -> None:
+        try:
+            self.draw(traces)
+        except Exception as error:
+            self.error = error
+
+    def draw(self, traces: list) -> None:
+        with self.figure.batch_update():
+            self.figure.data = self.figure.data[: self.static_traces]
+            for trace in traces:
+                self.figure.add_trace(trace)
+        if self.path is not None:
+            partial_path = f"{self.path}.partial"
+            self.figure.write_html(partial_path, include_plotlyjs="cdn")
+            os.replace(partial_path, self.path)
@@ -0,0 +1,40 @@
+# The settings and public names of the rendering module, kept apart from it so that the packages namespace can list
+# and lazily resolve them without importing plotly.
+
+DEF_WINDOW_SIZE = 5
+RAND_COLOURSCALE = "Rainbow"
+DEF_POINT_BUDGET = 200_000
+MAX_SPLAT_SCALE = 4
+LOD_ITERATIONS = 16
+LOD_FILL = 0.5
+DEF_REFRESH_INTERVAL = 2.0
+
+RENDERING_ALL = (
+    "DEF_WINDOW_SIZE",
+    "RAND_COLOURSCALE",
+    "DEF_POINT_BUDGET",
+    "MAX_SPLAT_SCALE",
+    "LOD_ITERATIONS",
+    "LOD_FILL",
+    "DEF_REFRESH_INTERVAL",
+    "rand_colour",
+    "Axis",
+    "separated",
+    "grid_triangles",
+    "voxel_downsample",
+    "level_of_detail",
+    "windowed_level_of_detail",
+    "splat_sizes",
+    "handle_lines",
+    "handle_points",
+    "handle_clouds",
+    "handle_squares",
+    "handle_planes",
+    "cell_counts_trace",
+    "handle_subspace",
+    "add_surface",
+    "build_figure",
+    "easy_plot",
+    "export_html",
+    "ProgressiveViewer",
+)
@@ -0,0 +1,343 @@
+import asyncio
+import json
+import math
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Optional
+import numpy as np
+from packages.collections import Points, Rig
+from packages.objects import SubSpace
+from packages.planner import RunParameters
+from packages.statistics import subspace_coverage
+from packages.symmetry import trace_symmetric
+
+DEF_HOST = "127.0.0.1"
+DEF_PORT = 8765
+# the most bytes of JSON results the cache keeps
+DEF_CACHE_BYTES = 64 * 2**20
+DEF_WORKERS = 2
+# the longest request line the server reads, replies are length framed
+LINE_LIMIT = 2**20
+# the largest run one request may ask for
+MAX_CELLS = 2**21
+MAX_RAYS = 2**22
+MAX_SAMPLES = 2**28
+INTEGER_FIELDS = (
+    "cams_along_inclination",
+    "pixel_width",
+    "pixel_height",
+    "points_density_for_line",
+    "subspace_count",
+)
+
+
+def parse_parameters(parameters: dict) -> RunParameters:
+    """
+    Builds RunParameters from a JSON object of its fields, with inclinations as a tuple so that equal requests give
+    equal, hashable parameters, and checks them before any work is done: every number must be finite, so that no NaN
+    defeats the cache or the coalescing of equal requests, counts and lengths positive, inclinations within [0, 180]
+    and the run no larger than MAX_CELLS cells, MAX_RAYS rays and MAX_SAMPLES samples.
+
+    Raises:
+    TypeError: If fields are missing or unknown.
+    ValueError: If a field has the wrong type or is out of range.
+    """
+
+    if not isinstance(parameters, dict):
+        raise TypeError(
+            f"parameters must be an object, got {type(parameters).__name__}"
+        )
+    params = RunParameters(**parameters)
+    fields = {}
+    for name, value in params._asdict().items():
+        if name == "inclinations":
+            continue
+        try:
+            number = float(value)
+        except OverflowError:
+            number = math.inf
+        if not math.isfinite(number):
+            raise ValueError(f"{name} must be finite, got {value}")
+        if name in INTEGER_FIELDS and not number.is_integer():
+            raise ValueError(f"{name} must be an integer, got {value}")
+        if name != "ray_offset" and number <= 0:
+            raise ValueError(f"{name} must be positive, got {value}")
+        fields[name] = int(number) if name in INTEGER_FIELDS else number
+    inclinations = tuple(float(incl) for incl in params.inclinations)
+    if not inclinations or not all(0 <= incl <= 180 for incl in inclinations):
+        raise ValueError(
+            "inclinations must be one or more angles within [0, 180], "
+            f"got {params.inclinations}"
+        )
+    params = RunParameters(inclinations=inclinations, **fields)
+    for name, size, limit in (
+        ("cells", params.cells, MAX_CELLS),
+        ("rays", params.rays, MAX_RAYS),
+        ("samples", params.rays * params.points_density_for_line, MAX_SAMPLES),
+    ):
+        if size > limit:
+            raise ValueError(f"the run has {size} {name}, more than {limit}")
+    return params
+
+
+def analyse(params: RunParameters) -> dict:
+    """
+    Runs a whole analysis: places the cameras like main.py, traces every pixel into the SubSpace, deriving cameras
+    that are rotations of others (see symmetry.trace_symmetric), and reduces the assignments to per cell coverage.
+
+    Returns:
+    dict: A JSON serialisable summary: the parameters, the number of cells and assignments, the ids of the cells
+    seen and every statistics.Coverage figure of those cells only, in the same order, so the size follows what the
+    rig sees rather than the grid.
+    """
+
+    cameras = Points.get_points_at_inclinations(
+        params.camera_radius, params.cams_along_inclination, params.inclinations
+    )
+    rig = Rig.from_cameras(
+        cameras,
+        params.focal_length,
+        params.sensor_width,
+        params.sensor_height,
+        params.unit,
+    )
+    subspace = trace_symmetric(
+        rig,
+        SubSpace(params.subspace_count, params.subspace_length),
+        params.pixel_width,
+        params.pixel_height,
+        params.ray_length,
+        params.subject_radius,
+        params.points_density_for_line,
+    )
+    coverage = subspace_coverage(subspace, rig)
+    seen = np.flatnonzero(coverage.seen)
+    return {
+        "parameters": params._asdict(),
+        "cells": len(subspace.centres),
+        "assignments": len(subspace.assignments),
+        "cells_seen": seen.tolist(),
+        "coverage": {
+            name: figure[seen].tolist() for name, figure in coverage._asdict().items()
+        },
+    }
+
+
+def warm() -> None:
+    """
+    Does nothing: submitted once per worker so that the executor's processes start, and import this module, before
+    the first request.
+    """
+
+
+class AnalysisService:
+    """
+    Runs analyses for concurrent clients without repeating work.
+
+    Requests are keyed by their RunParameters. A request equal to one still running waits for that run instead of
+    starting its own, and finished results are kept in an LRU cache of at most cache_bytes bytes of JSON, so only distinct,
+    uncached parameters reach the executor, however large a grid's results grow. Failed runs are reported to every waiting request and are not cached.
+
+    Compute runs on an executor of worker processes started once, with start, and kept for the life of the service,
+    so no request pays for starting an interpreter or importing NumPy.
+
+    Parameters:
+    executor (Executor, optional): Runs the task, a ProcessPoolExecutor of workers processes if None.
+    workers (int): The number of processes of the default executor.
+    cache_bytes (int): The most bytes of JSON results kept, 0 to keep none. A larger result is not cached.
+    task (Callable): Turns RunParameters into a JSON serialisable result, analyse by default. It must be picklable
+    to run on a process executor.
+
+    Attributes:
+    stats (Dict[str, int]): The number of requests, and of those computed, coalesced with a running one and served
+    from the cache.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        workers: int = DEF_WORKERS,
+        cache_bytes: int = DEF_CACHE_BYTES,
+        task: Callable = analyse,
+    ):
+        self.executor = executor
+        self.owns_executor = executor is None
+        self.workers = workers
+        self.cache_bytes = cache_bytes
+        self.task = task
+        # (result, size in bytes) by RunParameters, least recently used first
+        self.cache: OrderedDict = OrderedDict()
+        self.cached_bytes = 0
+        self.pending: Dict[RunParameters, asyncio.Future] = {}
+        self.stats = {"requests": 0, "computed": 0, "coalesced": 0, "cached": 0}
+
+    async def start(self) -> "AnalysisService":
+        """
+        Starts the default executor's processes, returning the service for chaining.
+        """
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self.executor, warm) for _ in range(self.workers))
+        )
+        return self
+
+    def close(self) -> None:
+        if self.owns_executor and self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def __aenter__(self) -> "AnalysisService":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    async def analyse(self, params: RunParameters) -> dict:
+        """
+        Returns the result of the task for params, from the cache, from an equal run in flight, or from a new run.
+
+        The result may be shared with other requests and must not be modified. A caller cancelling its request does
+        not cancel a run that other requests wait for.
+        """
+
+        self.stats["requests"] += 1
+        if params in self.cache:
+            self.stats["cached"] += 1
+            self.cache.move_to_end(params)
+            return self.cache[params][0]
+        future = self.pending.get(params)
+        if future is None:
+            if self.executor is None:
+                raise RuntimeError("the service is not started")
+            self.stats["computed"] += 1
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, self.task, params
+            )
+            self.pending[params] = future
+            future.add_done_callback(partial(self.finish, params))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(future)
+
+    def finish(self, params: RunParameters, future: asyncio.Future) -> None:
+        del self.pending[params]
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        size = len(json.dumps(result))
+        if size > self.cache_bytes:
+            return
+        self.cache[params] = result, size
+        self.cached_bytes += size
+        while self.cached_bytes > self.cache_bytes:
+            _, (_, evicted) = self.cache.popitem(last=False)
+            self.cached_bytes -= evicted
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Serves one connection: every line is a JSON object {"parameters": {...RunParameters fields}}, answered in
+        order by a JSON object {"result": ...} or {"error": "..."}, see write_reply.
+        """
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    params = parse_parameters(request["parameters"])
+                    response = {"result": await self.analyse(params)}
+                except Exception as error:
+                    response = {"error": f"{type(error).__name__}: {error}"}
+                await write_reply(writer, response)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = DEF_HOST, port: int = DEF_PORT):
+        """
+        Starts the service and listens for clients on a local TCP socket, e.g. request.
+
+        Returns:
+        asyncio.Server: The listening server, port 0 picking a free port, see server.sockets.
+        """
+
+        if self.executor is None:
+            await self.start()
+        return await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+
+
+async def write_reply(writer: asyncio.StreamWriter, response: dict) -> None:
+    """
+    Writes a reply as its length in bytes on a line of its own followed by its JSON, so replies of any size can be
+    read back exactly, see read_reply.
+    """
+
+    body = json.dumps(response).encode()
+    writer.write(b"%d\n" % len(body) + body)
+    await writer.drain()
+
+
+async def read_reply(reader: asyncio.StreamReader) -> dict:
+    """
+    Reads one reply written by write_reply.
+
+    Raises:
+    ConnectionError: If the connection closes before a whole reply arrives.
+    """
+
+    header = await reader.readline()
+    if not header:
+        raise ConnectionError("the service closed the connection")
+    try:
+        return json.loads(await reader.readexactly(int(header)))
+    except asyncio.IncompleteReadError as error:
+        raise ConnectionError("the service closed the connection") from error
+
+
+async def request(parameters: dict, host: str = DEF_HOST, port: int = DEF_PORT) -> dict:
+    """
+    A minimal client: sends one request to an AnalysisService and returns its result.
+
+    Parameters:
+    parameters (dict): The RunParameters fields, e.g. RunParameters(...)._asdict().
+
+    Raises:
+    RuntimeError: With the service's message if the request failed.
+    """
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(json.dumps({"parameters": parameters}).encode() + b"\n")
+        await writer.drain()
+        response = await read_reply(reader)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response["result"]
+
+
+def run(
+    host: str = DEF_HOST,
+    port: int = DEF_PORT,
+    workers: int = DEF_WORKERS,
+    cache_bytes: int = DEF_CACHE_BYTES,
+) -> None:
+    """
+    Serves analyses until interrupted, e.g. python -c "from packages.service import run; run()".
+    """
+
+    async def main():
+        async with AnalysisService(workers=workers, cache_bytes=cache_bytes) as service:
+            server = await service.serve(host, port)
+            async with server:
+                await server.serve_forever()
+
+    asyncio.run(main())
@@ -0,0 +1,261 @@
+import os
+from functools import partial
+from multiprocessing import Pool
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from packages.collections import Rig
+from packages.culling import PixelTile, CellRange, DEF_TILE_SIZE, cull
+from packages.instrumentation import Collected, count, enabled, merge, stage
+from packages.multiprocessing_utils import init_worker, run_worker
+from packages.objects import SubSpace, ASSIGNMENT_DTYPE
+from packages.storage import MemmapArray, Scratch, DEF_WINDOW
+from packages.tracing import trace_pair
+from packages.utils import precision
+
+DEF_BRICKS = (2, 2, 2)
+SHARD_NAME = "shard-{:04d}"
+
+
+class Shard(NamedTuple):
+    """
+    A brick of SubSpace cells and the culled (tile, cell range) pairs routed to it, each range cut down to the
+    brick. Shards share no cells, so they can be traced by any process or host and their results concatenated.
+    """
+
+    index: int
+    cells: CellRange
+    pairs: List[Tuple[PixelTile, CellRange]]
+
+    @property
+    def name(self) -> str:
+        return SHARD_NAME.format(self.index)
+
+
+def split_bricks(
+    subspace: SubSpace, bricks: Sequence[int] = DEF_BRICKS
+) -> List[CellRange]:
+    """
+    Splits the SubSpace grid into bricks of near equal size, e.g. (n, 1, 1) for n slabs along x.
+
+    Parameters:
+    bricks (Sequence[int]): The number of bricks along x, y and z, each at most subspace.divisions.
+
+    Returns:
+    List[CellRange]: The bricks, x major like cell ids.
+    """
+
+    if len(bricks) != 3 or not all(
+        1 <= count <= subspace.divisions for count in bricks
+    ):
+        raise ValueError(
+            f"bricks must be 3 counts from 1 to {subspace.divisions}, got {bricks}"
+        )
+    edges = [
+        np.linspace(0, subspace.divisions, count + 1).astype(int) for count in bricks
+    ]
+    return [
+        CellRange(i0, i1, j0, j1, k0, k1)
+        for i0, i1 in zip(edges[0][:-1], edges[0][1:])
+        for j0, j1 in zip(edges[1][:-1], edges[1][1:])
+        for k0, k1 in zip(edges[2][:-1], edges[2][1:])
+    ]
+
+
+def route(
+    pairs: Iterable[Tuple[PixelTile, CellRange]], bricks: List[CellRange]
+) -> List[Shard]:
+    """
+    Routes culled (tile, cell range) pairs to the bricks their ranges overlap, so a tile is only traced by the
+    shards whose cells its rays can reach, and there only against the cells of the brick.
+    """
+
+    shards = [Shard(index, brick, []) for index, brick in enumerate(bricks)]
+    for tile, cell_range in pairs:
+        for shard in shards:
+            shared = cell_range.intersection(shard.cells)
+            if shared is not None:
+                shard.pairs.append((tile, shared))
+    return shards
+
+
+def plan_shards(
+    rig: Rig,
+    subspace: SubSpace,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    subject_radius: float,
+    bricks: Sequence[int] = DEF_BRICKS,
+    tile_size: int = DEF_TILE_SIZE,
+) -> List[Shard]:
+    """
+    Culls the rig's pixel tiles once and routes them to the bricks of the SubSpace.
+
+    The shards only depend on the parameters, so every host of a run can plan them alike and trace its own share.
+    """
+
+    with stage("cull"):
+        pairs = cull(
+            rig,
+            subspace,
+            pixel_width,
+            pixel_height,
+            subject_radius,
+            ray_length,
+            tile_size,
+        )
+    count("tiles", len(pairs))
+    shards = route(pairs, split_bricks(subspace, bricks))
+    count("routed_tiles", sum(len(shard.pairs) for shard in shards))
+    return shards
+
+
+def trace_shard(item: Tuple[Shard, str], **kwargs) -> Tuple[str, int]:
+    """
+    Traces the pairs of one shard and appends its (cell, camera, pixel) rows to its own MemmapArray, so a worker only
+    ever holds one tile's results.
+
+    Parameters:
+    item (Tuple[Shard, str]): The shard and the path of its file, without suffix.
+    kwargs: The keyword arguments of tracing.trace_pair other than the pair.
+
+    Returns:
+    Tuple[str, int]: The path and the number of rows written.
+    """
+
+    shard, path = item
+    with stage("shard"), MemmapArray(path, (3,), ASSIGNMENT_DTYPE) as rows:
+        for tile, cell_range in shard.pairs:
+            cells, pixels = trace_pair(tile, cell_range, **kwargs)
+            rows.append(
+                np.column_stack(np.broadcast_arrays(cells, tile.camera, pixels)).astype(
+                    ASSIGNMENT_DTYPE
+                )
+            )
+        count("assignments", len(rows))
+        return path, len(rows)
+
+
+def merge_shards(
+    paths: Iterable[str], subspace: SubSpace, window: int = DEF_WINDOW
+) -> SubSpace:
+    """
+    Concatenates shard files into the SubSpace store, reading each in windows.
+    """
+
+    for path in paths:
+        for rows in MemmapArray.open(path).windows(window):
+            rows = np.array(rows)
+            subspace.add_assignments(rows[:, 0], rows[:, 1], rows[:, 2])
+    return subspace
+
+
+def merge_files(
+    paths: Iterable[str], path: str, window: int = DEF_WINDOW
+) -> MemmapArray:
+    """
+    Concatenates shard files into one MemmapArray, for stores too large to hold in memory.
+    """
+
+    with MemmapArray(path, (3,), ASSIGNMENT_DTYPE) as merged:
+        for shard_path in paths:
+            merged.extend(MemmapArray.open(shard_path).windows(window))
+    return merged
+
+
+def trace_sharded(
+    rig: Rig,
+    subspace: SubSpace,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    subject_radius: float,
+    density: Optional[int] = None,
+    beam: bool = False,
+    step: Optional[float] = None,
+    dtype=None,
+    directory: Optional[str] = None,
+    bricks: Sequence[int] = DEF_BRICKS,
+    tile_size: int = DEF_TILE_SIZE,
+    processes: int = 1,
+    merge_into: bool = True,
+) -> List[str]:
+    """
+    Assigns the pixels of every camera to the SubSpace cells they see like tracing.trace, with the grid split into
+    bricks each traced by one worker into its own file.
+
+    Each brick is a shard: it only receives the tiles whose culled cell ranges overlap it, traces their rays against
+    its own cells and writes its partial store to "shard-NNNN" in the directory. No process holds more than one
+    tile's results, and the shard files are merged into the SubSpace store at the end, unless merge_into is False,
+    e.g. to merge them with merge_files instead. The shards are planned by plan_shards from the parameters alone, so
+    hosts sharing the directory can trace disjoint shards with trace_shard and one of them merge every file.
+
+    The merged rows are those of tracing.trace, in shard rather than tile order.
+
+    Parameters:
+    directory (str, optional): Where to write the shard files, a new temporary directory if None, deleted with the
+    files once they are merged.
+    bricks (Sequence[int]): The number of bricks along x, y and z.
+    processes (int): The number of worker processes, 1 to trace every shard in this process.
+    merge_into (bool): Whether to merge the shard files into the SubSpace store.
+
+    See tracing.trace for the other parameters.
+
+    Returns:
+    List[str]: The paths of the shard files, in shard order. They only outlive the call when the caller supplies the
+    directory, or when merge_into is False, leaving the caller to delete the temporary directory.
+    """
+
+    if density is None and step is None and not beam:
+        raise ValueError("density or step is required unless beam is set")
+    # a temporary directory only outlives the call when its files aren't merged, for the caller to merge and delete
+    with Scratch(directory, keep=directory is not None or not merge_into) as scratch:
+        shards = plan_shards(
+            rig,
+            subspace,
+            pixel_width,
+            pixel_height,
+            ray_length,
+            subject_radius,
+            bricks,
+            tile_size,
+        )
+        items = [
+            (shard, os.path.join(scratch.directory, shard.name))
+            for shard in shards
+            if shard.pairs
+        ]
+        task = partial(
+            trace_shard,
+            rig=rig,
+            subspace=SubSpace(subspace.divisions, subspace.length),
+            pixel_width=pixel_width,
+            pixel_height=pixel_height,
+            ray_length=ray_length,
+            subject_radius=subject_radius,
+            density=density,
+            beam=beam,
+            step=step,
+            dtype=precision(dtype),
+        )
+        with stage("assign"):
+            if processes == 1:
+                paths = [task(item)[0] for item in items]
+            else:
+                collect = enabled()
+                # the busiest shards start first so the last ones don't run alone
+                ordered = sorted(items, key=lambda item: -len(item[0].pairs))
+                with Pool(
+                    processes,
+                    initializer=init_worker,
+                    initargs=(Collected(task) if collect else task,),
+                ) as pool:
+                    for result in pool.imap_unordered(run_worker, ordered, 1):
+                        if collect:
+                            result, report = result
+                            merge(report)
+                paths = [path for _, path in items]
+        if merge_into:
+            with stage("merge"):
+                merge_shards(paths, subspace)
+    return paths
@@ -0,0 +1,118 @@
+from typing import NamedTuple
+import numpy as np
+from packages.collections import Rig
+from packages.objects import SubSpace
+from packages.utils import norms
+
+
+class Coverage(NamedTuple):
+    """
+    Per cell figures of how a rig sees a SubSpace, as dense arrays in cell id order.
+
+    rays: The number of (camera, pixel) contributions assigned to the cell.
+    cameras: The number of distinct cameras that see the cell.
+    spread: The angular spread of the cell's viewing directions in degrees, the angle whose cosine is the length of
+    the mean unit vector from the cell centre to each camera that sees it: 0 when every camera looks from the same
+    direction and 90 when they surround it evenly. NaN for unseen cells.
+    nearest, farthest: The distances from the cell centre to the nearest and farthest cameras that see it, NaN for
+    unseen cells.
+    nearest_camera, farthest_camera: Those cameras' ids, -1 for unseen cells.
+    """
+
+    rays: np.ndarray
+    cameras: np.ndarray
+    spread: np.ndarray
+    nearest: np.ndarray
+    nearest_camera: np.ndarray
+    farthest: np.ndarray
+    farthest_camera: np.ndarray
+
+    @property
+    def seen(self) -> np.ndarray:
+        return self.cameras > 0
+
+
+def coverage(
+    assignments: np.ndarray, centres: np.ndarray, sources: np.ndarray
+) -> Coverage:
+    """
+    Computes the Coverage of an array-backed assignment in a few vectorised passes.
+
+    The rays are counted with one bincount over the cell column. The (cell, camera) pairs are then packed into single
+    integers and made distinct with one sort, which also groups them by cell, so their counts, viewing direction sums
+    and distance extremes per cell follow from bincount and ufunc reduceat passes over contiguous segments.
+
+    Parameters:
+    assignments (np.ndarray): The (K, 3) [cell, camera, pixel] rows, e.g. SubSpace.assignments.
+    centres (np.ndarray): The (C, 3) cell centres.
+    sources (np.ndarray): The (N, 3) camera centres.
+
+    Returns:
+    Coverage: The per cell figures.
+    """
+
+    cell_count, camera_count = len(centres), len(sources)
+    cells = assignments[:, 0].astype(np.int64)
+    rays = np.bincount(cells, minlength=cell_count)
+
+    pairs = distinct(cells * camera_count + assignments[:, 1])
+    pair_cells, pair_cameras = np.divmod(pairs, camera_count)
+    cameras = np.bincount(pair_cells, minlength=cell_count)
+    seen = np.flatnonzero(cameras)
+
+    spread = np.full(cell_count, np.nan)
+    nearest, farthest = np.full(cell_count, np.nan), np.full(cell_count, np.nan)
+    nearest_camera = np.full(cell_count, -1, dtype=np.int64)
+    farthest_camera = np.full(cell_count, -1, dtype=np.int64)
+    if len(seen):
+        offsets = sources[pair_cameras] - centres[pair_cells]
+        distances = norms(offsets)
+        starts = np.concatenate(([0], np.cumsum(cameras[seen])[:-1]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            resultants = np.add.reduceat(offsets / distances[:, None], starts, axis=0)
+        spread[seen] = np.degrees(
+            np.arccos(np.clip(norms(resultants) / cameras[seen], -1, 1))
+        )
+        nearest[seen] = np.minimum.reduceat(distances, starts)
+        farthest[seen] = np.maximum.reduceat(distances, starts)
+        nearest_camera[seen] = pair_cameras[
+            first_match(distances == nearest[pair_cells], pair_cells)
+        ]
+        farthest_camera[seen] = pair_cameras[
+            first_match(distances == farthest[pair_cells], pair_cells)
+        ]
+    return Coverage(
+        rays, cameras, spread, nearest, nearest_camera, farthest, farthest_camera
+    )
+
+
+def distinct(keys: np.ndarray) -> np.ndarray:
+    """
+    Returns the sorted distinct values of an integer array, like np.unique but with a plain sort, which stays fast
+    for tens of millions of keys on every NumPy version.
+    """
+
+    keys = np.sort(keys)
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return keys[first]
+
+
+def first_match(mask: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """
+    Returns the index of the first True of every run of equal, sorted group ids, for groups with one.
+    """
+
+    matches = np.flatnonzero(mask)
+    found = groups[matches]
+    first = np.ones(len(found), dtype=bool)
+    first[1:] = found[1:] != found[:-1]
+    return matches[first]
+
+
+def subspace_coverage(subspace: SubSpace, rig: Rig) -> Coverage:
+    """
+    Computes the Coverage of a SubSpace whose array-backed store was filled by tracing a rig, e.g. tracing.trace.
+    """
+
+    return coverage(subspace.assignments, subspace.centres, rig.sources)
@@ -0,0 +1,313 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import Iterable, Iterator, Optional, Tuple
+import numpy as np
+from packages.collections import Rig
+from packages.objects import Point, SubSpace, ASSIGNMENT_DTYPE, SUBJECT_MARGIN
+from packages.utils import precision
+
+DEF_WINDOW = 1_000_000
+DEF_CHUNK_SIZE = 1_000_000
+HEADER_SUFFIX = ".json"
+DATA_SUFFIX = ".bin"
+
+
+class MemmapArray:
+    """
+    An array of fixed shape rows kept in a file on disk, which producers append to chunk by chunk and consumers read
+    back as np.memmap windows, so neither ever holds more than a chunk or a window in memory.
+
+    The rows are stored raw in "<path>.bin" and their dtype, row shape and count in "<path>.json", so finished
+    arrays can be reopened with MemmapArray.open for inspection or reuse.
+
+    Parameters:
+    path (str): The file path without suffix.
+    row_shape (tuple): The shape of every row, e.g. (3,) for points or (2, 3) for rays.
+    dtype (optional): The dtype of the rows, defaults to the precision setting.
+    """
+
+    def __init__(self, path: str, row_shape: tuple = (3,), dtype=None):
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(precision() if dtype is None else dtype)
+        self.count = 0
+        self.file = open(path + DATA_SUFFIX, "wb")
+        self.write_header()
+
+    @staticmethod
+    def open(path: str) -> "MemmapArray":
+        """
+        Reopens a stored array for reading, or for appending more rows.
+        """
+
+        with open(path + HEADER_SUFFIX) as file:
+            header = json.load(file)
+        array = MemmapArray.__new__(MemmapArray)
+        array.path, array.file = path, None
+        array.row_shape = tuple(header["row_shape"])
+        array.dtype = np.dtype(header["dtype"])
+        array.count = header["count"]
+        return array
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, rows: np.ndarray) -> None:
+        """
+        Appends a chunk of rows, converting them to the array's dtype.
+        """
+
+        rows = np.asarray(rows, dtype=self.dtype).reshape((-1,) + self.row_shape)
+        if self.file is None:
+            self.file = open(self.path + DATA_SUFFIX, "ab")
+        self.file.write(rows.tobytes())
+        self.count += len(rows)
+
+    def extend(self, chunks: Iterable[np.ndarray]) -> "MemmapArray":
+        """
+        Appends every chunk of an iterable, e.g. export.rig_rays, and flushes.
+
+        Returns:
+        MemmapArray: The array, for chaining.
+        """
+
+        for chunk in chunks:
+            self.append(chunk)
+        self.flush()
+        return self
+
+    def write_header(self) -> None:
+        with open(self.path + HEADER_SUFFIX, "w") as file:
+            json.dump(
+                {
+                    "dtype": self.dtype.str,
+                    "row_shape": list(self.row_shape),
+                    "count": self.count,
+                },
+                file,
+            )
+
+    def flush(self) -> None:
+        if self.file is not None:
+            self.file.flush()
+        self.write_header()
+
+    def close(self) -> None:
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self) -> "MemmapArray":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        Returns a read only np.memmap of every row written so far, which only reads the parts that are accessed.
+        """
+
+        self.flush()
+        if not self.count:
+            return np.empty((0,) + self.row_shape, dtype=self.dtype)
+        return np.memmap(
+            self.path + DATA_SUFFIX,
+            dtype=self.dtype,
+            mode="r",
+            shape=(self.count,) + self.row_shape,
+        )
+
+    def windows(self, window: int = DEF_WINDOW) -> Iterator[np.ndarray]:
+        """
+        Yields consecutive memmap windows of at most `window` rows.
+        """
+
+        array = self.array
+        for start in range(0, len(array), window):
+            yield array[start : start + window]
+
+
+class Scratch:
+    """
+    A directory holding the MemmapArrays of a run.
+
+    Parameters:
+    directory (str, optional): Where to keep the arrays, a new temporary directory if None.
+    keep (bool): If False, the directory is deleted when the Scratch is used as a context manager and exits.
+    """
+
+    def __init__(self, directory: Optional[str] = None, keep: bool = True):
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="geomkit-")
+        os.makedirs(directory, exist_ok=True)
+        self.directory, self.keep = directory, keep
+
+    def array(self, name: str, row_shape: tuple = (3,), dtype=None) -> MemmapArray:
+        """
+        Creates, or truncates, the array called `name`.
+        """
+
+        return MemmapArray(os.path.join(self.directory, name), row_shape, dtype)
+
+    def open(self, name: str) -> MemmapArray:
+        return MemmapArray.open(os.path.join(self.directory, name))
+
+    def __enter__(self) -> "Scratch":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if not self.keep:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def stream_assignments(subspace: SubSpace, path: str) -> MemmapArray:
+    """
+    Moves the assignment store of a SubSpace to a MemmapArray on disk, so that tracing appends every tile's rows to
+    the file instead of memory and subspace.assignments reads them back as a np.memmap.
+
+    Rows already stored are written first.
+
+    Parameters:
+    subspace (SubSpace): The SubSpace whose store to move.
+    path (str): The file path without suffix, e.g. in a Scratch directory.
+
+    Returns:
+    MemmapArray: The sink, to close once the run is over.
+    """
+
+    sink = MemmapArray(path, (3,), ASSIGNMENT_DTYPE)
+    if subspace.assignment_sink is None:
+        sink.append(subspace.assignments)
+    else:
+        sink.extend(subspace.assignment_sink.windows())
+    sink.flush()
+    subspace.assignment_chunks, subspace.assignment_sink = [], sink
+    return sink
+
+
+def mesh_samples(
+    rig: Rig,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    density: int,
+    subject_radius: float,
+    chunk_size: int = DEF_CHUNK_SIZE,
+    dtype=None,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Streams the samples Line.to_mesh keeps along every pixel ray of a rig, `density` evenly spaced points from the
+    camera to the end of the ray that lie inside the subject bound, without building any Line or Point.
+
+    Returns:
+    Iterator[Tuple[np.ndarray, np.ndarray]]: Chunks of at most about chunk_size (n, 3) samples of the given dtype
+    with the (n, 2) int32 camera and pixel ids of the ray each came from.
+    """
+
+    dtype = precision(dtype)
+    pixels = pixel_width * pixel_height
+    rays = max(chunk_size // density, 1)
+    t = np.linspace(0, ray_length, density)
+    bound = subject_radius * SUBJECT_MARGIN
+    for camera in range(len(rig)):
+        for start in range(0, pixels, rays):
+            ids = np.arange(start, min(start + rays, pixels))
+            grid = np.column_stack((ids // pixel_height, ids % pixel_height))
+            directions = rig.pixel_directions(
+                pixel_width, pixel_height, grid.astype(float), [camera], np.float64
+            )[0]
+            samples = rig.sources[camera] + directions[:, None, :] * t[:, None]
+            inside = np.linalg.norm(samples, axis=-1) < bound
+            owners = np.column_stack((np.full(len(ids), camera), ids)).astype(np.int32)
+            yield samples[inside].astype(dtype), np.repeat(
+                owners, inside.sum(axis=-1), axis=0
+            )
+
+
+def ball_query(
+    cloud: MemmapArray,
+    centres: np.ndarray,
+    radius: float,
+    window: int = DEF_WINDOW,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Finds the samples of a stored cloud within `radius` of each centre, building a KDTree over one window of the
+    cloud at a time so that only a window is ever in memory.
+
+    Returns:
+    Iterator[Tuple[int, np.ndarray]]: (centre index, sorted global sample indices) for every centre and window with
+    at least one sample in range.
+    """
+
+    from scipy.spatial import KDTree
+
+    for offset, points in zip(range(0, len(cloud), window), cloud.windows(window)):
+        tree = KDTree(np.asarray(points))
+        for index, found in enumerate(tree.query_ball_point(centres, radius)):
+            if found:
+                yield index, offset + np.sort(np.array(found, dtype=np.int64))
+
+
+def load_assignments(
+    subspace: SubSpace,
+    cloud: MemmapArray,
+    assignments: MemmapArray,
+    window: int = DEF_WINDOW,
+) -> SubSpace:
+    """
+    Fills subspace.subspace_assignments from stored (centre, sample) rows, e.g. written from ball_query, reading the
+    rows one window at a time, so that the SubSpace holds the same points the in-memory assignment stage gives it.
+
+    Parameters:
+    subspace (SubSpace): The SubSpace whose centres the rows index.
+    cloud (MemmapArray): The (N, 3) samples the rows index.
+    assignments (MemmapArray): The (K, 2) integer rows.
+    window (int): The number of rows read at a time.
+
+    Returns:
+    SubSpace: The same SubSpace.
+    """
+
+    for rows in assignments.windows(window):
+        rows = np.asarray(rows)
+        coordinates = cloud.array[rows[:, 1]].astype(np.float64)
+        for centre, coordinate in zip(rows[:, 0], coordinates):
+            subspace.subspace_assignments[str(subspace.points[centre])].add(
+                Point.from_np(coordinate)
+            )
+    return subspace
+
+
+def bin_samples(
+    cloud: MemmapArray,
+    subspace: SubSpace,
+    window: int = DEF_WINDOW,
+    out: Optional[MemmapArray] = None,
+) -> np.ndarray:
+    """
+    Counts the samples of a stored cloud in every SubSpace cell, one window at a time.
+
+    Parameters:
+    cloud (MemmapArray): The (N, 3) samples.
+    subspace (SubSpace): The cells.
+    window (int): The number of samples read at a time.
+    out (MemmapArray, optional): Receives the cell id of every sample (-1 outside every cell), aligned with the cloud.
+
+    Returns:
+    np.ndarray: The number of samples in each cell, in cell id order.
+    """
+
+    counts = np.zeros(len(subspace.centres), dtype=np.int64)
+    for points in cloud.windows(window):
+        cells = subspace.locate(np.asarray(points))
+        counts += np.bincount(cells[cells >= 0], minlength=len(counts))
+        if out is not None:
+            out.append(cells)
+    if out is not None:
+        out.flush()
+    return counts
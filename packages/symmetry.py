@@ -0,0 +1,369 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from packages.collections import Rig
+from packages.culling import DEF_TILE_SIZE, split_tiles
+from packages.instrumentation import stage
+from packages.objects import SubSpace, SUBJECT_MARGIN
+from packages.tracing import clip_rays, ray_samples, store_assignments, trace
+from packages.utils import norms, precision
+
+DEF_ATOL = 1e-9
+QUARTER_TURN = 90
+
+
+class RingSymmetry(NamedTuple):
+    """
+    Which cameras of a rig are rotations of others about the z-axis.
+
+    Camera i sees exactly what camera canonical[i] sees, turned by angles[i] degrees about z: its centre and frame are
+    those of its canonical camera rotated by that angle, with the same intrinsics. Traced cameras are their own
+    canonical camera, at 0 degrees.
+    """
+
+    canonical: np.ndarray
+    angles: np.ndarray
+
+    @property
+    def traced(self) -> np.ndarray:
+        return np.flatnonzero(self.canonical == np.arange(len(self.canonical)))
+
+    @property
+    def derived(self) -> np.ndarray:
+        return np.flatnonzero(self.canonical != np.arange(len(self.canonical)))
+
+    @staticmethod
+    def from_rings(sizes: Sequence[int], rebin: bool = False) -> "RingSymmetry":
+        """
+        Builds the symmetry of consecutive rings of evenly spaced cameras, like Points.get_points_at_inclinations
+        places, without checking the rig.
+
+        Parameters:
+        sizes (Sequence[int]): The number of cameras on each ring, in camera order, e.g. 1 for a pole.
+        rebin (bool): If True, every camera of a ring is derived from its first one. Otherwise cameras are only
+        derived by quarter turns, so a ring of n keeps n / gcd(n, 4) traced cameras.
+
+        Returns:
+        RingSymmetry: The symmetry.
+        """
+
+        canonical, angles = [], []
+        for size in sizes:
+            start = len(canonical)
+            for camera in range(start, start + size):
+                source = camera
+                for candidate in range(start, camera):
+                    angle = (camera - candidate) * 360 / size
+                    if canonical[candidate] == candidate and (
+                        rebin or is_quarter_turn(angle)
+                    ):
+                        source = candidate
+                        break
+                canonical.append(source)
+                angles.append((camera - source) * 360 / size)
+        return RingSymmetry(np.array(canonical, dtype=np.int64), np.array(angles))
+
+    @staticmethod
+    def detect(rig: Rig, rebin: bool = False, atol: float = DEF_ATOL) -> "RingSymmetry":
+        """
+        Finds the cameras of a rig that are rotations of earlier ones about the z-axis, whatever their placement.
+
+        Each camera is compared with the cameras traced so far: it is derived from the first one whose frame, turned
+        about z by some angle, gives its own frame and centre within atol, with the same intrinsics.
+
+        Parameters:
+        rig (Rig): The cameras.
+        rebin (bool): If True, cameras may be derived by any angle, otherwise only by quarter turns, which only
+        derives cameras on rings whose size is even and saves most on multiples of 4.
+        atol (float): The tolerance on frames, centres and intrinsics.
+
+        Returns:
+        RingSymmetry: The symmetry.
+        """
+
+        canonical, angles = np.arange(len(rig)), np.zeros(len(rig))
+        traced: List[int] = []
+        for camera in range(len(rig)):
+            if traced:
+                candidates = np.array(traced)
+                # R_camera = R_candidate @ Rz(angle).T, so R_candidate.T @ R_camera is Rz(-angle)
+                turns = np.einsum(
+                    "nji,jk->nik", rig.rotations[candidates], rig.rotations[camera]
+                )
+                candidate_angles = np.degrees(
+                    np.arctan2(turns[:, 0, 1], turns[:, 0, 0])
+                )
+                rotations = z_rotation(candidate_angles)
+                match = (
+                    np.all(
+                        np.isclose(
+                            turns, np.swapaxes(rotations, -1, -2), rtol=0, atol=atol
+                        ),
+                        axis=(1, 2),
+                    )
+                    & np.all(
+                        np.isclose(
+                            np.einsum("nij,nj->ni", rotations, rig.sources[candidates]),
+                            rig.sources[camera],
+                            rtol=0,
+                            atol=atol,
+                        ),
+                        axis=-1,
+                    )
+                    & same_intrinsics(rig, candidates, camera, atol)
+                )
+                if not rebin:
+                    match &= is_quarter_turn(candidate_angles)
+                if match.any():
+                    first = np.argmax(match)
+                    canonical[camera] = candidates[first]
+                    angles[camera] = candidate_angles[first] % 360
+                    continue
+            traced.append(camera)
+        return RingSymmetry(canonical, angles)
+
+
+def same_intrinsics(
+    rig: Rig, candidates: np.ndarray, camera: int, atol: float = DEF_ATOL
+) -> np.ndarray:
+    return np.all(
+        [
+            np.isclose(values[candidates], values[camera], rtol=0, atol=atol)
+            for values in (rig.focals, rig.widths, rig.heights)
+        ],
+        axis=0,
+    )
+
+
+def is_quarter_turn(angles, atol: float = DEF_ATOL):
+    """
+    Whether angles in degrees are whole multiples of QUARTER_TURN, which map the SubSpace grid onto itself.
+    """
+
+    turns = np.asarray(angles) / QUARTER_TURN
+    return np.isclose(turns, np.round(turns), rtol=0, atol=atol)
+
+
+def z_rotation(angles) -> np.ndarray:
+    """
+    Returns the (..., 3, 3) matrices turning points by angles in degrees about the z-axis.
+    """
+
+    radians = np.radians(angles)
+    cos, sin = np.cos(radians), np.sin(radians)
+    zeros, ones = np.zeros_like(cos), np.ones_like(cos)
+    return np.stack(
+        (
+            np.stack((cos, -sin, zeros), axis=-1),
+            np.stack((sin, cos, zeros), axis=-1),
+            np.stack((zeros, zeros, ones), axis=-1),
+        ),
+        axis=-2,
+    )
+
+
+def cell_rotation(subspace: SubSpace, angle: float) -> np.ndarray:
+    """
+    Returns where every cell goes when the grid is turned by a quarter turn multiple about z.
+
+    The SubSpace is a cube centred at the origin, so such a turn maps every cell centre onto another one exactly.
+
+    Returns:
+    np.ndarray: The cell id each cell id is turned into.
+    """
+
+    if not is_quarter_turn(angle):
+        raise ValueError(f"only quarter turns map cells onto cells, got {angle}")
+    return subspace.locate(subspace.centres @ z_rotation(angle).T)
+
+
+def rotation_bounds(subspace: SubSpace) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns a box holding the SubSpace turned by any angle about z.
+    """
+
+    low, high = subspace.bounds
+    scale = np.array([np.sqrt(2), np.sqrt(2), 1])
+    return low * scale, high * scale
+
+
+def subset(rig: Rig, cameras: np.ndarray) -> Rig:
+    return Rig(
+        rig.sources[cameras],
+        rig.rotations[cameras],
+        rig.focals[cameras],
+        rig.widths[cameras],
+        rig.heights[cameras],
+    )
+
+
+def rebin(
+    rig: Rig,
+    subspace: SubSpace,
+    camera: int,
+    derived: List[Tuple[int, float]],
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    subject_radius: float,
+    density: Optional[int],
+    step: Optional[float] = None,
+    dtype=None,
+    tile_size: int = DEF_TILE_SIZE,
+    on_assignments: Optional[Callable] = None,
+) -> None:
+    """
+    Assigns cameras whose angle from their canonical camera is not a quarter turn by re-binning its samples.
+
+    The canonical camera's samples are built one pixel tile at a time, over every point of the subject bound that a
+    turn about z can bring into the grid, then turned by each derived camera's angle and located in the grid. This
+    gives the derived cameras' exact (cell, pixel) pairs, to rounding, while building rays and samples only once.
+
+    Parameters:
+    camera (int): The canonical camera.
+    derived (List[Tuple[int, float]]): The (camera, angle in degrees) of the cameras derived from it.
+    """
+
+    dtype = precision(dtype)
+    bound = subject_radius * SUBJECT_MARGIN
+    low, high = rotation_bounds(subspace)
+    pixel_count = pixel_width * pixel_height
+    rotations = [
+        (target, z_rotation(angle).T.astype(dtype)) for target, angle in derived
+    ]
+    origin = rig.sources[camera]
+    for tile in split_tiles(camera, pixel_width, pixel_height, tile_size):
+        directions = rig.pixel_directions(
+            pixel_width, pixel_height, tile.pixels(), [camera], dtype
+        )[0]
+        enter, exit_ = clip_rays(origin, directions, low, high, bound, ray_length)
+        hit = enter <= exit_
+        if not hit.any():
+            continue
+        samples, ray = ray_samples(
+            origin, directions[hit], enter[hit], exit_[hit], ray_length, density, step
+        )
+        inside = norms(samples) < bound
+        samples = samples[inside]
+        pixels = tile.pixel_ids(pixel_height)[hit][ray][inside]
+        for target, rotation in rotations:
+            cells = subspace.locate(samples @ rotation)
+            keep = cells >= 0
+            pairs = np.unique(cells[keep] * pixel_count + pixels[keep])
+            store_assignments(
+                subspace,
+                pairs // pixel_count,
+                target,
+                pairs % pixel_count,
+                on_assignments,
+            )
+
+
+def trace_symmetric(
+    rig: Rig,
+    subspace: SubSpace,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    subject_radius: float,
+    density: Optional[int] = None,
+    beam: bool = False,
+    step: Optional[float] = None,
+    dtype=None,
+    symmetry: Optional[RingSymmetry] = None,
+    rebin_cameras: bool = False,
+    tile_size: int = DEF_TILE_SIZE,
+    processes: int = 1,
+    chunksize: int = 16,
+    on_assignments: Optional[Callable] = None,
+) -> SubSpace:
+    """
+    Assigns the pixels of every camera to the SubSpace cells they see like tracing.trace, tracing only one camera of
+    every set of cameras that are rotations of each other about the z-axis, e.g. the rings of
+    Points.get_points_at_inclinations.
+
+    Only the canonical cameras of the symmetry go through tracing.trace. A camera a quarter turn multiple away from
+    its canonical camera gets the canonical camera's assignments with their cells turned, since such turns map the
+    grid onto itself. Other angles are re-binned from the canonical camera's samples, see rebin. Beam footprints
+    can't be re-binned, so with beam set those cameras are traced instead.
+
+    Turning cells costs next to nothing, while re-binning still builds and locates every sample of the canonical
+    camera once per derived camera, so it saves ray generation and clipping but not the sorting of the pairs. Quarter
+    turns alone are the faster choice for rings of a multiple of 4 cameras.
+
+    The default of quarter turns only keeps n / gcd(n, 4) traced cameras of a ring of n: it pays off in full for
+    rings of a multiple of 4 cameras, halves the tracing of other even rings and saves nothing on odd ones, like the
+    rings of 3 cameras main.py places, unless rebin_cameras is set.
+
+    Parameters:
+    symmetry (RingSymmetry, optional): Which cameras to derive from which, detected from the rig if None.
+    rebin_cameras (bool): Whether a detected symmetry may derive cameras by angles other than quarter turns. Set it
+    for rings whose size isn't a multiple of 4.
+
+    See tracing.trace for the other parameters; processes only applies to the traced cameras.
+
+    Returns:
+    SubSpace: The given subspace, for chaining.
+    """
+
+    if density is None and step is None and not beam:
+        raise ValueError("density or step is required unless beam is set")
+    if symmetry is None:
+        symmetry = RingSymmetry.detect(rig, rebin=rebin_cameras and not beam)
+    canonical = symmetry.canonical.copy()
+    turned: Dict[int, List[Tuple[int, np.ndarray]]] = {}
+    rebinned: Dict[int, List[Tuple[int, float]]] = {}
+    for camera in symmetry.derived:
+        source, angle = canonical[camera], symmetry.angles[camera]
+        if is_quarter_turn(angle):
+            turned.setdefault(source, []).append(
+                (camera, cell_rotation(subspace, angle))
+            )
+        elif beam:
+            canonical[camera] = camera
+        else:
+            rebinned.setdefault(source, []).append((camera, angle))
+    traced = np.flatnonzero(canonical == np.arange(len(canonical)))
+
+    def derive(cells, camera, pixels):
+        camera = traced[camera]
+        if on_assignments is not None:
+            on_assignments(cells, camera, pixels)
+        for target, rotation in turned.get(camera, ()):
+            store_assignments(subspace, rotation[cells], target, pixels, on_assignments)
+
+    local = trace(
+        subset(rig, traced),
+        SubSpace(subspace.divisions, subspace.length),
+        pixel_width,
+        pixel_height,
+        ray_length,
+        subject_radius,
+        density,
+        beam,
+        step,
+        dtype,
+        tile_size,
+        processes,
+        chunksize,
+        derive,
+    )
+    rows = local.assignments
+    subspace.add_assignments(rows[:, 0], traced[rows[:, 1]], rows[:, 2])
+    with stage("rebin"):
+        for camera, derived in rebinned.items():
+            rebin(
+                rig,
+                subspace,
+                camera,
+                derived,
+                pixel_width,
+                pixel_height,
+                ray_length,
+                subject_radius,
+                density,
+                step,
+                dtype,
+                tile_size,
+                on_assignments,
+            )
+    return subspace
@@ -0,0 +1,452 @@
+from functools import partial
+from multiprocessing import Pool
+from typing import Callable, Optional, Tuple
+import numpy as np
+from packages.collections import Rig
+from packages.culling import PixelTile, CellRange, DEF_TILE_SIZE, cull
+from packages.instrumentation import Collected, count, enabled, merge, stage
+from packages.multiprocessing_utils import init_worker, run_worker
+from packages.objects import SubSpace, SUBJECT_MARGIN
+from packages.utils import camera_to_pixel, pixel_to_camera, precision
+
+
+def clip_rays(
+    origin: np.ndarray,
+    directions: np.ndarray,
+    low: np.ndarray,
+    high: np.ndarray,
+    radius: float,
+    ray_length: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Clips rays to the part that lies inside both a box and a sphere centred at the origin.
+
+    Parameters:
+    origin (np.ndarray): The (3,) shared start of the rays.
+    directions (np.ndarray): The (R, 3) unit ray directions.
+    low, high (np.ndarray): The corners of the box.
+    radius (float): The radius of the sphere.
+    ray_length (float): The length of every ray.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The (R,) entry and exit distances along each ray, with entry > exit for rays that
+    miss.
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        near = (low - origin) / directions
+        far = (high - origin) / directions
+    near = np.where(np.isnan(near), -np.inf, near)
+    far = np.where(np.isnan(far), np.inf, far)
+    enter = np.minimum(near, far).max(axis=-1)
+    exit_ = np.maximum(near, far).min(axis=-1)
+
+    b = directions @ origin
+    discriminant = b**2 - (origin @ origin - radius**2)
+    root = np.sqrt(np.maximum(discriminant, 0))
+    enter = np.maximum.reduce([enter, -b - root, np.zeros_like(b)])
+    exit_ = np.minimum.reduce([exit_, -b + root, np.full_like(b, ray_length)])
+    return enter, np.where(discriminant >= 0, exit_, -np.inf)
+
+
+def ray_samples(
+    origin: np.ndarray,
+    directions: np.ndarray,
+    enter: np.ndarray,
+    exit_: np.ndarray,
+    ray_length: float,
+    density: Optional[int],
+    step: Optional[float] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Builds the samples of every ray that lie between its entry and exit distances, on the grid of points spaced
+    `step` apart from the origin (by default where Line.to_mesh puts its `density` points).
+
+    Parameters:
+    origin (np.ndarray): The (3,) shared start of the rays.
+    directions (np.ndarray): The (R, 3) unit ray directions, whose dtype the samples take.
+    enter, exit_ (np.ndarray): The (R,) clipped chords, e.g. from clip_rays.
+    ray_length (float): The length of every ray.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The (S, 3) samples and the index of the ray each belongs to.
+    """
+
+    dtype = directions.dtype
+    step = ray_length / max(density - 1, 1) if step is None else step
+    last_index = int(np.floor(ray_length / step + 1e-9))
+    first = np.maximum(np.floor(enter / step), 0).astype(np.int64)
+    last = np.minimum(np.ceil(exit_ / step), last_index).astype(np.int64)
+    counts = np.maximum(last - first + 1, 0)
+    ray = np.repeat(np.arange(len(counts)), counts)
+    index = (
+        first[ray]
+        + np.arange(counts.sum())
+        - np.repeat(np.cumsum(counts) - counts, counts)
+    )
+    samples = (
+        origin.astype(dtype) + directions[ray] * (index * step).astype(dtype)[:, None]
+    )
+    return samples, ray
+
+
+def trace_tile(
+    rig: Rig,
+    subspace: SubSpace,
+    tile: PixelTile,
+    cell_range: CellRange,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    density: Optional[int],
+    subject_radius: float,
+    step: Optional[float] = None,
+    dtype=None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Traces the rays of one pixel tile and finds the cells of a culled range they pass through.
+
+    Samples are spaced `step` apart from the camera, which by default puts them where Line.to_mesh does (`density`
+    evenly spaced points from the camera to the end of the ray). Only the samples of each ray's own chord through the
+    cell range and the subject bound are built, so the work per ray follows that chord's length. Directions and
+    samples are held in `dtype`, the precision setting by default, while chords are clipped in float64.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The flat cell ids and pixel ids of every distinct (cell, pixel) pair.
+    """
+
+    dtype = precision(dtype)
+    origin = rig.sources[tile.camera]
+    directions = rig.pixel_directions(
+        pixel_width, pixel_height, tile.pixels(), [tile.camera], dtype
+    )[0]
+    low, high = cell_range.bounds(subspace)
+    enter, exit_ = clip_rays(
+        origin, directions, low, high, subject_radius * SUBJECT_MARGIN, ray_length
+    )
+    hit = enter <= exit_
+    count("rays", len(hit))
+    if not hit.any():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    samples, ray = ray_samples(
+        origin, directions[hit], enter[hit], exit_[hit], ray_length, density, step
+    )
+    inside = np.linalg.norm(samples, axis=-1) < subject_radius * SUBJECT_MARGIN
+    cells = subspace.locate(samples)
+    keep = inside & (cells >= 0)
+    keep[keep] = cell_range.contains(subspace, cells[keep])
+    count("rays_hit", hit.sum())
+    count("samples_kept", keep.sum())
+    count("samples_discarded", len(keep) - keep.sum())
+    pixels = tile.pixel_ids(pixel_height)[hit][ray]
+    pairs = np.unique(cells[keep] * (pixel_width * pixel_height) + pixels[keep])
+    return pairs // (pixel_width * pixel_height), pairs % (pixel_width * pixel_height)
+
+
+def sample_budget(
+    rig: Rig,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    subject_radius: float,
+    step: float,
+    stride: int = 16,
+) -> int:
+    """
+    Estimates how many samples tracing with a given step will build, before any tile is traced.
+
+    The chords of every `stride`-th pixel ray through the subject bound are computed analytically and scaled up to
+    the full pixel grid.
+
+    Returns:
+    int: The estimated number of samples over the whole rig.
+    """
+
+    widths = np.arange(0, pixel_width, stride)
+    heights = np.arange(0, pixel_height, stride)
+    pixels = np.stack(np.meshgrid(widths, heights, indexing="ij"), axis=-1)
+    directions = rig.pixel_directions(
+        pixel_width, pixel_height, pixels.reshape(-1, 2).astype(float), dtype=np.float64
+    )
+    radius = subject_radius * SUBJECT_MARGIN
+    b = np.einsum("npi,ni->np", directions, rig.sources)
+    c = np.einsum("ni,ni->n", rig.sources, rig.sources)[:, None] - radius**2
+    root = np.sqrt(np.maximum(b**2 - c, 0))
+    chords = np.clip(-b + root, 0, ray_length) - np.clip(-b - root, 0, ray_length)
+    samples = np.where(b**2 > c, chords / step + 1, 0)
+    scale = pixel_width * pixel_height / pixels[..., 0].size
+    return int(np.ceil(samples.sum() * scale))
+
+
+def pixel_frustum_normals(
+    rig: Rig, tile: PixelTile, pixel_width: int, pixel_height: int
+) -> np.ndarray:
+    """
+    Returns the inward world normals of the four side planes of every pixel footprint in a tile.
+
+    A footprint spans half a pixel either side of the pixel centre and its side planes all pass through the camera
+    centre, so a point x is inside when normal . (x - source) >= 0 for all four normals.
+
+    Returns:
+    np.ndarray: A (P, 4, 3) array in tile.pixels() order.
+    """
+
+    pixels = tile.pixels()
+    offsets = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]])
+    corners = pixel_to_camera(
+        pixels[:, None, :] + offsets,
+        rig.intrinsics(pixel_width, pixel_height)[tile.camera],
+    )
+    sides = np.cross(corners, np.roll(corners, -1, axis=1))
+    return sides @ rig.rotations[tile.camera]
+
+
+def beam_tile(
+    rig: Rig,
+    subspace: SubSpace,
+    tile: PixelTile,
+    cell_range: CellRange,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    subject_radius: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the cells of a culled range seen by the footprint of each pixel of a tile, without sampling along rays.
+
+    Every cell touching the subject bound and within reach of the camera is rasterised conservatively: its eight
+    corners are projected onto the sensor and every pixel whose footprint overlaps their bounding rectangle becomes a
+    candidate. Candidates are then kept only if the cell box also straddles all four side planes of the pixel's
+    footprint frustum, so thin crossings are never missed however few pixels there are.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The flat cell ids and pixel ids of every distinct (cell, pixel) pair.
+    """
+
+    cells = cell_range.cell_ids(subspace)
+    low, high = subspace.cell_bounds(cells)
+    source = rig.sources[tile.camera]
+    nearest_subject = np.linalg.norm(np.clip(0, low, high), axis=-1)
+    nearest_camera = np.linalg.norm(np.clip(source, low, high) - source, axis=-1)
+    reachable = (nearest_subject <= subject_radius * SUBJECT_MARGIN) & (
+        nearest_camera <= ray_length
+    )
+    cells, low, high = cells[reachable], low[reachable], high[reachable]
+
+    corners = np.stack(
+        [
+            np.where([x, y, z], high, low)
+            for x in (0, 1)
+            for y in (0, 1)
+            for z in (0, 1)
+        ],
+        axis=1,
+    )
+    camera_corners = rig.world_to_camera(corners.reshape(-1, 3), [tile.camera])
+    camera_corners = camera_corners.reshape(corners.shape)
+    depths = camera_corners[..., 2]
+    in_front = depths.min(axis=-1) > 0
+    visible = depths.max(axis=-1) > 0
+    cells, low, high = cells[visible], low[visible], high[visible]
+    camera_corners, in_front = camera_corners[visible], in_front[visible]
+
+    w_range = np.tile([tile.w0, tile.w1 - 1], (len(cells), 1))
+    h_range = np.tile([tile.h0, tile.h1 - 1], (len(cells), 1))
+    if in_front.any():
+        uv = camera_to_pixel(
+            camera_corners[in_front],
+            rig.intrinsics(pixel_width, pixel_height)[tile.camera],
+        )
+        w_range[in_front, 0] = np.ceil(uv[..., 0].min(axis=-1) - 0.5)
+        w_range[in_front, 1] = np.floor(uv[..., 0].max(axis=-1) + 0.5)
+        h_range[in_front, 0] = np.ceil(uv[..., 1].min(axis=-1) - 0.5)
+        h_range[in_front, 1] = np.floor(uv[..., 1].max(axis=-1) + 0.5)
+    w_range = np.clip(w_range, tile.w0, tile.w1 - 1)
+    h_range = np.clip(h_range, tile.h0, tile.h1 - 1)
+    widths = np.maximum(w_range[:, 1] - w_range[:, 0] + 1, 0)
+    heights = np.maximum(h_range[:, 1] - h_range[:, 0] + 1, 0)
+    heights[(w_range[:, 1] < w_range[:, 0]) | (h_range[:, 1] < h_range[:, 0])] = 0
+
+    counts = widths * heights
+    candidate = np.repeat(np.arange(len(cells)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    w = w_range[candidate, 0] + offset // heights[candidate]
+    h = h_range[candidate, 0] + offset % heights[candidate]
+
+    normals = pixel_frustum_normals(rig, tile, pixel_width, pixel_height)
+    local = (w - tile.w0) * (tile.h1 - tile.h0) + (h - tile.h0)
+    centres = (low[candidate] + high[candidate]) / 2 - source
+    halves = (high[candidate] - low[candidate]) / 2
+    reach = np.einsum("cpi,ci->cp", normals[local], centres) + np.einsum(
+        "cpi,ci->cp", np.abs(normals[local]), halves
+    )
+    seen = np.all(reach >= 0, axis=-1)
+    count("beam_candidates", len(seen))
+    count("beam_pairs", seen.sum())
+    return cells[candidate[seen]], (w * pixel_height + h)[seen]
+
+
+def trace_pair(
+    tile: PixelTile,
+    cell_range: CellRange,
+    rig: Rig,
+    subspace: SubSpace,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    subject_radius: float,
+    density: Optional[int] = None,
+    beam: bool = False,
+    step: Optional[float] = None,
+    dtype=None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs one culled (tile, cell range) pair through the ray stage, or the beam stage when beam is set.
+    """
+
+    if beam:
+        with stage("beam_tile"):
+            return beam_tile(
+                rig,
+                subspace,
+                tile,
+                cell_range,
+                pixel_width,
+                pixel_height,
+                ray_length,
+                subject_radius,
+            )
+    with stage("trace_tile"):
+        return trace_tile(
+            rig,
+            subspace,
+            tile,
+            cell_range,
+            pixel_width,
+            pixel_height,
+            ray_length,
+            density,
+            subject_radius,
+            step,
+            dtype,
+        )
+
+
+def tile_to_assignments(pair: Tuple[PixelTile, CellRange], **kwargs):
+    tile, cell_range = pair
+    return tile.camera, *trace_pair(tile, cell_range, **kwargs)
+
+
+def trace(
+    rig: Rig,
+    subspace: SubSpace,
+    pixel_width: int,
+    pixel_height: int,
+    ray_length: float,
+    subject_radius: float,
+    density: Optional[int] = None,
+    beam: bool = False,
+    step: Optional[float] = None,
+    dtype=None,
+    tile_size: int = DEF_TILE_SIZE,
+    processes: int = 1,
+    chunksize: int = 16,
+    on_assignments: Optional[Callable] = None,
+) -> SubSpace:
+    """
+    Assigns the pixels of every camera to the SubSpace cells they see, one pixel tile at a time.
+
+    Sensors are culled and split into tiles of at most tile_size x tile_size pixels, and every surviving tile goes
+    through ray generation, traversal and assignment on its own. Each tile's (cell, pixel) pairs are reduced into the
+    SubSpace store as soon as they arrive, so the working memory of rays and samples is bound by the tile size and
+    the number of processes rather than by the sensor resolution.
+
+    The store itself holds every (cell, camera, pixel) row and is kept in memory by default, growing with the total
+    number of assignments. For rigs whose assignment doesn't fit, move it to disk first with
+    storage.stream_assignments, and the whole run stays bound by the tiles.
+
+    Parameters:
+    rig (Rig): The cameras.
+    subspace (SubSpace): The cells to assign to, whose store receives the results.
+    pixel_width, pixel_height (int): The pixel grid of every sensor.
+    ray_length (float): The length of every ray from its camera.
+    subject_radius (float): The radius of the subject sphere centred at the origin.
+    density (int, optional): The number of samples along each ray, required unless beam or step is set.
+    beam (bool): If True, assign pixel footprints instead of sampling single centre rays.
+    step (float, optional): The spacing of samples along rays, overriding density, e.g. subspace.step_length().
+    dtype (optional): The dtype of ray directions and samples, defaults to the precision setting of this process,
+    which worker processes then use too.
+    tile_size (int): The edge of the pixel tiles in pixels.
+    processes (int): The number of worker processes, 1 to run in this process.
+    chunksize (int): The number of tiles handed to a worker at a time.
+    on_assignments (Callable, optional): Called with every (cells, camera, pixels) batch once it is stored, e.g.
+    ProgressiveViewer.add.
+
+    When an Instrumentation is active, the cull and assign stages and every tile are timed, and rays, samples kept
+    and discarded, tiles, assignments and the cells holding them are counted, worker processes included.
+
+    Returns:
+    SubSpace: The given subspace, for chaining.
+    """
+
+    if density is None and step is None and not beam:
+        raise ValueError("density or step is required unless beam is set")
+    with stage("cull"):
+        pairs = cull(
+            rig,
+            subspace,
+            pixel_width,
+            pixel_height,
+            subject_radius,
+            ray_length,
+            tile_size,
+        )
+    count("tiles", len(pairs))
+    task = partial(
+        tile_to_assignments,
+        rig=rig,
+        subspace=SubSpace(subspace.divisions, subspace.length),
+        pixel_width=pixel_width,
+        pixel_height=pixel_height,
+        ray_length=ray_length,
+        subject_radius=subject_radius,
+        density=density,
+        beam=beam,
+        step=step,
+        dtype=precision(dtype),
+    )
+    with stage("assign"):
+        if processes == 1:
+            for camera, cells, pixels in map(task, pairs):
+                store_assignments(subspace, cells, camera, pixels, on_assignments)
+        else:
+            # workers report their own stages and counters back when instrumentation is on
+            collect = enabled()
+            with Pool(
+                processes,
+                initializer=init_worker,
+                initargs=(Collected(task) if collect else task,),
+            ) as pool:
+                for result in pool.imap_unordered(run_worker, pairs, chunksize):
+                    if collect:
+                        result, report = result
+                        merge(report)
+                    camera, cells, pixels = result
+                    store_assignments(subspace, cells, camera, pixels, on_assignments)
+    if enabled():
+        count("cells_touched", len(np.unique(subspace.assignments[:, 0])))
+    return subspace
+
+
+def store_assignments(
+    subspace: SubSpace,
+    cells: np.ndarray,
+    camera: int,
+    pixels: np.ndarray,
+    on_assignments: Optional[Callable] = None,
+) -> None:
+    subspace.add_assignments(cells, camera, pixels)
+    count("assignments", len(cells))
+    if on_assignments is not None and len(cells):
+        on_assignments(cells, camera, pixels)
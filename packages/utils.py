@@ -1,22 +1,115 @@
+from contextlib import contextmanager
+import math
+import numbers
 import numpy as np
 
+DEF_PRECISION = np.float64
+PRECISIONS = (np.dtype(np.float32), np.dtype(np.float64))
+# Held in a dict so that star imports of this module share the setting instead of copying it.
+PRECISION_SETTING = {"dtype": np.dtype(DEF_PRECISION)}
+# the builtins first, so that the common calls are settled before the numbers.Real check
+SCALAR_TYPES = (float, int, np.floating, np.integer, numbers.Real)
+
+
+def norms(arr, out=None):
+    """
+    Returns the Euclidean norms of (..., K) vectors along the last axis, optionally written into `out`.
+
+    A single vector goes through a dot product, which has a fraction of einsum's call overhead.
+    """
+
+    arr = np.asarray(arr)
+    if arr.ndim == 1 and out is None:
+        return np.sqrt(arr @ arr)
+    squares = np.einsum("...i,...i->...", arr, arr, out=out)
+    return np.sqrt(squares, out=squares if out is not None else None)
+
+
+def pol_to_cart_arr(r, incl, azim, out=None):
+    """
+    Converts spherical coordinates (inclination and azimuth in degrees) to Cartesian ones.
+
+    Parameters:
+    r, incl, azim (np.ndarray): Broadcastable arrays of radii, inclinations and azimuths.
+    out (np.ndarray, optional): A (..., 3) array to write the result to.
+
+    Returns:
+    np.ndarray: The (..., 3) points.
+    """
+
+    incl, azim = np.radians(incl), np.radians(azim)
+    r, incl, azim = np.broadcast_arrays(r, incl, azim)
+    out = np.empty(r.shape + (3,)) if out is None else out
+    sin_incl = np.sin(incl)
+    np.multiply(sin_incl, np.cos(azim), out=out[..., 0])
+    np.multiply(sin_incl, np.sin(azim), out=out[..., 1])
+    np.cos(incl, out=out[..., 2])
+    out *= r[..., None]
+    return out
+
+
+def cart_to_pol_arr(points, out=None):
+    """
+    Converts (..., 3) Cartesian points to spherical coordinates [r, inclination, azimuth] in degrees.
+
+    Parameters:
+    points (np.ndarray): The points.
+    out (np.ndarray, optional): A (..., 3) array to write the result to.
+
+    Returns:
+    np.ndarray: The (..., 3) spherical coordinates.
+    """
+
+    points = np.asarray(points, dtype=float)
+    out = np.empty(points.shape) if out is None else out
+    x, y, z = points[..., 0], points[..., 1], points[..., 2]
+    r = norms(points, out=out[..., 0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(z, r, out=out[..., 1])
+    np.degrees(np.arccos(out[..., 1], out=out[..., 1]), out=out[..., 1])
+    np.degrees(np.arctan2(y, x, out=out[..., 2]), out=out[..., 2])
+    return out
+
+
+def is_scalar(*args) -> bool:
+    """
+    Whether every argument is a real Python or NumPy scalar of any precision, which the scalar helpers below handle
+    with the math module instead of building arrays.
+    """
+
+    return all(isinstance(arg, SCALAR_TYPES) for arg in args)
+
 
 def distance(*args):
-    return np.sqrt(sum(arg**2 for arg in args))
+    if is_scalar(*args):
+        return math.hypot(*args)
+    return norms(np.stack(np.broadcast_arrays(*args), axis=-1))
 
 
 def pol_to_cart(r, incl, azim):
-    x = r * np.sin(np.radians(incl)) * np.cos(np.radians(azim))
-    y = r * np.sin(np.radians(incl)) * np.sin(np.radians(azim))
-    z = r * np.cos(np.radians(incl))
+    if is_scalar(r, incl, azim):
+        incl, azim = math.radians(incl), math.radians(azim)
+        return (
+            r * math.sin(incl) * math.cos(azim),
+            r * math.sin(incl) * math.sin(azim),
+            r * math.cos(incl),
+        )
+    x, y, z = np.moveaxis(pol_to_cart_arr(r, incl, azim), -1, 0)
     return x, y, z
 
 
 def cart_to_pol(x, y, z):
-    r = np.sqrt(x**2 + y**2 + z**2)
-    incl = np.degrees(np.arccos(z / r))
-    azim = np.degrees(np.arctan2(y, x))
-    return [r, incl, azim]
+    if is_scalar(x, y, z):
+        r = math.sqrt(x * x + y * y + z * z)
+        if r:
+            return [
+                r,
+                math.degrees(math.acos(max(-1.0, min(1.0, z / r)))),
+                math.degrees(math.atan2(y, x)),
+            ]
+    return list(
+        np.moveaxis(cart_to_pol_arr(np.stack(np.broadcast_arrays(x, y, z), -1)), -1, 0)
+    )
 
 
 def flatten(*args):
@@ -27,3 +120,151 @@ def flatten(*args):
         else:
             result.append(arg)
     return result
+
+
+def precision(dtype=None) -> np.dtype:
+    """
+    Resolves the dtype of point, ray and sample arrays: the given one, checked, or the current setting if None.
+    """
+
+    if dtype is None:
+        return PRECISION_SETTING["dtype"]
+    dtype = np.dtype(dtype)
+    if dtype not in PRECISIONS:
+        raise ValueError(f"precision must be float32 or float64, got {dtype}")
+    return dtype
+
+
+def set_precision(dtype) -> None:
+    """
+    Sets the dtype of the large per ray and per sample arrays: ray ends and directions, mesh samples and the samples
+    traced into SubSpace cells. float32 halves their memory and bandwidth and is ample at millimetre scale.
+
+    Camera bases, intrinsics and other per camera quantities are always built in float64, and per ray quantities are
+    cast only once computed, so the reduced precision only applies to the stored values.
+    """
+
+    PRECISION_SETTING["dtype"] = precision(dtype)
+
+
+@contextmanager
+def using_precision(dtype):
+    """
+    Sets the precision for the duration of a with block.
+    """
+
+    previous = precision()
+    set_precision(dtype)
+    try:
+        yield
+    finally:
+        set_precision(previous)
+
+
+def pixel_grid(pixel_width, pixel_height):
+    w, h = np.meshgrid(np.arange(pixel_width), np.arange(pixel_height), indexing="ij")
+    return np.column_stack((w.ravel(), h.ravel())).astype(float)
+
+
+def pinhole_from_corners(a, b, d, source):
+    """
+    Derives the pinhole geometry of one or many sensors from their corners.
+
+    The camera frame follows the usual computer vision convention: x points along a -> b (right),
+    y along a -> d (down) and z from the source to the sensor centre (forward).
+
+    Parameters:
+    a, b, d (np.ndarray): Sensor corners with shape (..., 3).
+    source (np.ndarray): Camera centres with shape (..., 3).
+
+    Returns:
+    tuple: Rotations (..., 3, 3), translations (..., 3), focal distances, sensor widths and sensor heights (...,),
+    all in world units.
+    """
+
+    right, down = b - a, d - a
+    forward = (b + d) / 2 - source
+    width = np.linalg.norm(right, axis=-1)
+    height = np.linalg.norm(down, axis=-1)
+    focal = np.linalg.norm(forward, axis=-1)
+    rotation = np.stack(
+        (
+            right / width[..., None],
+            down / height[..., None],
+            forward / focal[..., None],
+        ),
+        axis=-2,
+    )
+    translation = -np.einsum("...ij,...j->...i", rotation, source)
+    return rotation, translation, focal, width, height
+
+
+def intrinsic_matrix(focal, width, height, pixel_width, pixel_height):
+    """
+    Builds K matrices for sensors sampled on a pixel_width x pixel_height grid.
+
+    Pixel centres span the sensor corner to corner, so pixel (0, 0) sits on corner a and
+    (pixel_width - 1, pixel_height - 1) on corner c, matching Square.to_pixel_array.
+    """
+
+    steps_w, steps_h = max(pixel_width - 1, 1), max(pixel_height - 1, 1)
+    focal = np.asarray(focal, dtype=float)
+    k = np.zeros(focal.shape + (3, 3))
+    k[..., 0, 0] = steps_w * focal / width
+    k[..., 1, 1] = steps_h * focal / height
+    k[..., 0, 2] = steps_w / 2
+    k[..., 1, 2] = steps_h / 2
+    k[..., 2, 2] = 1
+    return k
+
+
+def world_to_camera(points, rotation, translation):
+    return points @ np.swapaxes(rotation, -1, -2) + translation[..., None, :]
+
+
+def camera_to_world(points, rotation, translation):
+    return (points - translation[..., None, :]) @ rotation
+
+
+def camera_to_pixel(points, intrinsics):
+    homogeneous = points @ np.swapaxes(intrinsics, -1, -2)
+    return homogeneous[..., :2] / homogeneous[..., 2:]
+
+
+def pixel_to_camera(pixels, intrinsics, depth=1.0):
+    homogeneous = np.concatenate((pixels, np.ones(pixels.shape[:-1] + (1,))), axis=-1)
+    rays = homogeneous @ np.swapaxes(np.linalg.inv(intrinsics), -1, -2)
+    return rays * np.asarray(depth)[..., None]
+
+
+def plane_line_intersection(normals, offsets, origins, directions, paired=False):
+    """
+    Intersects lines with planes n . x + offset = 0.
+
+    Parameters:
+    normals (np.ndarray): The (N, 3) plane normals.
+    offsets (np.ndarray): The (N,) plane offsets, d in a*x + b*y + c*z + d = 0.
+    origins, directions (np.ndarray): Points on the lines and their directions, with shape (..., 3).
+    paired (bool): If True, line i is only intersected with plane i and the lines' leading shape must broadcast
+    with (N,), otherwise every line is intersected with every plane.
+
+    Returns:
+    tuple: The intersection points (..., N, 3) or (..., 3) if paired, and the line parameters t of each, with
+    point = origin + t * direction. Both are NaN where a line is parallel to its plane.
+    """
+
+    origins, directions = np.asarray(origins), np.asarray(directions)
+    if paired:
+        facing = np.einsum("...i,...i->...", directions, normals)
+        height = np.einsum("...i,...i->...", origins, normals) + offsets
+    else:
+        facing = directions @ normals.T
+        height = origins @ normals.T + offsets
+    parallel = np.abs(facing) <= 1e-12 * np.linalg.norm(
+        normals, axis=-1
+    ) * np.linalg.norm(directions, axis=-1, keepdims=not paired)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(parallel, np.nan, -height / facing)
+    if paired:
+        return origins + t[..., None] * directions, t
+    return origins[..., None, :] + t[..., None] * directions[..., None, :], t